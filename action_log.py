@@ -0,0 +1,100 @@
+"""
+כתיבת לוג פעולות ברקע: תור בזיכרון + flusher שכותב ב-insert_many
+"""
+import asyncio
+import logging
+from typing import List, Optional
+
+import config
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+# סימן עצירה בתור: ה-flusher כותב את מה שאסף ויוצא
+_STOP = object()
+
+
+class ActionLogWriter:
+    def __init__(
+        self,
+        database=db,
+        batch_size: int = None,
+        flush_interval: float = None,
+        max_queue: int = None,
+    ):
+        self.db = database
+        self.batch_size = batch_size or config.ACTION_LOG_BATCH_SIZE
+        self.flush_interval = config.ACTION_LOG_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue or config.ACTION_LOG_MAX_QUEUE)
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+
+    def log(self, service_id: str, action: str, user_id: int, success: bool, message: str = None):
+        """הוספת לוג לתור - לא ממתין למסד (הכתיבה קורית ברקע)"""
+        try:
+            self._queue.put_nowait(Database._action_log(service_id, action, user_id, success, message))
+        except asyncio.QueueFull:
+            # המסד לא עומד בקצב - עדיף לאבד לוג מאשר לעכב את המשתמש
+            self.dropped += 1
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """עצירת ה-flusher וכתיבת מה שנשאר בתור"""
+        if self._task is not None:
+            if not self._task.done():
+                # בלי cancel - batch שכבר נלקח מהתור (נאסף או נכתב) לא הולך לאיבוד
+                await self._queue.put(_STOP)
+                await self._task
+            self._task = None
+        while not self._queue.empty():
+            await self._write(self._drain(self.batch_size))
+
+    def _drain(self, limit: int) -> List[dict]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stopping = False
+            # אוספים עוד לוגים עד batch_size או עד שעובר flush_interval
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+            if stopping:
+                return
+
+    async def _write(self, batch: List[dict]):
+        if not batch:
+            return
+        try:
+            await self.db.log_actions(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.error("❌ שגיאה בכתיבת %s לוגים: %s", len(batch), e)
+
+
+# אובייקט גלובלי
+action_logger = ActionLogWriter()
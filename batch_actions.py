@@ -0,0 +1,153 @@
+"""
+ביצוע השעה/המשך לכל השירותים במקביל, עם דיווח התקדמות מווסת
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import config
+from action_log import action_logger
+from callback_guard import callback_guard
+from database import db
+from render_api import render_api
+from resilience import AccountLimiter
+from status_cache import status_cache
+from structured_logging import bind
+
+logger = logging.getLogger(__name__)
+
+# action -> (הסטטוס שבו הפעולה רלוונטית, הסטטוס אחרי הצלחה)
+ACTIONS = {
+    "suspend": ("active", "suspended"),
+    "resume": ("suspended", "active"),
+}
+
+ProgressCallback = Callable[[int, int], Awaitable[Any]]
+
+
+@dataclass
+class BatchResult:
+    """סיכום פעולה מרובה; services מכילים את הסטטוס אחרי הפעולה"""
+    action: str
+    services: List[Dict[str, Any]]
+    attempted: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    failed_ids: List[str] = field(default_factory=list)
+
+    @property
+    def done(self) -> int:
+        return self.succeeded + self.failed
+
+
+class BatchActionExecutor:
+    def __init__(
+        self,
+        api=render_api,
+        database=db,
+        cache=status_cache,
+        log_writer=action_logger,
+        guard=callback_guard,
+        concurrency: int = None,
+        progress_interval: float = None,
+    ):
+        self.api = api
+        self.db = database
+        self.cache = cache
+        self.log_writer = log_writer
+        # נעילה לכל שירות, משותפת עם הפעולות הבודדות מהתפריט
+        self.guard = guard
+        self.concurrency = concurrency or config.BATCH_ACTION_CONCURRENCY
+        self.progress_interval = (
+            config.BATCH_PROGRESS_INTERVAL if progress_interval is None else progress_interval
+        )
+
+    async def _call(self, action: str, service: Dict[str, Any]) -> bool:
+        service_id, account = service["service_id"], self.api.account_of(service)
+        if action == "suspend":
+            return await self.api.suspend_service(service_id, account=account)
+        return await self.api.resume_service(service_id, account=account)
+
+    async def _report_progress(self, result: BatchResult, on_progress: ProgressCallback, finished: asyncio.Event):
+        """
+        עריכת הודעת ההתקדמות לכל היותר פעם ב-progress_interval שניות,
+        ורק כשהמספר השתנה (טלגרם מגביל עריכות ודוחה עריכה זהה).
+        """
+        last_reported = -1
+        while not finished.is_set():
+            try:
+                await asyncio.wait_for(finished.wait(), timeout=self.progress_interval)
+            except asyncio.TimeoutError:
+                pass
+            if finished.is_set():
+                return
+            if result.done != last_reported:
+                last_reported = result.done
+                try:
+                    await on_progress(result.done, result.attempted)
+                except Exception as e:
+                    logger.warning("⚠️ שגיאה בעדכון התקדמות: %s", e)
+
+    async def run(
+        self,
+        services: List[Dict[str, Any]],
+        action: str,
+        user_id: int,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> BatchResult:
+        """
+        הרצת action על כל השירותים שבסטטוס הרלוונטי.
+        הסטטוס הנוכחי נלקח מ-service["status"] (רצוי לרענן לפני כן).
+        המקביליות מוגבלת לכל חשבון Render בנפרד, כך שחשבונות רצים במקביל.
+        """
+        required_status, new_status = ACTIONS[action]
+        result = BatchResult(action=action, services=services)
+
+        targets = [s for s in services if s.get("status") == required_status]
+        result.skipped = len(services) - len(targets)
+        result.attempted = len(targets)
+
+        limiter = AccountLimiter(self.concurrency)
+        new_statuses = {}
+
+        async def run_one(service):
+            service_id = service["service_id"]
+            # כל run_one רץ במשימה משלו (gather), כך שההקשר לא דולף לשירותים אחרים
+            bind(service_id=service_id)
+            async with limiter(self.api.account_of(service)), self.guard.for_service(service_id):
+                try:
+                    success = await self._call(action, service)
+                except Exception as e:
+                    logger.exception("❌ שגיאה ב-%s: %s", action, e)
+                    success = False
+            self.cache.invalidate(service_id)
+            if success:
+                result.succeeded += 1
+                service["status"] = new_status
+                new_statuses[service_id] = new_status
+                self.log_writer.log(service_id, action, user_id, True)
+            else:
+                result.failed += 1
+                result.failed_ids.append(service_id)
+                self.log_writer.log(service_id, action, user_id, False, "API request failed")
+
+        finished = asyncio.Event()
+        reporter = None
+        if on_progress and targets:
+            reporter = asyncio.create_task(self._report_progress(result, on_progress, finished))
+        try:
+            await asyncio.gather(*(run_one(s) for s in targets))
+        finally:
+            finished.set()
+            if reporter:
+                await reporter
+
+        # מעבר שהמשתמש ביצע בעצמו - בלי התראה
+        await self.db.bulk_update_statuses(new_statuses, previous={sid: required_status for sid in new_statuses})
+        return result
+
+
+# אובייקט גלובלי
+batch_executor = BatchActionExecutor()
@@ -0,0 +1,226 @@
+"""
+בנצ'מרק לנתיבים החמים של הבוט: מסך /manage, פקודת /refresh ו"השעה הכל"/"המשך הכל".
+
+ה-handlers האמיתיים מ-bot.py רצים עם עדכוני טלגרם סינתטיים, מול FakeRender
+(השהייה, 5xx ו-429 לפי בחירה) ו-MongoDB מדומה בזיכרון. לכל כמות שירותים
+מודפסים p50/p95/p99, תפוקה, ומספר הבקשות ל-Render, פעולות המסד וקריאות
+לטלגרם לכל פעולה.
+
+הרצה:
+    python -m benchmarks.bench_hot_paths --services 10 100 1000 --latency-ms 20
+    python -m benchmarks.bench_hot_paths --error-rate 0.05 --throttle-rate 0.02 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+os.environ.setdefault("RENDER_API_KEY", "bench")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+# כל משתמש הוא אדמין, ניסיונות חוזרים מהירים ובלי מגבלת הקצב של RenderAPI
+os.environ.setdefault("ADMIN_USER_ID", "")
+os.environ.setdefault("RENDER_RETRY_BASE_DELAY", "0.05")
+os.environ.setdefault("RENDER_RETRY_MAX_DELAY", "0.5")
+os.environ.setdefault("RENDER_RATE_LIMIT_PER_MINUTE", "0")
+os.environ.setdefault("BATCH_PROGRESS_INTERVAL", "0.5")
+# כל איטרציה היא לחיצה "חדשה" - בלי debounce של לחיצות כפולות
+os.environ.setdefault("CALLBACK_DEBOUNCE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from action_log import action_logger  # noqa: E402
+from benchmarks.fake_mongo import FakeDB  # noqa: E402
+from benchmarks.fake_render import FakeRender  # noqa: E402
+from database import db  # noqa: E402
+from render_api import render_api  # noqa: E402
+from status_cache import status_cache  # noqa: E402
+
+# לוג לכל בקשת HTTP מעוות את הזמנים
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+OWNER_ID = 1
+
+SCENARIOS = ("manage", "refresh", "batch")
+
+
+# ---- עדכוני טלגרם סינתטיים ----
+
+class _Telegram:
+    """סופר את הקריאות ל-API של טלגרם (שליחה/עריכה) במקום לשלוח אותן"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def call(self, *args, **kwargs):
+        self.calls += 1
+
+
+class _User:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class _Message:
+    def __init__(self, telegram: _Telegram):
+        self.reply_text = telegram.call
+
+
+class _CallbackQuery:
+    def __init__(self, telegram: _Telegram, data: str):
+        self.data = data
+        self.from_user = _User(OWNER_ID)
+        self.answer = telegram.call
+        self.edit_message_text = telegram.call
+
+
+class _Update:
+    def __init__(self, telegram: _Telegram, data: str = None):
+        self.effective_user = _User(OWNER_ID)
+        self.message = _Message(telegram)
+        self.callback_query = _CallbackQuery(telegram, data) if data else None
+
+
+# ---- מדידה ----
+
+def _percentile(sorted_values, q: float) -> float:
+    """אחוזון בשיטת nearest-rank"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def _seed(fake: FakeRender, database: FakeDB):
+    database.services.docs = [
+        {"service_id": sid, "name": service["name"], "owners": [OWNER_ID], "status": "active"}
+        for sid, service in fake.services.items()
+    ]
+
+
+def _operation(scenario: str, telegram: _Telegram, iteration: int):
+    if scenario == "manage":
+        return bot._render_manage_view(OWNER_ID)
+    if scenario == "refresh":
+        return bot.refresh_command(_Update(telegram), None)
+    # לסירוגין השעה/המשך, כך שכל ריצה באמת מבצעת פעולות
+    data = "suspend_all" if iteration % 2 == 0 else "resume_all"
+    return bot.button_callback(_Update(telegram, data), None)
+
+
+async def _measure(scenario: str, iterations: int, concurrency: int, fake: FakeRender, database: FakeDB, warm: bool):
+    telegram = _Telegram()
+    fake.reset_counts()
+    database.reset_counts()
+    # פעולה מרובה על אותם שירותים במקביל לא משקפת שימוש אמיתי
+    concurrency = 1 if scenario == "batch" else concurrency
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(iteration):
+        async with semaphore:
+            if not warm:
+                status_cache.clear()
+            started = time.perf_counter()
+            await _operation(scenario, telegram, iteration)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(iterations)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "iterations": iterations,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "throughput": iterations / elapsed if elapsed else 0.0,
+        "render_requests": fake.counts["requests"] / iterations,
+        "render_429": fake.counts["429"],
+        "render_503": fake.counts["503"],
+        "mongo_ops": database.ops / iterations,
+        "telegram_calls": telegram.calls / iterations,
+    }
+
+
+async def _run_size(args, services: int):
+    fake = FakeRender(
+        services=services,
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=0.2,
+        seed=1,
+    )
+    results = []
+    async with fake:
+        database = FakeDB(latency_ms=args.mongo_latency_ms)
+        await _seed(fake, database)
+        db.db = database
+        db.owners_migrated = True
+        status_cache.clear()
+
+        await render_api.close()
+        for api in render_api.accounts.values():
+            api.base_url = fake.base_url
+        await render_api.start()
+        action_logger.start()
+        try:
+            for scenario in args.scenarios:
+                result = await _measure(scenario, args.iterations, args.concurrency, fake, database, args.warm)
+                result["services"] = services
+                results.append(result)
+        finally:
+            await action_logger.stop()
+            await render_api.close()
+    return results
+
+
+def _print(results):
+    header = (
+        f"{'services':>8} {'scenario':<8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>8} "
+        f"{'render/op':>10} {'mongo/op':>9} {'tg/op':>6} {'429':>5} {'503':>5}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['services']:>8} {r['scenario']:<8} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} "
+            f"{r['throughput']:>8.1f} {r['render_requests']:>10.1f} {r['mongo_ops']:>9.1f} "
+            f"{r['telegram_calls']:>6.1f} {r['render_429']:>5} {r['render_503']:>5}"
+        )
+
+
+async def _run(args):
+    results = []
+    for services in args.services:
+        results.extend(await _run_size(args, services))
+    _print(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="פעולות מקבילות (manage/refresh)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="השהייה של FakeRender")
+    parser.add_argument("--mongo-latency-ms", type=float, default=1.0, help="round trip מדומה למונגו")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--warm", action="store_true", help="בלי לנקות את מטמון הסטטוסים בין ריצות")
+    parser.add_argument("--json", help="שמירת התוצאות לקובץ JSON (להשוואה בין גרסאות)")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+בנצ'מרק: client משותף (keep-alive) מול AsyncClient חדש לכל בקשה.
+
+מריץ שרת stub מקומי שמחקה את GET /services/{id} של Render וסופר כמה
+חיבורי TCP נפתחו. אפשר לדמות עלות handshake (TLS) עם --handshake-ms.
+
+הרצה:
+    python -m benchmarks.bench_http_pool --services 60 --rounds 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# config.py דורש משתני סביבה - ערכי דמה לבנצ'מרק בלבד
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+os.environ.setdefault("RENDER_API_KEY", "bench")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+# מודדים את החיבורים עצמם, בלי מגבלת הקצב של RenderAPI
+os.environ.setdefault("RENDER_RATE_LIMIT_PER_MINUTE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from render_api import RenderAPI  # noqa: E402
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handshake_delay: float):
+        super().__init__(address, _StubHandler)
+        self.handshake_delay = handshake_delay
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.connections = 0
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # נדרש ל-keep-alive
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+        if self.server.handshake_delay:
+            time.sleep(self.server.handshake_delay)
+
+    def do_GET(self):  # noqa: N802
+        service_id = self.path.rstrip("/").rsplit("/", 1)[-1]
+        body = json.dumps({"id": service_id, "suspended": "not_suspended"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002
+        return
+
+
+async def _per_call_client(base_url: str, service_ids):
+    """ההתנהגות הישנה: AsyncClient חדש לכל בקשה"""
+    for service_id in service_ids:
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            response = await client.get(f"{base_url}/services/{service_id}")
+            response.json()
+
+
+async def _pooled_client(api: RenderAPI, service_ids):
+    for service_id in service_ids:
+        await api.get_service_status(service_id)
+
+
+async def _run(args):
+    server = _StubServer(("127.0.0.1", 0), args.handshake_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    service_ids = [f"srv-{i:04d}" for i in range(args.services)]
+
+    results = {}
+
+    timings = []
+    server.reset()
+    for _ in range(args.rounds):
+        started = time.perf_counter()
+        await _per_call_client(base_url, service_ids)
+        timings.append(time.perf_counter() - started)
+    results["per-call client"] = (timings, server.connections)
+
+    api = RenderAPI(base_url=base_url, api_key="bench")
+    await api.start()
+    timings = []
+    server.reset()
+    try:
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            await _pooled_client(api, service_ids)
+            timings.append(time.perf_counter() - started)
+    finally:
+        await api.close()
+    results["pooled client"] = (timings, server.connections)
+
+    server.shutdown()
+
+    print(f"services={args.services} rounds={args.rounds} handshake={args.handshake_ms}ms")
+    for name, (timings, connections) in results.items():
+        per_request = statistics.median(timings) / args.services * 1000
+        print(
+            f"{name:>16}: median sweep {statistics.median(timings) * 1000:8.1f}ms "
+            f"| {per_request:6.2f}ms/request | TCP connections: {connections}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=60)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--handshake-ms", type=float, default=0.0,
+                        help="השהייה מדומה לכל חיבור חדש (מחקה TLS handshake)")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
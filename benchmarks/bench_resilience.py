@@ -0,0 +1,111 @@
+"""
+בנצ'מרק: התנהגות RenderAPI מול Render עמוס (429/5xx) ומול Render שנפל.
+
+מריץ FakeRender מקומי עם הזרקת תקלות ובודק כמה סטטוסים חזרו נכון,
+כמה בקשות נשלחו בסך הכל, ושה-circuit breaker נכשל מהר כשהשרת לא זמין.
+
+הרצה:
+    python -m benchmarks.bench_resilience --services 100 --error-rate 0.2 --throttle-rate 0.1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+os.environ.setdefault("RENDER_API_KEY", "bench")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+# ניסיונות חוזרים מהירים כדי שהבנצ'מרק לא ימשך דקות
+os.environ.setdefault("RENDER_RETRY_BASE_DELAY", "0.05")
+os.environ.setdefault("RENDER_RETRY_MAX_DELAY", "0.5")
+os.environ.setdefault("RENDER_BREAKER_COOLDOWN", "5")
+os.environ.setdefault("RENDER_RATE_LIMIT_PER_MINUTE", "6000")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_render import FakeRender  # noqa: E402
+from render_api import RenderAPI, RenderUnavailable  # noqa: E402
+
+
+async def _sweep(api: RenderAPI, service_ids, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes = {"ok": 0, "unknown": 0, "unavailable": 0}
+
+    async def one(service_id):
+        async with semaphore:
+            try:
+                status = await api.get_service_status(service_id)
+            except RenderUnavailable:
+                outcomes["unavailable"] += 1
+                return
+            outcomes["ok" if status != "unknown" else "unknown"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(sid) for sid in service_ids))
+    return outcomes, time.perf_counter() - started
+
+
+async def _run(args):
+    fake = FakeRender(
+        services=args.services,
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=0.2,
+        seed=1,
+    )
+    async with fake:
+        api = RenderAPI(base_url=fake.base_url, api_key="bench")
+        await api.start()
+        try:
+            service_ids = sorted(fake.services)
+
+            outcomes, elapsed = await _sweep(api, service_ids, args.concurrency)
+            print(
+                f"degraded Render (5xx={args.error_rate:.0%}, 429={args.throttle_rate:.0%}): "
+                f"{outcomes} in {elapsed * 1000:.0f}ms | HTTP requests: {fake.counts['requests']} "
+                f"(429: {fake.counts['429']}, 503: {fake.counts['503']})"
+            )
+
+            # Render "נופל" לגמרי: ה-breaker אמור להיפתח ולחסוך בקשות
+            fake.error_rate, fake.throttle_rate = 1.0, 0.0
+            fake.reset_counts()
+            outcomes, elapsed = await _sweep(api, service_ids, args.concurrency)
+            breaker = api.breaker("GET", "/services/srv-00000")
+            print(
+                f"Render down: {outcomes} in {elapsed * 1000:.0f}ms | HTTP requests: {fake.counts['requests']} "
+                f"| breaker: {breaker.state}"
+            )
+
+            # ניסיון half_open שנגמר ב-429 או בוטל לא משאיר את ה-breaker תקוע
+            fake.error_rate, fake.throttle_rate = 0.0, 1.0
+            breaker._opened_at -= breaker.cooldown
+            try:
+                await api.get_service_status(service_ids[0])
+            except RenderUnavailable:
+                pass
+            fake.throttle_rate = 0.0
+            latency, fake.latency = fake.latency, 1.0
+            try:
+                await asyncio.wait_for(api.get_service_status(service_ids[0]), timeout=0.05)
+            except asyncio.TimeoutError:
+                pass
+            fake.latency = latency
+            outcomes, elapsed = await _sweep(api, service_ids[:2], 1)
+            print(f"after throttled/cancelled trial: {outcomes} | breaker: {breaker.state}")
+        finally:
+            await api.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--throttle-rate", type=float, default=0.1)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
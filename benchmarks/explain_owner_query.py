@@ -0,0 +1,73 @@
+"""
+בדיקת תוכנית הביצוע של שאילתת /manage מול ה-MongoDB שמוגדר ב-MONGO_URI.
+
+אחרי מיגרציית owners, השאילתה owners=X ממוינת לפי (name, service_id)
+צריכה להיות סריקת אינדקס אחת (owners_name_service_id) בלי $or ובלי
+שלב SORT בזיכרון. הסקריפט מריץ את המיגרציות, מדפיס את התוכנית ונכשל
+(exit 1) אם היא לא כזו.
+
+הרצה:
+    python -m benchmarks.explain_owner_query --owner-id 123456789
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db  # noqa: E402
+
+INDEX_NAME = "owners_name_service_id"
+
+
+def _stages(plan: dict):
+    """כל השלבים בעץ התוכנית (stage, inputStage/inputStages)"""
+    yield plan
+    if "inputStage" in plan:
+        yield from _stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+async def _run(args) -> bool:
+    await db.connect()
+    try:
+        if not db.owners_migrated:
+            print("❌ מיגרציית owners לא הוחלה - השאילתה עדיין משתמשת ב-$or")
+            return False
+
+        explain = await db.explain_services_page(args.owner_id)
+        winning = explain["queryPlanner"]["winningPlan"]
+        # ב-SBE התוכנית עטופה ב-queryPlan
+        winning = winning.get("queryPlan", winning)
+        stages = list(_stages(winning))
+        names = [stage["stage"] for stage in stages]
+        print("stages:", " <- ".join(names))
+
+        scans = [stage for stage in stages if stage["stage"] == "IXSCAN"]
+        ok = True
+        if len(scans) != 1 or scans[0].get("indexName") != INDEX_NAME:
+            print(f"❌ ציפינו לסריקה אחת של {INDEX_NAME}, התקבל: {[s.get('indexName') for s in scans]}")
+            ok = False
+        if "SORT" in names:
+            print("❌ יש שלב SORT בזיכרון - האינדקס לא משרת את המיון")
+            ok = False
+        if "COLLSCAN" in names:
+            print("❌ סריקת אוסף מלאה")
+            ok = False
+        if ok:
+            print("✅ סריקת אינדקס אחת, בלי מיון בזיכרון")
+        return ok
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--owner-id", type=int, required=True)
+    sys.exit(0 if asyncio.run(_run(parser.parse_args())) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+MongoDB מדומה בזיכרון לבנצ'מרקים: רק החלק של ה-API האסינכרוני של pymongo
+שהבוט משתמש בו (find/sort/limit, update עם pipeline, bulk_write, אינדקסים...).
+
+אינדקסים לא נאכפים (חוץ מ-_id ייחודי) וכל שאילתה היא סריקה מלאה, כך שהמספרים
+מודדים את הקוד של הבוט ואת מספר הפעולות, לא את ביצועי מונגו. latency_ms מדמה
+round trip לשרת.
+"""
+import asyncio
+import copy
+import datetime
+import itertools
+from types import SimpleNamespace
+
+from pymongo.errors import DuplicateKeyError
+
+_ids = itertools.count(1)
+
+
+def _get(doc, path):
+    cur = doc
+    for part in path.split("."):
+        if isinstance(cur, dict) and part in cur:
+            cur = cur[part]
+        else:
+            return _MISSING
+    return cur
+
+
+class _Missing:
+    pass
+
+
+_MISSING = _Missing()
+
+
+_COMPARE = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+
+def _cmp_values(value, cond_value, op):
+    values = value if isinstance(value, list) else [value]
+    for v in values:
+        if v is _MISSING or v is None:
+            continue
+        try:
+            if _COMPARE[op](v, cond_value):
+                return True
+        except TypeError:
+            continue
+    return False
+
+
+def _match_cond(value, cond):
+    if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+        for op, arg in cond.items():
+            if op == "$exists":
+                if (value is not _MISSING) != bool(arg):
+                    return False
+            elif op == "$ne":
+                if _match_cond(value, arg):
+                    return False
+            elif op == "$in":
+                if not any(_match_cond(value, a) for a in arg):
+                    return False
+            elif op == "$nin":
+                if any(_match_cond(value, a) for a in arg):
+                    return False
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if not _cmp_values(value, arg, op):
+                    return False
+            else:
+                raise NotImplementedError(op)
+        return True
+    if isinstance(value, list) and not isinstance(cond, list):
+        return cond in value
+    if value is _MISSING:
+        return cond is None
+    return value == cond
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in cond):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in cond):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, q) for q in cond):
+                return False
+        else:
+            if not _match_cond(_get(doc, key), cond):
+                return False
+    return True
+
+
+def project(doc, projection):
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        out = {k: doc[k] for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    for k, v in projection.items():
+        if not v:
+            doc.pop(k, None)
+    return doc
+
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    for p in parts[:-1]:
+        doc = doc.setdefault(p, {})
+    doc[parts[-1]] = value
+
+
+def apply_update(doc, update, inserting=False):
+    if isinstance(update, list):
+        for stage in update:
+            for k, v in stage.get("$set", {}).items():
+                if isinstance(v, list):
+                    v = [_get(doc, x[1:]) if isinstance(x, str) and x.startswith("$") else x for x in v]
+                elif isinstance(v, str) and v.startswith("$"):
+                    v = _get(doc, v[1:])
+                _set_path(doc, k, v)
+        return
+    for op, fields in update.items():
+        if op == "$set":
+            for k, v in fields.items():
+                _set_path(doc, k, copy.deepcopy(v))
+        elif op == "$setOnInsert":
+            if inserting:
+                for k, v in fields.items():
+                    _set_path(doc, k, copy.deepcopy(v))
+        elif op == "$unset":
+            for k in fields:
+                doc.pop(k, None)
+        elif op == "$inc":
+            for k, v in fields.items():
+                doc[k] = doc.get(k, 0) + v
+        elif op == "$addToSet":
+            for k, v in fields.items():
+                arr = doc.setdefault(k, [])
+                items = v["$each"] if isinstance(v, dict) and "$each" in v else [v]
+                for item in items:
+                    if item not in arr:
+                        arr.append(item)
+        elif op == "$pull":
+            for k, v in fields.items():
+                doc[k] = [x for x in doc.get(k, []) if x != v]
+        elif op == "$max":
+            for k, v in fields.items():
+                if k not in doc or doc[k] is None or v > doc[k]:
+                    doc[k] = v
+        elif op == "$currentDate":
+            for k in fields:
+                doc[k] = datetime.datetime.now(datetime.timezone.utc)
+        else:
+            raise NotImplementedError(op)
+
+
+def _sort_key(value):
+    # שדות חסרים ממוינים ראשונים, כמו null במונגו
+    if value is _MISSING or value is None:
+        return (0, 0)
+    return (1, value)
+
+
+class FakeCursor:
+    def __init__(self, docs, projection, collection):
+        self._docs = docs
+        self._projection = projection
+        self._collection = collection
+        self._sort = None
+        self._limit = 0
+        self._iter = None
+
+    def sort(self, key, direction=None):
+        self._sort = [(key, direction)] if isinstance(key, str) else list(key)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def _results(self):
+        docs = list(self._docs)
+        if self._sort:
+            # מיון יציב לפי המפתחות מהאחרון לראשון = מיון לפי כל המפתחות
+            for field, direction in reversed(self._sort):
+                docs.sort(key=lambda d: _sort_key(_get(d, field)), reverse=direction == -1)
+        if self._limit:
+            docs = docs[: self._limit]
+        return [project(d, self._projection) for d in docs]
+
+    async def to_list(self, length=None):
+        await self._collection._round_trip()
+        res = self._results()
+        return res[:length] if length else res
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._iter is None:
+            await self._collection._round_trip()
+            self._iter = iter(self._results())
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, name, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.docs = []
+        self.ops = 0
+        self.indexes = []
+
+    async def _round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def create_index(self, keys, **kwargs):
+        self.ops += 1
+        await self._round_trip()
+        self.indexes.append((keys, kwargs))
+        return str(keys)
+
+    async def index_information(self):
+        self.ops += 1
+        await self._round_trip()
+        return {kwargs.get("name", str(keys)): {"key": keys, **kwargs} for keys, kwargs in self.indexes}
+
+    def find(self, query=None, projection=None, **kwargs):
+        self.ops += 1
+        return FakeCursor([d for d in self.docs if matches(d, query or {})], projection, self)
+
+    async def find_one(self, query=None, projection=None, **kwargs):
+        self.ops += 1
+        await self._round_trip()
+        for d in self.docs:
+            if matches(d, query or {}):
+                return project(d, projection)
+        return None
+
+    async def drop_index(self, name):
+        self.ops += 1
+        await self._round_trip()
+
+    async def insert_one(self, doc):
+        self.ops += 1
+        await self._round_trip()
+        doc.setdefault("_id", next(_ids))
+        if any(d["_id"] == doc["_id"] for d in self.docs):
+            raise DuplicateKeyError("dup")
+        self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        self.ops += 1
+        await self._round_trip()
+        for doc in docs:
+            doc.setdefault("_id", next(_ids))
+            self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_ids=[d["_id"] for d in docs])
+
+    def _update(self, query, update, upsert=False, many=False):
+        matched = modified = 0
+        upserted_id = None
+        for d in self.docs:
+            if matches(d, query):
+                matched += 1
+                before = copy.deepcopy(d)
+                apply_update(d, update)
+                modified += before != d
+                if not many:
+                    break
+        if not matched and upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            if "_id" in doc and any(d["_id"] == doc["_id"] for d in self.docs):
+                # כמו במונגו: upsert שלא התאים למסמך קיים עם אותו _id
+                raise DuplicateKeyError("dup")
+            doc.setdefault("_id", next(_ids))
+            apply_update(doc, update, inserting=True)
+            self.docs.append(doc)
+            upserted_id = doc["_id"]
+        return SimpleNamespace(matched_count=matched, modified_count=modified, upserted_id=upserted_id)
+
+    async def update_one(self, query, update, upsert=False, **kwargs):
+        self.ops += 1
+        await self._round_trip()
+        return self._update(query, update, upsert)
+
+    async def update_many(self, query, update, upsert=False, **kwargs):
+        self.ops += 1
+        await self._round_trip()
+        return self._update(query, update, upsert, many=True)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=False, projection=None, **kwargs):
+        self.ops += 1
+        await self._round_trip()
+        for d in self.docs:
+            if matches(d, query):
+                before = copy.deepcopy(d)
+                apply_update(d, update)
+                return project(d if return_document else before, projection)
+        if upsert:
+            self._update(query, update, upsert=True)
+            return project(self.docs[-1], projection) if return_document else None
+        return None
+
+    async def bulk_write(self, requests, ordered=True):
+        self.ops += 1
+        await self._round_trip()
+        modified = upserted = 0
+        for r in requests:
+            if r.__class__.__name__ == "InsertOne":
+                doc = r._doc
+                doc.setdefault("_id", next(_ids))
+                self.docs.append(copy.deepcopy(doc))
+                continue
+            res = self._update(r._filter, r._doc, r._upsert, many=r.__class__.__name__ == "UpdateMany")
+            modified += res.modified_count
+            upserted += res.upserted_id is not None
+        return SimpleNamespace(modified_count=modified, upserted_count=upserted)
+
+    async def delete_one(self, query):
+        self.ops += 1
+        await self._round_trip()
+        for i, d in enumerate(self.docs):
+            if matches(d, query):
+                del self.docs[i]
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def delete_many(self, query):
+        self.ops += 1
+        await self._round_trip()
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not matches(d, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    async def count_documents(self, query):
+        self.ops += 1
+        await self._round_trip()
+        return sum(1 for d in self.docs if matches(d, query))
+
+
+class FakeDB:
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, self.latency)
+        return self._collections[name]
+
+    @property
+    def ops(self):
+        return sum(c.ops for c in self._collections.values())
+
+    def reset_counts(self):
+        for collection in self._collections.values():
+            collection.ops = 0
+
+    async def command(self, *args, **kwargs):
+        if args[0] == "collMod" and "index" in kwargs:
+            change = kwargs["index"]
+            for _, options in self._collections[args[1]].indexes:
+                if options.get("name") == change["name"]:
+                    options["expireAfterSeconds"] = change["expireAfterSeconds"]
+        return {"ok": 1}
@@ -0,0 +1,295 @@
+"""
+שרת Render API מדומה (aiohttp) לבנצ'מרקים ובדיקות מקומיות.
+
+תומך ב-GET /v1/services (עם cursor pagination), GET /v1/services/{id},
+GET /v1/services/{id}/deploys|events (עם updatedAfter/startTime)
+ו-POST /v1/services/{id}/suspend|resume|restart, עם השהייה, שגיאות 5xx
+ו-429 (כולל Retry-After וכותרות Ratelimit-*) לפי הגדרה.
+
+הרצה עצמאית:
+    python -m benchmarks.fake_render --port 8081 --services 100 --latency-ms 50
+    RENDER_API_BASE=http://127.0.0.1:8081/v1 python bot.py
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import random
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+
+class FakeRender:
+    def __init__(
+        self,
+        services: int = 100,
+        latency_ms: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        rate_limit: int = 0,
+        rate_window: float = 60.0,
+        retry_after: float = 1.0,
+        seed: int = None,
+    ):
+        """
+        error_rate - חלק הבקשות שיחזירו 503.
+        throttle_rate - חלק הבקשות שיחזירו 429 אקראי.
+        rate_limit - מכסת בקשות לחלון של rate_window שניות (0 = ללא מכסה).
+        """
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+        self.services = {
+            f"srv-{i:05d}": {"id": f"srv-{i:05d}", "name": f"service-{i}", "suspended": "not_suspended"}
+            for i in range(services)
+        }
+        self.deploys = defaultdict(list)
+        self.events = defaultdict(list)
+        # service_id -> בקשות HTTP לכל נקודה ב-/metrics/http-requests (ברירת מחדל 0 = רדום)
+        self.http_requests = {}
+        self._ids = itertools.count(1)
+        self.counts = Counter()
+        self._window_start = time.monotonic()
+        self._window_used = 0
+
+        self.base_url = None
+        self._runner = None
+
+    # ---- הפעלה ----
+
+    def build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._faults])
+        app.router.add_get("/v1/services", self._list)
+        app.router.add_get("/v1/services/{service_id}", self._get)
+        app.router.add_get("/v1/services/{service_id}/deploys", self._list_deploys)
+        app.router.add_get("/v1/services/{service_id}/events", self._list_events)
+        app.router.add_post("/v1/services/{service_id}/{action}", self._action)
+        app.router.add_get("/v1/metrics/{metric}", self._metrics)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/v1"
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def reset_counts(self):
+        self.counts.clear()
+
+    # ---- פריסות ואירועים ----
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="microseconds").replace("+00:00", "Z")
+
+    def add_deploy(self, service_id: str, status: str = "build_in_progress", message: str = "commit") -> dict:
+        now = self._now()
+        deploy = {
+            "id": f"dep-{next(self._ids):06d}",
+            "status": status,
+            "trigger": "new_commit",
+            "commit": {"id": f"{next(self._ids):040x}", "message": message},
+            "createdAt": now,
+            "updatedAt": now,
+            "finishedAt": None,
+        }
+        self.deploys[service_id].insert(0, deploy)
+        self.add_event(service_id, "deploy_started")
+        return deploy
+
+    def update_deploy(self, service_id: str, deploy_id: str, status: str):
+        for deploy in self.deploys[service_id]:
+            if deploy["id"] == deploy_id:
+                deploy["status"] = status
+                deploy["updatedAt"] = deploy["finishedAt"] = self._now()
+        self.add_event(service_id, "deploy_ended")
+
+    def add_event(self, service_id: str, event_type: str):
+        self.events[service_id].insert(
+            0, {"id": f"evt-{next(self._ids):06d}", "type": event_type, "timestamp": self._now(), "details": {}}
+        )
+
+    # ---- הזרקת תקלות ----
+
+    def _ratelimit_headers(self) -> dict:
+        if not self.rate_limit:
+            return {}
+        reset = max(0.0, self.rate_window - (time.monotonic() - self._window_start))
+        return {
+            "Ratelimit-Limit": str(self.rate_limit),
+            "Ratelimit-Remaining": str(max(0, self.rate_limit - self._window_used)),
+            "Ratelimit-Reset": f"{reset:.0f}",
+        }
+
+    @web.middleware
+    async def _faults(self, request: web.Request, handler):
+        self.counts["requests"] += 1
+        resource = request.match_info.route.resource
+        self.counts[f"{request.method} {resource.canonical if resource else request.path}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.rate_limit:
+            now = time.monotonic()
+            if now - self._window_start >= self.rate_window:
+                self._window_start, self._window_used = now, 0
+            if self._window_used >= self.rate_limit:
+                self.counts["429"] += 1
+                headers = self._ratelimit_headers()
+                headers["Retry-After"] = headers["Ratelimit-Reset"]
+                return web.json_response({"message": "rate limited"}, status=429, headers=headers)
+            self._window_used += 1
+
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            self.counts["429"] += 1
+            return web.json_response(
+                {"message": "rate limited"}, status=429, headers={"Retry-After": f"{self.retry_after:g}"}
+            )
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.counts["503"] += 1
+            return web.json_response({"message": "unavailable"}, status=503)
+
+        response = await handler(request)
+        response.headers.update(self._ratelimit_headers())
+        return response
+
+    # ---- endpoints ----
+
+    async def _list(self, request: web.Request) -> web.Response:
+        limit = min(100, int(request.query.get("limit", 20)))
+        ids = sorted(self.services)
+        start = 0
+        cursor = request.query.get("cursor")
+        if cursor:
+            start = ids.index(cursor) + 1 if cursor in ids else len(ids)
+        page = [{"cursor": sid, "service": self.services[sid]} for sid in ids[start:start + limit]]
+        return web.json_response(page)
+
+    async def _get(self, request: web.Request) -> web.Response:
+        service = self.services.get(request.match_info["service_id"])
+        if not service:
+            return web.json_response({"message": "not found"}, status=404)
+        return web.json_response(service)
+
+    @staticmethod
+    def _page(request: web.Request, items, key: str) -> web.Response:
+        limit = min(100, int(request.query.get("limit", 20)))
+        start = 0
+        cursor = request.query.get("cursor")
+        if cursor:
+            ids = [item["id"] for item in items]
+            start = ids.index(cursor) + 1 if cursor in ids else len(ids)
+        return web.json_response([{"cursor": item["id"], key: item} for item in items[start:start + limit]])
+
+    async def _list_deploys(self, request: web.Request) -> web.Response:
+        deploys = self.deploys.get(request.match_info["service_id"], [])
+        updated_after = request.query.get("updatedAfter")
+        if updated_after:
+            deploys = [d for d in deploys if d["updatedAt"] > updated_after]
+        return self._page(request, deploys, "deploy")
+
+    async def _list_events(self, request: web.Request) -> web.Response:
+        events = self.events.get(request.match_info["service_id"], [])
+        start_time = request.query.get("startTime")
+        if start_time:
+            events = [e for e in events if e["timestamp"] >= start_time]
+        return self._page(request, events, "event")
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        """סדרה סינתטית לכל instance (2 instances), נקודה לכל resolutionSeconds"""
+        if request.query.get("resource") not in self.services:
+            return web.json_response({"message": "not found"}, status=404)
+        start = datetime.datetime.fromisoformat(request.query["startTime"].replace("Z", "+00:00"))
+        end = datetime.datetime.fromisoformat(request.query["endTime"].replace("Z", "+00:00"))
+        step = datetime.timedelta(seconds=int(request.query.get("resolutionSeconds", 60)))
+        metric = request.match_info["metric"]
+        memory = metric == "memory"
+        if metric == "http-requests":
+            count = self.http_requests.get(request.query["resource"], 0)
+        series = []
+        for instance in range(2):
+            values, at = [], start
+            while at <= end:
+                if metric == "http-requests":
+                    value = count
+                elif memory:
+                    value = self.random.uniform(200, 400) * 1024 * 1024
+                else:
+                    value = self.random.uniform(0.01, 0.5)
+                values.append({"timestamp": at.isoformat().replace("+00:00", "Z"), "value": value})
+                at += step
+            series.append({
+                "labels": [{"field": "instance", "value": f"inst-{instance}"}],
+                "unit": {"memory": "bytes", "http-requests": "count"}.get(metric, "cpu"),
+                "values": values,
+            })
+        return web.json_response(series)
+
+    async def _action(self, request: web.Request) -> web.Response:
+        service = self.services.get(request.match_info["service_id"])
+        if not service:
+            return web.json_response({"message": "not found"}, status=404)
+        action = request.match_info["action"]
+        if action == "suspend":
+            service["suspended"] = "suspended"
+        elif action == "resume":
+            service["suspended"] = "not_suspended"
+        elif action != "restart":
+            return web.json_response({"message": "not found"}, status=404)
+        return web.Response(status=202)
+
+
+async def _serve(args):
+    fake = FakeRender(
+        services=args.services,
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        rate_limit=args.rate_limit,
+    )
+    await fake.start(args.host, args.port)
+    print(f"🧪 Fake Render API: {fake.base_url} ({args.services} services)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--services", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0, help="מכסת בקשות לדקה (0 = ללא)")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,17 @@
 """
 בוט טלגרם לניהול שירותי Render
 """
+import asyncio
+import contextlib
+import functools
+import hashlib
+import hmac
 import logging
 import os
+import signal
 import threading
 from http.server import BaseHTTPRequestHandler, HTTPServer
+from aiohttp import web
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
@@ -12,24 +19,47 @@ from telegram.ext import (
     CallbackQueryHandler,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters
 )
-from database import db
-from render_api import render_api
+from action_log import action_logger
+from batch_actions import batch_executor
+from callback_guard import callback_guard
+from coordination import leader_lease
+from database import MENU_PROJECTION, db
+from deploy_sync import deploy_state, deploy_sync, display_status
+from render_api import RenderAPIError, render_api
+from resource_metrics import WINDOWS, format_value, resource_metrics, sparkline
+from scheduler import ScheduleError, format_days, make_schedule, parse_timezone, scheduler
+from status_cache import status_cache
+from status_alerts import STATUS_HEBREW, status_alerts
+from status_poller import status_poller
+from service_index import LEGACY_PREFIXES, service_index
+from startup import startup_timer
+from status_refresh import status_refresher
+from web_server import HEALTH_PATHS, METRICS_PATH, build_web_app
 import config
+import metrics
+import structured_logging
 
-# הגדרת לוגים
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# הגדרת לוגים (JSON דרך תור, בלי כתיבה סינכרונית מתוך ה-event loop)
+structured_logging.setup_logging()
 logger = logging.getLogger(__name__)
 
 class _HealthHandler(BaseHTTPRequestHandler):
     """HTTP handler קטן ל-Render (healthcheck + פתיחת PORT)."""
 
     def do_GET(self):  # noqa: N802 (BaseHTTPRequestHandler naming)
-        if self.path in ("/", "/health", "/healthz", "/_health"):
+        if self.path == METRICS_PATH:
+            body = metrics.registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", metrics.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if self.path in HEALTH_PATHS:
             self.send_response(200)
             self.send_header("Content-Type", "text/plain; charset=utf-8")
             self.end_headers()
@@ -44,7 +74,7 @@ class _HealthHandler(BaseHTTPRequestHandler):
     def do_HEAD(self):  # noqa: N802 (BaseHTTPRequestHandler naming)
         # UptimeRobot ושירותי ניטור אחרים לפעמים עושים HEAD במקום GET.
         # אם אין do_HEAD, BaseHTTPRequestHandler יחזיר 501 Not Implemented.
-        if self.path in ("/", "/health", "/healthz", "/_health"):
+        if self.path in HEALTH_PATHS:
             self.send_response(200)
             self.send_header("Content-Type", "text/plain; charset=utf-8")
             self.end_headers()
@@ -95,6 +125,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /manage - רשימת כל השירותים
 /add_service - הוספת שירות חדש
 /refresh - רענון סטטוסים
+/history - היסטוריית פעולות של שירות
+/schedule - השעיה/המשך אוטומטיים לפי שעות
+/idle - השעיה אוטומטית של שירות רדום
+/cache_stats - נתוני מטמון הסטטוסים
 
 בחר /manage כדי להתחיל!
 """
@@ -121,35 +155,66 @@ async def manage(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(text, reply_markup=reply_markup, parse_mode="Markdown")
 
 
-async def _get_services_with_refreshed_statuses(owner_id: int):
-    """שליפת שירותים + רענון סטטוסים מול Render."""
-    services = await db.get_services(owner_id=owner_id)
-    for service in services:
-        status = await render_api.get_service_status(service["service_id"])
-        await db.update_service_status(service["service_id"], status)
-        service["status"] = status
-    return services
+async def _get_services_with_refreshed_statuses(owner_id: int, after: str = None, before: str = None):
+    """
+    שליפת עמוד שירותים + סטטוסים (מהמטמון, עם רענון ברקע לרשומות ישנות).
+    מחזיר (services, has_prev, has_next).
+    """
+    services, has_prev, has_next = await db.get_services_page(
+        owner_id=owner_id, after=after, before=before, limit=config.MANAGE_PAGE_SIZE
+    )
+    if await status_poller.check_fresh():
+        # ה-poller (כאן או ברפליקה המובילה) מעדכן את המסד ברקע - אפשר להציג את המצב השמור מיד
+        return services, has_prev, has_next
+    result = await status_refresher.refresh_cached(services)
+    if result.partial:
+        logger.warning("⏱ רענון חלקי: %s שירותים לא עודכנו בזמן", len(result.timed_out))
+    return result.services, has_prev, has_next
 
 
-async def _render_manage_view(owner_id: int):
+async def _render_manage_view(owner_id: int, after: str = None, before: str = None):
     """
-    בניית מסך /manage: רשימת שירותים ככפתורים, ומתחת כפתור השעה הכל/המשך הכל.
+    בניית מסך /manage: עמוד שירותים ככפתורים, דפדוף, ומתחת כפתור השעה הכל/המשך הכל.
     מחזיר (text, reply_markup). אם אין שירותים, reply_markup=None.
     """
-    services = await _get_services_with_refreshed_statuses(owner_id)
+    services, has_prev, has_next = await _get_services_with_refreshed_statuses(owner_id, after, before)
+    return _build_manage_view(services, has_prev, has_next)
+
+
+def _first_page(services):
+    """העמוד הראשון מתוך רשימה מלאה שכבר בזיכרון (באותו סדר של get_services_page)"""
+    ordered = sorted(services, key=lambda s: (s.get("name") or "", s["service_id"]))
+    page = ordered[:config.MANAGE_PAGE_SIZE]
+    return page, False, len(ordered) > len(page)
+
+
+def _build_manage_view(services, has_prev: bool = False, has_next: bool = False):
+    """בניית מסך /manage מרשימת שירותים שכבר יש בה סטטוסים (בלי פניה ל-Render)."""
     if not services:
         return "📭 אין שירותים רשומים.", None
 
     keyboard = []
     for service in services:
-        emoji = render_api.status_emoji(service.get("status", "unknown"))
+        emoji = render_api.status_emoji(display_status(service))
         button_text = f"{emoji} {service['name']}"
         keyboard.append(
-            [InlineKeyboardButton(button_text, callback_data=f"view_{service['service_id']}")]
+            [InlineKeyboardButton(button_text, callback_data=service_index.callback("view", service))]
         )
 
-    has_active = any(s.get("status") == "active" for s in services)
-    has_suspended = any(s.get("status") == "suspended" for s in services)
+    # דפדוף: העוגן הוא השירות הראשון/האחרון בעמוד הנוכחי
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton("◀️ הקודם", callback_data=service_index.callback("page_prev", services[0])))
+    if has_next:
+        nav.append(InlineKeyboardButton("הבא ▶️", callback_data=service_index.callback("page_next", services[-1])))
+    if nav:
+        keyboard.append(nav)
+
+    # הפעולות המרוכזות חלות על כל השירותים, לא רק על העמוד -
+    # כשיש כמה עמודים אי אפשר לדעת מהעמוד לבד אם הן רלוונטיות
+    paged = has_prev or has_next
+    has_active = paged or any(s.get("status") == "active" for s in services)
+    has_suspended = paged or any(s.get("status") == "suspended" for s in services)
 
     if has_active:
         keyboard.append([InlineKeyboardButton("⏸ השעה הכל", callback_data="suspend_all")])
@@ -183,9 +248,9 @@ async def add_service_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     service_id = context.args[0]
     service_name = " ".join(context.args[1:])
     
-    # בדיקה אם השירות קיים ב-Render
-    service_data = await render_api.get_service(service_id)
-    if not service_data:
+    # בדיקה אם השירות קיים ב-Render (בכל החשבונות במקביל)
+    found = await render_api.find_account(service_id)
+    if not found:
         await update.message.reply_text(
             f"❌ לא נמצא שירות עם המזהה `{service_id}`\n"
             "ודא שה-Service ID נכון ושיש לך הרשאות גישה.",
@@ -193,111 +258,160 @@ async def add_service_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return
     
-    # הוספה למסד נתונים
-    await db.add_service(service_id, service_name, user_id)
+    # הוספה למסד נתונים, יחד עם החשבון שבו נמצא השירות
+    account, _ = found
+    await db.add_service(service_id, service_name, user_id, account)
     
+    account_line = f"\n👤 חשבון: `{account}`" if len(render_api.accounts) > 1 else ""
     await update.message.reply_text(
         f"✅ השירות **{service_name}** נוסף בהצלחה!\n"
-        f"🆔 `{service_id}`",
+        f"🆔 `{service_id}`{account_line}",
         parse_mode="Markdown"
     )
 
 
+async def _resolve_service_callback(data: str):
+    """
+    פענוח callback_data של כפתור שירות -> (action, ServiceRecord).
+    action=None אם זה לא כפתור שירות; record=None אם השירות לא נמצא.
+    בפורמט הקומפקטי פונים למונגו רק כשה-handle לא באינדקס (כפתור מלפני
+    הפעלה מחדש או מרפליקה אחרת); הפורמט הישן (view_srv-xxx) נתמך
+    להודעות שנשלחו לפני המעבר.
+    """
+    decoded = service_index.decode(data)
+    if decoded:
+        action, handle = decoded
+        record = service_index.get(handle)
+        if record is None and service_index.is_persistent(handle):
+            service = await db.get_service_by_handle(handle)
+            record = service_index.register(service) if service else None
+        return action, record
+
+    for prefix in LEGACY_PREFIXES:
+        if data.startswith(prefix):
+            service_id = data[len(prefix):]
+            record = service_index.by_service_id(service_id)
+            if record is None:
+                service = await db.get_service(service_id)
+                record = service_index.register(service) if service else None
+            return prefix[:-1], record
+
+    return None, None
+
+
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """טיפול בלחיצות על כפתורים"""
+    """
+    טיפול בלחיצות על כפתורים.
+    לחיצה חוזרת על אותו כפתור בזמן שהטיפול הקודם רץ (או מיד אחריו) מצטרפת
+    אליו במקום להתחיל בנייה/בקשה חדשה.
+    """
     query = update.callback_query
-    await query.answer()
-    
     user_id = query.from_user.id
     
     if not is_admin(user_id):
+        await query.answer()
         await query.edit_message_text("⛔ אין לך הרשאה")
         return
     
     data = query.data
+    action = _callback_action(data)
+    if action in ("suspend", "resume", "restart"):
+        # פעולה על שירות - משותף לכל המשתמשים (שני אדמינים לא ישעו פעמיים)
+        key = ("action", data)
+    elif action in ("suspend_all", "resume_all"):
+        # השעה הכל מול המשך הכל מסודרות בנעילה של כל שירות ב-batch_executor
+        key = ("batch", user_id, data)
+    else:
+        key = ("screen", user_id, data)
     
-    # רענון
-    if data == "refresh":
+    future, first = callback_guard.start(key, lambda: _handle_callback(query, user_id, data, action))
+    await query.answer(None if first else "⏳ כבר בטיפול...")
+    if first:
+        await asyncio.shield(future)
+    elif future is not None:
+        # מצטרפים לטיפול שכבר רץ (שגיאה בו מדווחת פעם אחת, אצל הלחיצה הראשונה)
+        await asyncio.wait({future})
+
+
+async def _handle_callback(query, user_id: int, data: str, action: str):
+    if action in ("suspend_all", "resume_all", "suspend", "resume", "restart"):
+        await _dispatch_callback(query, user_id, data)
+        return
+    # מסכים של אותו משתמש נבנים אחד-אחד, כך שהעריכה האחרונה היא של הלחיצה האחרונה
+    async with callback_guard.for_user(user_id):
+        await _dispatch_callback(query, user_id, data)
+
+
+async def _dispatch_callback(query, user_id: int, data: str):
+    """ניתוב לחיצה לפי callback_data (אחרי בדיקת ההרשאה וה-debounce)"""
+    # רענון / חזרה לתפריט ראשי
+    if data in ("refresh", "back"):
         text, reply_markup = await _render_manage_view(user_id)
         await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
         return
 
     # השעה הכל / המשך הכל
     if data in ("suspend_all", "resume_all"):
-        services = await db.get_services(owner_id=user_id)
+        services = await db.get_services(owner_id=user_id, projection=MENU_PROJECTION)
         if not services:
             await query.edit_message_text("📭 אין שירותים רשומים")
             return
 
-        if data == "suspend_all":
-            await query.edit_message_text("⏳ משעה את כל השירותים...")
-        else:
-            await query.edit_message_text("⏳ ממשיך את כל השירותים...")
-
-        attempted = 0
-        succeeded = 0
-        failed = 0
-        skipped = 0
-
-        for service in services:
-            service_id = service["service_id"]
-
-            status = await render_api.get_service_status(service_id)
-            await db.update_service_status(service_id, status)
-
-            if data == "suspend_all":
-                if status != "active":
-                    skipped += 1
-                    continue
-                attempted += 1
-                success = await render_api.suspend_service(service_id)
-                if success:
-                    succeeded += 1
-                    await db.update_service_status(service_id, "suspended")
-                    await db.log_action(service_id, "suspend", user_id, True)
-                else:
-                    failed += 1
-                    await db.log_action(service_id, "suspend", user_id, False, "API request failed")
-            else:
-                if status != "suspended":
-                    skipped += 1
-                    continue
-                attempted += 1
-                success = await render_api.resume_service(service_id)
-                if success:
-                    succeeded += 1
-                    await db.update_service_status(service_id, "active")
-                    await db.log_action(service_id, "resume", user_id, True)
-                else:
-                    failed += 1
-                    await db.log_action(service_id, "resume", user_id, False, "API request failed")
+        action = "suspend" if data == "suspend_all" else "resume"
+        title = "⏳ משעה את כל השירותים..." if action == "suspend" else "⏳ ממשיך את כל השירותים..."
+        await query.edit_message_text(title)
 
-        text, reply_markup = await _render_manage_view(user_id)
+        # סטטוסים עדכניים לכולם (סריקה אחת + כתיבה מרוכזת למסד)
+        await status_refresher.refresh(services)
+
+        async def on_progress(done, total):
+            await query.edit_message_text(f"{title}\n{done}/{total} בוצעו")
+
+        result = await batch_executor.run(services, action, user_id, on_progress=on_progress)
+
+        # המסך נבנה מהתוצאות שכבר בידינו - בלי לשלוף שוב את כל הסטטוסים
+        text, reply_markup = _build_manage_view(*_first_page(result.services))
         summary = (
             f"✅ בוצע.\n"
-            f"ניסיון: {attempted} | הצליח: {succeeded} | נכשל: {failed} | דולג: {skipped}\n\n"
+            f"ניסיון: {result.attempted} | הצליח: {result.succeeded} | נכשל: {result.failed} | דולג: {result.skipped}\n\n"
         )
         await query.edit_message_text(summary + text, reply_markup=reply_markup, parse_mode="Markdown")
         return
     
+    # כפתורים של שירות: השם וה-service_id מגיעים מהאינדקס שבזיכרון
+    action, service = await _resolve_service_callback(data)
+    if action is None:
+        return
+    if service is None:
+        # handle לא מוכר (למשל אחרי הפעלה מחדש של הבוט) - מציגים תפריט מעודכן
+        text, reply_markup = await _render_manage_view(user_id)
+        await query.edit_message_text(
+            "⌛ התפריט התיישן, הנה תפריט מעודכן:\n\n" + text, reply_markup=reply_markup, parse_mode="Markdown"
+        )
+        return
+    service_id = service.service_id
+    structured_logging.bind(service_id=service_id)
+    
+    # דפדוף בין עמודים
+    if action in ("page_next", "page_prev"):
+        if action == "page_next":
+            text, reply_markup = await _render_manage_view(user_id, after=service_id)
+        else:
+            text, reply_markup = await _render_manage_view(user_id, before=service_id)
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
+        return
+    
     # הצגת שירות
-    if data.startswith("view_"):
-        service_id = data.split("_", 1)[1]
-        service = await db.get_service(service_id)
-        
-        if not service:
-            await query.edit_message_text("❌ שירות לא נמצא")
-            return
+    if action == "view":
+        # קבלת סטטוס (מהמטמון אם טרי)
+        status = await status_refresher.get_status(service_id, service.account)
+        shown = display_status({"status": status, "deploy_status": service.deploy_status})
         
-        # קבלת סטטוס עדכני
-        status = await render_api.get_service_status(service_id)
-        await db.update_service_status(service_id, status)
-        
-        emoji = render_api.status_emoji(status)
-        status_hebrew = "פעיל" if status == "active" else "מושעה" if status == "suspended" else "לא ידוע"
+        emoji = render_api.status_emoji(shown)
+        status_hebrew = STATUS_HEBREW.get(shown, "לא ידוע")
         
         text = f"""
-🤖 **{service['name']}**
+🤖 **{service.name}**
 🆔 `{service_id}`
 📊 סטטוס: {emoji} {status_hebrew}
 
@@ -307,82 +421,196 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # כפתורי פעולה
         keyboard = []
         
+        service_doc = {"service_id": service_id, "name": service.name}
         if status == "suspended":
-            keyboard.append([InlineKeyboardButton("▶️ המשך", callback_data=f"resume_{service_id}")])
+            keyboard.append([InlineKeyboardButton("▶️ המשך", callback_data=service_index.callback("resume", service_doc))])
         else:
-            keyboard.append([InlineKeyboardButton("⏸ השעה", callback_data=f"suspend_{service_id}")])
+            keyboard.append([InlineKeyboardButton("⏸ השעה", callback_data=service_index.callback("suspend", service_doc))])
         
-        keyboard.append([InlineKeyboardButton("🔄 הפעל מחדש", callback_data=f"restart_{service_id}")])
+        keyboard.append([InlineKeyboardButton("🔄 הפעל מחדש", callback_data=service_index.callback("restart", service_doc))])
+        keyboard.append([InlineKeyboardButton("📜 היסטוריית פריסות", callback_data=service_index.callback("deploys", service_doc))])
+        keyboard.append([InlineKeyboardButton("📈 משאבים", callback_data=service_index.callback("metrics_1h", service_doc))])
         keyboard.append([InlineKeyboardButton("◀️ חזור", callback_data="back")])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
         return
     
-    # פעולות
-    if data.startswith("suspend_"):
-        service_id = data.split("_", 1)[1]
-        service = await db.get_service(service_id)
-        
+    # היסטוריית פריסות: סנכרון אינקרמנטלי (רק מה שחדש מאז הפעם הקודמת) ואז קריאה מהמסד
+    if action == "deploys":
+        service_doc = {"service_id": service_id, "name": service.name}
+        keyboard = InlineKeyboardMarkup(
+            [[InlineKeyboardButton("◀️ חזור", callback_data=service_index.callback("view", service_doc))]]
+        )
+        synced = await deploy_sync.sync_service(service_id)
+        if synced:
+            service_index.register(synced)
+        deploys = await db.get_deploys(service_id, limit=config.DEPLOY_HISTORY_LIMIT)
+        events = await db.get_events(service_id, limit=config.DEPLOY_HISTORY_LIMIT)
+        await query.edit_message_text(_format_deploy_history(service.name, deploys, events), reply_markup=keyboard)
+        return
+    
+    # מסך משאבים: CPU/זיכרון לחלון הזמן שנבחר (מהמטמון אם נצפה לאחרונה)
+    if action.startswith("metrics_"):
+        window = action[len("metrics_"):]
+        service_doc = {"service_id": service_id, "name": service.name}
+        windows_row = [
+            InlineKeyboardButton(
+                f"• {name}" if name == window else name,
+                callback_data=service_index.callback(f"metrics_{name}", service_doc),
+            )
+            for name in WINDOWS
+        ]
+        keyboard = InlineKeyboardMarkup([
+            windows_row,
+            [InlineKeyboardButton("◀️ חזור", callback_data=service_index.callback("view", service_doc))],
+        ])
+        try:
+            result = await resource_metrics.get(service_id, window, account=service.account)
+        except RenderAPIError as e:
+            logger.warning("❌ שגיאה בשליפת מטריקות: %s", e)
+            await query.edit_message_text(f"❌ לא ניתן לשלוף מטריקות עבור {service.name} כרגע", reply_markup=keyboard)
+            return
+        await query.edit_message_text(_format_metrics(service.name, window, result), reply_markup=keyboard)
+        return
+    
+    # פעולות: אחת-אחת לכל שירות (גם מול השעה/המשך הכל שרצים באותו זמן)
+    if action in ("suspend", "resume", "restart"):
+        async with callback_guard.for_service(service_id):
+            await _run_service_action(query, user_id, action, service)
+
+
+async def _run_service_action(query, user_id: int, action: str, service):
+    """השעיה/המשך/הפעלה מחדש של שירות אחד (הקורא מחזיק את נעילת השירות)"""
+    service_id = service.service_id
+    
+    if action == "suspend":
         await query.edit_message_text("⏳ משעה את השירות...")
         
-        success = await render_api.suspend_service(service_id)
+        success = await render_api.suspend_service(service_id, account=service.account)
+        status_cache.invalidate(service_id)
         
         if success:
             await db.update_service_status(service_id, "suspended")
-            await db.log_action(service_id, "suspend", user_id, True)
+            action_logger.log(service_id, "suspend", user_id, True)
             await query.edit_message_text(
-                f"✅ השירות **{service['name']}** הושעה בהצלחה!",
+                f"✅ השירות **{service.name}** הושעה בהצלחה!",
                 parse_mode="Markdown"
             )
         else:
-            await db.log_action(service_id, "suspend", user_id, False, "API request failed")
+            action_logger.log(service_id, "suspend", user_id, False, "API request failed")
             await query.edit_message_text("❌ שגיאה בהשעיית השירות")
         return
     
-    if data.startswith("resume_"):
-        service_id = data.split("_", 1)[1]
-        service = await db.get_service(service_id)
-        
+    if action == "resume":
         await query.edit_message_text("⏳ מפעיל את השירות...")
         
-        success = await render_api.resume_service(service_id)
+        success = await render_api.resume_service(service_id, account=service.account)
+        status_cache.invalidate(service_id)
         
         if success:
             await db.update_service_status(service_id, "active")
-            await db.log_action(service_id, "resume", user_id, True)
+            action_logger.log(service_id, "resume", user_id, True)
             await query.edit_message_text(
-                f"✅ השירות **{service['name']}** חזר לפעול!",
+                f"✅ השירות **{service.name}** חזר לפעול!",
                 parse_mode="Markdown"
             )
         else:
-            await db.log_action(service_id, "resume", user_id, False, "API request failed")
+            action_logger.log(service_id, "resume", user_id, False, "API request failed")
             await query.edit_message_text("❌ שגיאה בהמשך השירות")
         return
     
-    if data.startswith("restart_"):
-        service_id = data.split("_", 1)[1]
-        service = await db.get_service(service_id)
-        
+    if action == "restart":
         await query.edit_message_text("⏳ מפעיל מחדש את השירות...")
         
-        success = await render_api.restart_service(service_id)
+        success = await render_api.restart_service(service_id, account=service.account)
+        status_cache.invalidate(service_id)
         
         if success:
-            await db.log_action(service_id, "restart", user_id, True)
+            action_logger.log(service_id, "restart", user_id, True)
             await query.edit_message_text(
-                f"✅ השירות **{service['name']}** הופעל מחדש!",
+                f"✅ השירות **{service.name}** הופעל מחדש!",
                 parse_mode="Markdown"
             )
         else:
-            await db.log_action(service_id, "restart", user_id, False, "API request failed")
+            action_logger.log(service_id, "restart", user_id, False, "API request failed")
             await query.edit_message_text("❌ שגיאה בהפעלה מחדש")
         return
-    
-    # חזרה לתפריט ראשי
-    if data == "back":
-        text, reply_markup = await _render_manage_view(user_id)
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
+
+
+def _format_metrics(name: str, window: str, result) -> str:
+    """טקסט מסך המשאבים: sparkline של הממוצע לכל דלי + min/avg/max לחלון"""
+    lines = [f"📈 משאבים - {name} (חלון: {window})"]
+    for metric, title in (("cpu", "CPU"), ("memory", "זיכרון")):
+        series = result.series[metric]
+        if series.empty:
+            lines.append(f"\n{title}: אין נתונים")
+            continue
+        low, avg, high = series.summary()
+        lines.append(f"\n{title}: עכשיו {format_value(metric, series.last())}")
+        lines.append(sparkline(series.averages()))
+        lines.append(
+            f"min {format_value(metric, low)} | avg {format_value(metric, avg)} | max {format_value(metric, high)}"
+        )
+    return "\n".join(lines)
+
+
+def _format_deploy_history(name: str, deploys, events) -> str:
+    """טקסט מסך היסטוריית הפריסות (בלי Markdown - הודעות commit חופשיות)"""
+    if not deploys and not events:
+        return f"📭 אין פריסות רשומות עבור {name}"
+
+    lines = [f"📜 פריסות אחרונות - {name}:"]
+    for deploy in deploys:
+        state = deploy_state(deploy.get("status"))
+        icon = render_api.status_emoji("active" if state == "live" else state) if state else "⚫"
+        when = deploy["created_at"].strftime("%d/%m %H:%M") if deploy.get("created_at") else "?"
+        commit = deploy.get("commit_message") or deploy.get("trigger") or ""
+        lines.append(f"{icon} {when} UTC | {deploy.get('status')} | {commit[:60]}")
+
+    if events:
+        lines.append("")
+        lines.append("📋 אירועים אחרונים:")
+        for event in events:
+            when = event["timestamp"].strftime("%d/%m %H:%M") if event.get("timestamp") else "?"
+            lines.append(f"• {when} UTC | {event.get('type')}")
+    return "\n".join(lines)
+
+
+def _callback_action(data: str) -> str:
+    """סוג הפעולה של כפתור (view/suspend/refresh...), בלי ה-handle של השירות"""
+    data = data or ""
+    decoded = service_index.decode(data)
+    if decoded:
+        return decoded[0]
+    # לפני הקידומות הישנות: "suspend_all" מתחיל גם ב-"suspend_"
+    if data in ("refresh", "back", "suspend_all", "resume_all"):
+        return data
+    for prefix in LEGACY_PREFIXES:
+        if data.startswith(prefix):
+            return prefix[:-1]
+    return "other"
+
+
+def _callback_label(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """שם הכפתור למטריקות"""
+    return f"callback:{_callback_action(update.callback_query.data)}"
+
+
+def _tracked(label, handler):
+    """עטיפת handler בהקשר לוגים (update_id/user_id) ובמדידת זמן, שגיאות וקריאות בטיסה"""
+    @functools.wraps(handler)
+    async def with_log_context(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        token = structured_logging.bind_update(update.update_id, user.id if user else None)
+        try:
+            return await handler(update, context)
+        finally:
+            structured_logging.reset(token)
+
+    return metrics.instrument(
+        metrics.HANDLER_SECONDS, metrics.HANDLER_ERRORS, metrics.HANDLER_IN_FLIGHT, label
+    )(with_log_context)
 
 
 async def refresh_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -393,7 +621,7 @@ async def refresh_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ אין לך הרשאה")
         return
     
-    services = await db.get_services(owner_id=user_id)
+    services = await db.get_services(owner_id=user_id, projection=MENU_PROJECTION)
     
     if not services:
         await update.message.reply_text("📭 אין שירותים רשומים")
@@ -401,41 +629,403 @@ async def refresh_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text("🔄 מרענן סטטוסים...")
     
-    updated = 0
-    for service in services:
-        status = await render_api.get_service_status(service["service_id"])
-        await db.update_service_status(service["service_id"], status)
-        updated += 1
+    result = await status_refresher.refresh(services)
+    
+    if result.failed:
+        # בלי זה Render לא זמין נראה כמו "✅ 0 עודכנו"
+        text = (
+            f"⚠️ {result.updated} שירותים עודכנו, {len(result.failed)} נכשלו"
+            f" (Render לא זמין?) - מוצג הסטטוס השמור."
+        )
+    else:
+        text = f"✅ {result.updated} שירותים עודכנו!"
+    if result.partial:
+        text += f"\n⏱ {len(result.timed_out)} שירותים לא הספיקו להתעדכן - נסה שוב בעוד רגע."
+    await update.message.reply_text(text)
+
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """פקודת /history <service_id> - הפעולות האחרונות על שירות"""
+    user_id = update.effective_user.id
+    
+    if not is_admin(user_id):
+        await update.message.reply_text("⛔ אין לך הרשאה")
+        return
+    
+    if not context.args:
+        await update.message.reply_text(
+            "📝 שימוש:\n"
+            "`/history <service_id>`",
+            parse_mode="Markdown"
+        )
+        return
+    
+    service_id = context.args[0]
+    service = await db.get_service(service_id)
+    if not service:
+        await update.message.reply_text("❌ שירות לא נמצא")
+        return
+    
+    logs = await db.get_action_history(service_id, limit=config.HISTORY_LIMIT)
+    if not logs:
+        await update.message.reply_text(f"📭 אין פעולות רשומות עבור {service['name']}")
+        return
+    
+    lines = [f"📜 פעולות אחרונות - {service['name']}:"]
+    for log in logs:
+        icon = "✅" if log.get("success") else "❌"
+        when = log["timestamp"].strftime("%d/%m/%Y %H:%M") if log.get("timestamp") else "?"
+        lines.append(f"{icon} {when} UTC | {log.get('action')} | {log.get('user_id')}")
+    await update.message.reply_text("\n".join(lines))
+
+
+def _format_schedule(schedule, name: str) -> str:
+    next_run = scheduler.next_run(schedule["service_id"])
+    line = (
+        f"⏰ {name}: ⏸ {schedule['suspend_at']} | ▶️ {schedule['resume_at']} | "
+        f"{format_days(schedule['days'])} | {schedule['timezone']}"
+    )
+    if next_run:
+        action, when = next_run
+        local = when.astimezone(parse_timezone(schedule["timezone"]))
+        line += f"\n   הבא: {'השעיה' if action == 'suspend' else 'המשך'} ב-{local.strftime('%d/%m %H:%M')}"
+    return line
+
+
+async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    פקודת /schedule:
+    /schedule - לוחות הזמנים שהגדרת
+    /schedule <service_id> <השעיה HH:MM> <המשך HH:MM> [ימים] [אזור זמן]
+    /schedule <service_id> off - ביטול
+    """
+    user_id = update.effective_user.id
+    
+    if not is_admin(user_id):
+        await update.message.reply_text("⛔ אין לך הרשאה")
+        return
+    
+    args = context.args or []
+    if not args:
+        schedules = await db.get_schedules(user_id=user_id)
+        if not schedules:
+            await update.message.reply_text("📭 אין לוחות זמנים. שימוש:\n/schedule <service_id> 23:00 07:00 sun-thu")
+            return
+        services = await db.get_services_by_ids([s["service_id"] for s in schedules], projection=MENU_PROJECTION)
+        names = {s["service_id"]: s.get("name") for s in services}
+        lines = [_format_schedule(s, names.get(s["service_id"]) or s["service_id"]) for s in schedules]
+        await update.message.reply_text("\n".join(lines))
+        return
+    
+    service_id = args[0]
+    service = await db.get_service(service_id)
+    if not service:
+        await update.message.reply_text("❌ שירות לא נמצא")
+        return
+    
+    if len(args) == 2 and args[1].lower() in ("off", "remove", "ביטול"):
+        await db.delete_schedule(service_id)
+        scheduler.remove(service_id)
+        await update.message.reply_text(f"🗑 לוח הזמנים של {service['name']} בוטל")
+        return
+    
+    if len(args) < 3:
+        await update.message.reply_text(
+            "📝 שימוש:\n"
+            "/schedule <service_id> <השעיה HH:MM> <המשך HH:MM> [ימים] [אזור זמן]\n"
+            "דוגמה: /schedule srv-abc123 23:00 07:00 sun-thu Asia/Jerusalem\n"
+            "ביטול: /schedule <service_id> off"
+        )
+        return
+    
+    try:
+        schedule = make_schedule(
+            service_id,
+            args[1],
+            args[2],
+            days=args[3] if len(args) > 3 else None,
+            timezone=args[4] if len(args) > 4 else None,
+            user_id=user_id,
+        )
+    except ScheduleError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
     
-    await update.message.reply_text(f"✅ {updated} שירותים עודכנו!")
+    await db.set_schedule(schedule)
+    scheduler.update(schedule)
+    await update.message.reply_text("✅ לוח הזמנים נשמר\n" + _format_schedule(schedule, service["name"]))
+
+
+async def idle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """פקודת /idle <service_id> <שעות|off> - השעיה אוטומטית אחרי N שעות בלי בקשות/פריסות"""
+    user_id = update.effective_user.id
+    
+    if not is_admin(user_id):
+        await update.message.reply_text("⛔ אין לך הרשאה")
+        return
+    
+    args = context.args or []
+    if len(args) != 2:
+        await update.message.reply_text(
+            "📝 שימוש:\n"
+            "/idle <service_id> <שעות> - השעיה אחרי N שעות בלי בקשות HTTP ובלי פריסות\n"
+            "/idle <service_id> off - ביטול"
+        )
+        return
+    
+    service_id, value = args
+    if value.lower() in ("off", "ביטול"):
+        hours = None
+    else:
+        try:
+            hours = float(value)
+        except ValueError:
+            hours = 0
+        if hours <= 0:
+            await update.message.reply_text("❌ מספר שעות לא תקין")
+            return
+    
+    if not await db.set_idle_threshold(service_id, hours * 3600 if hours else None, user_id):
+        await update.message.reply_text("❌ שירות לא נמצא")
+        return
+    if hours:
+        await update.message.reply_text(f"💤 השירות יושעה אוטומטית אחרי {hours:g} שעות ללא פעילות")
+    else:
+        await update.message.reply_text("✅ ההשעיה האוטומטית בוטלה")
+
+
+async def cache_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """פקודת /cache_stats - נתוני מטמון הסטטוסים ואיחוד בקשות (לכוונון ה-TTL)"""
+    user_id = update.effective_user.id
+    
+    if not is_admin(user_id):
+        await update.message.reply_text("⛔ אין לך הרשאה")
+        return
+    
+    stats = status_cache.stats()
+    flights = render_api.singleflight_stats()
+    guard = callback_guard.stats()
+    charts = resource_metrics.stats()
+    await update.message.reply_text(
+        "📦 מטמון סטטוסים\n"
+        f"רשומות: {stats['size']}/{stats['max_size']} | TTL: {stats['ttl']:g} שניות\n"
+        f"פגיעות: {stats['hits']} | ישנות (רוענן ברקע): {stats['stale_hits']} | החטאות: {stats['misses']}\n"
+        f"יחס פגיעה: {stats['hit_ratio']:.0%}\n\n"
+        "🔗 איחוד בקשות ל-Render\n"
+        f"בקשות שירות: {flights['requests']} | אוחדו: {flights['deduplicated']} ({flights['dedup_ratio']:.0%})\n\n"
+        "👆 לחיצות כפולות\n"
+        f"טופלו: {guard['started']} | הצטרפו לטיפול שרץ: {guard['joined']} | נחסמו (debounce): {guard['debounced']}\n\n"
+        "📈 מטמון מסך משאבים\n"
+        f"רשומות: {charts['size']} | פגיעות: {charts['hits']} | החטאות: {charts['misses']}\n\n"
+        f"🧭 רפליקה: `{leader_lease.instance_id}` | "
+        f"{'מנהיגה' if leader_lease.is_leader else 'ממתינה'}"
+    )
+
+
+async def _record_first_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """מדידת זמן עד העדכון הראשון (מהעדכון השני ואילך לא עושה כלום)"""
+    startup_timer.first_update()
+
+
+# משימות רקע שנוצרות לפני שה-Application רץ - שמירת רפרנס כדי שלא ייאספו
+_background_tasks = set()
+
+
+async def _deferred_db_setup():
+    """ping + מיגרציות ברקע, אחרי שהבוט כבר מקבל עדכונים"""
+    try:
+        await db.setup()
+        startup_timer.mark("db_setup")
+    except Exception as e:
+        logger.error("❌ הגדרת המסד ברקע נכשלה: %s", e)
+
+
+async def _post_init(application: Application):
+    """פתיחת משאבים משותפים אחרי שה-Application עלה"""
+    if config.DEFER_DB_SETUP:
+        # אינדקסים/מיגרציות לא חוסמים את העלייה; עד שיסתיימו השאילתות עובדות במצב התאימות
+        await db.connect(defer_setup=True)
+        task = asyncio.create_task(_deferred_db_setup())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    else:
+        await db.connect()
+    startup_timer.mark("db_connect")
+    action_logger.start()
+    await render_api.start()
+    status_alerts.attach(application.bot)
+    startup_timer.mark("post_init")
+
+
+async def _post_shutdown(application: Application):
+    """סגירת משאבים משותפים בכיבוי הבוט"""
+    await render_api.close()
+    await action_logger.stop()
+    await db.close()
+
+
+async def _start_background_jobs(application: Application):
+    """משימות הרקע - רק ברפליקה המובילה"""
+    scheduler.start()
+    if application.job_queue is None:
+        logger.warning("⚠️ JobQueue לא זמין (python-telegram-bot[job-queue]) - poller הסטטוסים כבוי")
+    else:
+        status_poller.start(application.job_queue)
+
+
+async def _stop_background_jobs(application: Application):
+    await scheduler.stop()
+    if application.job_queue is not None:
+        status_poller.stop(application.job_queue)
+
+
+async def _follow_leadership(lead, step_down):
+    """
+    מעבר בין מנהיגה לממתינה לפי ה-lease (רץ עד שמבטלים אותו).
+    lead/step_down - מה הרפליקה מתחילה/מפסיקה לעשות כשהיא מנהיגה.
+    """
+    while True:
+        await leader_lease.wait_elected()
+        try:
+            await lead()
+        except Exception as e:
+            # למשל טלגרם לא זמין - מנסים שוב בחידוש הבא של ה-lease
+            logger.error("❌ המעבר למנהיגה נכשל: %s", e)
+            await step_down()
+            await asyncio.sleep(leader_lease.renew_interval)
+            continue
+        await leader_lease.wait_lost()
+        await step_down()
+
+
+async def _serve(application: Application, stop: asyncio.Event, lead, step_down):
+    """
+    הרצת ה-Application עד stop: כל הרפליקות מחוברות ומוכנות, ורק המנהיגה
+    מריצה את lead. בכיבוי ה-lease משוחרר כדי שרפליקה אחרת תתפוס אותו מיד.
+    """
+    async with application:
+        await _post_init(application)
+        await application.start()
+        leader_lease.start()
+        startup_timer.mark("serving")
+        follower = asyncio.create_task(_follow_leadership(lead, step_down))
+        try:
+            await stop.wait()
+        finally:
+            follower.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await follower
+            await step_down()
+            await leader_lease.stop()
+            await status_alerts.stop()
+            await application.stop()
+
+
+def _stop_event() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+
+async def _run_polling(application: Application):
+    """מצב polling: רק המנהיגה מושכת עדכונים (טלגרם דוחה getUpdates מקבילים)"""
+    stop = _stop_event()
+
+    async def lead():
+        await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        await _start_background_jobs(application)
+
+    async def step_down():
+        await _stop_background_jobs(application)
+        if application.updater.running:
+            await application.updater.stop()
+
+    try:
+        await _serve(application, stop, lead, step_down)
+    finally:
+        await _post_shutdown(application)
+
+
+async def _run_webhook(application: Application):
+    """
+    מצב webhook: שרת aiohttp אחד על ה-event loop מקבל עדכונים מטלגרם
+    ועונה ל-health checks. בלי polling ובלי thread נפרד.
+    כל הרפליקות מקבלות עדכונים; המנהיגה רושמת את ה-webhook ומריצה את משימות הרקע.
+    """
+    port = int(os.getenv("PORT", "10000"))
+    host = os.getenv("HOST", "0.0.0.0")
+    # אותו secret בכל הרפליקות, בלי להגדיר אותו ידנית
+    secret = config.WEBHOOK_SECRET or hmac.new(
+        config.TELEGRAM_BOT_TOKEN.encode(), b"webhook-secret", hashlib.sha256
+    ).hexdigest()
+    webhook_url = config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH
+    stop = _stop_event()
+
+    async def lead():
+        await application.bot.set_webhook(
+            url=webhook_url,
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=secret,
+        )
+        logger.info("🔗 Webhook: %s", webhook_url)
+        await _start_background_jobs(application)
+
+    async def step_down():
+        await _stop_background_jobs(application)
+
+    runner = web.AppRunner(build_web_app(application, config.WEBHOOK_PATH, secret), access_log=None)
+    await runner.setup()
+    # פותחים את הפורט קודם, כדי ש-Render יזהה אותו גם אם החיבור למסד איטי
+    await web.TCPSite(runner, host, port).start()
+    logger.info("🌐 Webhook server listening on %s:%s", host, port)
+
+    try:
+        await _serve(application, stop, lead, step_down)
+    finally:
+        await runner.cleanup()
+        await _post_shutdown(application)
 
 
 def main():
     """הרצת הבוט"""
-    # Render: פתיחת PORT כדי שהדיפלוי לא ייתקע.
-    # רץ ברקע כדי לא להפריע ל-run_polling.
-    if os.getenv("DISABLE_HEALTH_SERVER", "").lower() not in ("1", "true", "yes"):
-        threading.Thread(target=_start_health_server, daemon=True).start()
-
     # יצירת Application
-    application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(config.TELEGRAM_BOT_TOKEN)
+        .build()
+    )
     
     # רישום handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("manage", manage))
-    application.add_handler(CommandHandler("add_service", add_service_command))
-    application.add_handler(CommandHandler("refresh", refresh_command))
-    application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(CommandHandler("start", _tracked("start", start)))
+    application.add_handler(CommandHandler("manage", _tracked("manage", manage)))
+    application.add_handler(CommandHandler("add_service", _tracked("add_service", add_service_command)))
+    application.add_handler(CommandHandler("refresh", _tracked("refresh", refresh_command)))
+    application.add_handler(CommandHandler("history", _tracked("history", history_command)))
+    application.add_handler(CommandHandler("schedule", _tracked("schedule", schedule_command)))
+    application.add_handler(CommandHandler("idle", _tracked("idle", idle_command)))
+    application.add_handler(CommandHandler("cache_stats", _tracked("cache_stats", cache_stats_command)))
+    application.add_handler(CallbackQueryHandler(_tracked(_callback_label, button_callback)))
+    application.add_handler(TypeHandler(Update, _record_first_update), group=-1)
+    startup_timer.mark("handlers")
     
     # התחלת הבוט
     logger.info("🚀 הבוט מתחיל...")
     
-    # חיבור למסד נתונים
-    import asyncio
-    asyncio.get_event_loop().run_until_complete(db.connect())
+    if config.BOT_MODE == "webhook":
+        if config.WEBHOOK_URL:
+            asyncio.run(_run_webhook(application))
+            return
+        logger.warning("⚠️ BOT_MODE=webhook אבל WEBHOOK_URL/RENDER_EXTERNAL_URL לא מוגדר - עובר ל-polling")
+    
+    # Render: פתיחת PORT כדי שהדיפלוי לא ייתקע (גם ברפליקה שממתינה).
+    # רץ ברקע כדי לא להפריע ל-polling.
+    if os.getenv("DISABLE_HEALTH_SERVER", "").lower() not in ("1", "true", "yes"):
+        threading.Thread(target=_start_health_server, daemon=True).start()
     
-    # הרצה
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # הרצה (החיבור למסד נפתח ב-_post_init)
+    asyncio.run(_run_polling(application))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+"""
+כלים משותפים למטמונים בזיכרון: single-flight (קוראים מקבילים חולקים משימה
+אחת) ומטמון TTL + LRU חסום. בשימוש ב-RenderAPI, CallbackGuard, StatusCache
+ו-ResourceMetrics.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.requests = 0
+        self.deduplicated = 0
+
+    def get(self, key: Hashable) -> Optional[asyncio.Future]:
+        """המשימה שרצה כרגע ל-key (או None)"""
+        return self._inflight.get(key)
+
+    def start(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        on_done: Callable[[asyncio.Future], None] = None,
+    ) -> asyncio.Future:
+        """
+        הפעלת factory ל-key בלי await. on_done נקרא כשהמשימה מסתיימת, אחרי
+        שהיא כבר לא רשומה (קריאה חדשה עם אותו key תתחיל משימה חדשה).
+        """
+        future = asyncio.ensure_future(factory())
+        self._inflight[key] = future
+
+        def done(f):
+            if self._inflight.get(key) is f:
+                del self._inflight[key]
+            if not f.cancelled():
+                f.exception()  # מסמן שהשגיאה נקראה גם אם כל הקוראים בוטלו
+            if on_done is not None:
+                on_done(f)
+
+        future.add_done_callback(done)
+        return future
+
+    async def do(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        on_done: Callable[[asyncio.Future], None] = None,
+    ) -> Any:
+        """
+        קוראים מקבילים עם אותו key חולקים משימה אחת ואת התוצאה (או השגיאה) שלה.
+        המשימה מוגנת ב-shield, כך שביטול של קורא אחד לא מבטל אותה לאחרים.
+        """
+        self.requests += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            future = self.start(key, factory, on_done)
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "deduplicated": self.deduplicated,
+            "dedup_ratio": self.deduplicated / self.requests if self.requests else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._inflight)
+
+
+class TTLCache:
+    """מטמון עם תוקף (ttl שניות) וגודל מקסימלי: הרשומה שלא נקראה הכי הרבה זמן מפונה ראשונה"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        # key -> (value, stored_at)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """(value, fresh); value=None אם אין רשומה, fresh=False אם היא ישנה מה-ttl"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        self._entries.move_to_end(key)
+        value, stored_at = entry
+        return value, time.monotonic() - stored_at <= self.ttl
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def keys(self) -> List[Hashable]:
+        return list(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,98 @@
+"""
+הגנה מלחיצות כפולות על כפתורים: debounce, הצטרפות לפעולה שכבר רצה,
+ונעילות לפי משתמש/שירות כדי שפעולות מתנגשות ירוצו בזו אחר זו.
+כשכמה רפליקות מקבלות עדכונים (SHARED_LOCKS), הנעילה לפי שירות נתפסת גם במונגו.
+"""
+import asyncio
+import contextlib
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import config
+from caching import SingleFlight
+from coordination import shared_locks
+
+# מעל כמה רשומות "הסתיים לאחרונה" מנקים את הישנות
+_RECENT_PRUNE_SIZE = 1024
+
+
+class CallbackGuard:
+    def __init__(self, debounce: float = None, shared=None):
+        self.debounce = config.CALLBACK_DEBOUNCE if debounce is None else debounce
+        # נעילות בין רפליקות (SharedLocks), או None כשרק רפליקה אחת מקבלת עדכונים
+        self.shared = shared
+        self._flight = SingleFlight()
+        self._recent: Dict[Hashable, float] = {}  # key -> loop.time() שבו הסתיים
+        self._locks: Dict[Hashable, List] = {}  # key -> [Lock, מספר ממתינים]
+        self.started = 0
+        self.joined = 0
+        self.debounced = 0
+
+    def _recently_done(self, key: Hashable, now: float) -> bool:
+        done_at = self._recent.get(key)
+        return done_at is not None and now - done_at < self.debounce
+
+    def start(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Optional[asyncio.Future], bool]:
+        """
+        הפעלת factory פעם אחת לכל key (בלי await, כך שאין מרוץ בין שתי לחיצות).
+        מחזיר (future, True) לקריאה הראשונה; (future שכבר רץ, False) ללחיצה
+        שמצטרפת אליו; (None, False) ללחיצה בתוך חלון ה-debounce אחרי שהסתיים.
+        """
+        loop = asyncio.get_running_loop()
+        existing = self._flight.get(key)
+        if existing is not None:
+            self.joined += 1
+            return existing, False
+        if self._recently_done(key, loop.time()):
+            self.debounced += 1
+            return None, False
+
+        self.started += 1
+
+        def done(f):
+            now = loop.time()
+            self._recent[key] = now
+            if len(self._recent) > _RECENT_PRUNE_SIZE:
+                for stale in [k for k, t in self._recent.items() if now - t >= self.debounce]:
+                    del self._recent[stale]
+
+        return self._flight.start(key, factory, on_done=done), True
+
+    @contextlib.asynccontextmanager
+    async def lock(self, key: Hashable):
+        """נעילה לפי key (משתמש/שירות); הרשומה נמחקת כשאין מי שמחזיק או ממתין"""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._locks.get(key) is entry:
+                del self._locks[key]
+
+    @contextlib.asynccontextmanager
+    async def for_service(self, service_id: str):
+        # קודם הנעילה המקומית, כדי שממתינים באותה רפליקה לא יציפו את מונגו
+        async with self.lock(("service", service_id)):
+            if self.shared is None:
+                yield
+            else:
+                async with self.shared.hold(f"service:{service_id}"):
+                    yield
+
+    def for_user(self, user_id: int):
+        return self.lock(("user", user_id))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "started": self.started,
+            "joined": self.joined,
+            "debounced": self.debounced,
+            "in_flight": len(self._flight),
+        }
+
+
+# אובייקט גלובלי
+callback_guard = CallbackGuard(shared=shared_locks if config.SHARED_LOCKS else None)
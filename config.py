@@ -2,6 +2,7 @@
 ניהול הגדרות הבוט
 """
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,22 +11,154 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 ADMIN_USER_ID = os.getenv("ADMIN_USER_ID")
 
+# מצב הרצה: polling (ברירת מחדל) או webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# כתובת ציבורית לשירות; ב-Render מוגדר אוטומטית RENDER_EXTERNAL_URL
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# אם לא מוגדר, נגזר מהטוקן (כך שכל הרפליקות מאמתות את אותו secret)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
 # Render API
 RENDER_API_KEY = os.getenv("RENDER_API_KEY")
-RENDER_API_BASE = "https://api.render.com/v1"
+# חשבונות נוספים (workspaces) בבוט אחד: "prod=rnd_xxx,staging=rnd_yyy".
+# RENDER_API_KEY, אם מוגדר, הוא החשבון "default"; החשבון הראשון הוא ברירת המחדל
+# לשירותים שנוספו לפני שהיו כמה חשבונות
+RENDER_ACCOUNTS_SPEC = os.getenv("RENDER_ACCOUNTS", "")
+DEFAULT_RENDER_ACCOUNT = "default"
+RENDER_API_BASE = os.getenv("RENDER_API_BASE", "https://api.render.com/v1")
+# גודל עמוד ב-GET /services (Render מאפשר עד 100)
+RENDER_LIST_PAGE_SIZE = int(os.getenv("RENDER_LIST_PAGE_SIZE", "100"))
+
+# חיבור HTTP משותף ל-Render (keep-alive + pool)
+RENDER_HTTP_TIMEOUT = float(os.getenv("RENDER_HTTP_TIMEOUT", "30"))
+RENDER_HTTP_MAX_CONNECTIONS = int(os.getenv("RENDER_HTTP_MAX_CONNECTIONS", "20"))
+RENDER_HTTP_MAX_KEEPALIVE = int(os.getenv("RENDER_HTTP_MAX_KEEPALIVE", "10"))
+RENDER_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("RENDER_HTTP_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 יופעל רק אם החבילה h2 מותקנת
+RENDER_HTTP2 = os.getenv("RENDER_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# מגבלת קצב, ניסיונות חוזרים ו-circuit breaker מול Render
+RENDER_RATE_LIMIT_PER_MINUTE = float(os.getenv("RENDER_RATE_LIMIT_PER_MINUTE", "300"))
+RENDER_RATE_LIMIT_BURST = float(os.getenv("RENDER_RATE_LIMIT_BURST", "20"))
+RENDER_MAX_RETRIES = int(os.getenv("RENDER_MAX_RETRIES", "3"))
+RENDER_RETRY_BASE_DELAY = float(os.getenv("RENDER_RETRY_BASE_DELAY", "0.5"))
+RENDER_RETRY_MAX_DELAY = float(os.getenv("RENDER_RETRY_MAX_DELAY", "10"))
+RENDER_BREAKER_THRESHOLD = int(os.getenv("RENDER_BREAKER_THRESHOLD", "5"))
+RENDER_BREAKER_COOLDOWN = float(os.getenv("RENDER_BREAKER_COOLDOWN", "30"))
+
+# כמה שירותים בכל עמוד של /manage
+MANAGE_PAGE_SIZE = int(os.getenv("MANAGE_PAGE_SIZE", "20"))
+
+# כמה שירותים נשמרים באינדקס שבזיכרון (handle קומפקטי לכפתורים)
+SERVICE_INDEX_MAX_SIZE = int(os.getenv("SERVICE_INDEX_MAX_SIZE", "5000"))
+
+# רענון סטטוסים מקבילי
+STATUS_REFRESH_CONCURRENCY = int(os.getenv("STATUS_REFRESH_CONCURRENCY", "8"))
+# זמן מקסימלי לרענון; אחריו מוחזרות תוצאות חלקיות
+STATUS_REFRESH_DEADLINE = float(os.getenv("STATUS_REFRESH_DEADLINE", "8"))
+# שליפת כל הסטטוסים מ-GET /services (כמה בקשות) לפני נפילה לבקשה לכל שירות
+STATUS_REFRESH_USE_LISTING = os.getenv("STATUS_REFRESH_USE_LISTING", "true").lower() in ("1", "true", "yes")
+
+# השעה/המשך הכל: כמה פעולות במקביל, וכל כמה שניות לעדכן את הודעת ההתקדמות
+BATCH_ACTION_CONCURRENCY = int(os.getenv("BATCH_ACTION_CONCURRENCY", "5"))
+BATCH_PROGRESS_INTERVAL = float(os.getenv("BATCH_PROGRESS_INTERVAL", "2"))
+
+# לחיצה חוזרת על אותו כפתור תוך N שניות מסיום הטיפול הקודם מתעלמת
+CALLBACK_DEBOUNCE = float(os.getenv("CALLBACK_DEBOUNCE", "1.0"))
+
+# מטמון סטטוסים (stale-while-revalidate)
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", "30"))
+STATUS_CACHE_MAX_SIZE = int(os.getenv("STATUS_CACHE_MAX_SIZE", "1000"))
+
+# poller סטטוסים ברקע (0 = כבוי)
+STATUS_POLL_INTERVAL = float(os.getenv("STATUS_POLL_INTERVAL", "120"))
+STATUS_POLL_JITTER = float(os.getenv("STATUS_POLL_JITTER", "0.1"))
+STATUS_POLL_MAX_BACKOFF = float(os.getenv("STATUS_POLL_MAX_BACKOFF", "900"))
+
+# סנכרון פריסות/אירועים מ-Render (אינקרמנטלי, לפי high-water mark שנשמר במונגו)
+DEPLOY_SYNC_PAGE_SIZE = int(os.getenv("DEPLOY_SYNC_PAGE_SIZE", "20"))
+# כל כמה שניות שירות יציב נבדק שוב (שירות בפריסה נבדק בכל סבב של ה-poller)
+DEPLOY_SYNC_INTERVAL = float(os.getenv("DEPLOY_SYNC_INTERVAL", "900"))
+# מקסימום שירותים שמסונכרנים בכל סבב (כדי לא לאכול את מכסת ה-API)
+DEPLOY_SYNC_MAX_PER_CYCLE = int(os.getenv("DEPLOY_SYNC_MAX_PER_CYCLE", "50"))
+# כמה שירותים מסונכרנים במקביל בכל חשבון
+DEPLOY_SYNC_CONCURRENCY = int(os.getenv("DEPLOY_SYNC_CONCURRENCY", "8"))
+# כמה פריסות/אירועים מוצגים במסך ההיסטוריה
+DEPLOY_HISTORY_LIMIT = int(os.getenv("DEPLOY_HISTORY_LIMIT", "10"))
+
+# מסך משאבים (CPU/זיכרון): כמה דליים בגרף, וכמה שניות תוצאה נשמרת במטמון
+METRICS_BUCKETS = int(os.getenv("METRICS_BUCKETS", "24"))
+METRICS_CACHE_TTL = float(os.getenv("METRICS_CACHE_TTL", "60"))
+METRICS_CACHE_MAX_SIZE = int(os.getenv("METRICS_CACHE_MAX_SIZE", "200"))
+
+# אזור הזמן של לוחות זמנים של השעיה/המשך כשלא צוין אחר ב-/schedule
+SCHEDULE_TIMEZONE = os.getenv("SCHEDULE_TIMEZONE", "Asia/Jerusalem")
+
+# השעיה אוטומטית של שירותים רדומים (הסף לכל שירות נקבע ב-/idle):
+# כל כמה שניות לכל היותר נאספים סימני פעילות לשירות, וכמה שירותים בכל סבב של ה-poller
+IDLE_CHECK_INTERVAL = float(os.getenv("IDLE_CHECK_INTERVAL", "600"))
+IDLE_MAX_PER_CYCLE = int(os.getenv("IDLE_MAX_PER_CYCLE", "50"))
+# כמה שירותים נבדקים במקביל בכל חשבון (בקשת metrics + events לכל שירות)
+IDLE_CHECK_CONCURRENCY = int(os.getenv("IDLE_CHECK_CONCURRENCY", "4"))
+
+# כמה רפליקות: רק המחזיקה ב-lease "leader" במונגו מקבלת עדכונים ב-polling ומריצה
+# את משימות הרקע; השאר ממתינות ותופסות את ה-lease תוך LEADER_LEASE_TTL שניות אם היא נופלת.
+# כבוי כברירת מחדל: מופע יחיד לא צריך לחכות ל-lease (גם לא אחרי קריסה) או לתלות את ה-poller במונגו
+LEADER_ELECTION = os.getenv("LEADER_ELECTION", "false").lower() in ("1", "true", "yes")
+# מזהה הרפליקה (ב-Render מוגדר RENDER_INSTANCE_ID)
+INSTANCE_ID = os.getenv("RENDER_INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "15"))
+# כל כמה שניות המנהיג מחדש את ה-lease והממתינות מנסות לתפוס אותו (צריך להיות פחות מחצי ה-TTL)
+LEADER_RENEW_INTERVAL = float(os.getenv("LEADER_RENEW_INTERVAL", "5"))
+# נעילה לכל שירות גם במונגו (ולא רק בזיכרון), כשכמה רפליקות מקבלות עדכונים - כלומר
+# ב-webhook עם בחירת מנהיג
+SHARED_LOCKS = os.getenv("SHARED_LOCKS", "true" if LEADER_ELECTION and BOT_MODE == "webhook" else "false").lower() in ("1", "true", "yes")
+# אחרי כמה שניות נעילה משותפת משתחררת גם אם המחזיק נפל
+SHARED_LOCK_TTL = float(os.getenv("SHARED_LOCK_TTL", "60"))
+# כל כמה שניות המנהיג טוען מחדש את לוחות הזמנים מהמסד (0 = לא), כדי לקלוט
+# /schedule שהתקבל ברפליקה אחרת (ב-webhook עם בחירת מנהיג)
+SCHEDULE_RELOAD_INTERVAL = float(os.getenv("SCHEDULE_RELOAD_INTERVAL", "60" if LEADER_ELECTION and BOT_MODE == "webhook" else "0"))
 
 # MongoDB
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = "render_manager"
+# לוג פעולות: כתיבה מרוכזת ברקע + מחיקה אוטומטית אחרי N ימים
+# (שינוי RETENTION אחרי שהאינדקס נוצר מוחל בעלייה הבאה)
+ACTION_LOG_BATCH_SIZE = int(os.getenv("ACTION_LOG_BATCH_SIZE", "100"))
+ACTION_LOG_FLUSH_INTERVAL = float(os.getenv("ACTION_LOG_FLUSH_INTERVAL", "2"))
+ACTION_LOG_MAX_QUEUE = int(os.getenv("ACTION_LOG_MAX_QUEUE", "10000"))
+ACTION_LOG_RETENTION_DAYS = float(os.getenv("ACTION_LOG_RETENTION_DAYS", "90"))
+# כמה פעולות מוצגות ב-/history
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "15"))
+# ping/אינדקסים/מיגרציות ברקע אחרי שהבוט עלה, במקום לחסום את העלייה
+DEFER_DB_SETUP = os.getenv("DEFER_DB_SETUP", "true").lower() in ("1", "true", "yes")
+
+# לוגים: json (ברירת מחדל, ל-log stream של Render) או text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# דגימה לפי מודול, למשל "status_poller=0.1" = שורה אחת מכל 10 (ERROR תמיד נכתב)
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "status_poller=0.1")
+# תור הלוגים בזיכרון; כשהוא מלא שורות חדשות נזרקות במקום לעכב את הבוט
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
 # בדיקת תקינות
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN חסר בקובץ .env")
-if not RENDER_API_KEY:
-    raise ValueError("RENDER_API_KEY חסר בקובץ .env")
 if not MONGO_URI:
     raise ValueError("MONGO_URI חסר בקובץ .env")
 
+# חשבונות Render: שם -> מפתח API
+RENDER_ACCOUNTS = {}
+if RENDER_API_KEY:
+    RENDER_ACCOUNTS[DEFAULT_RENDER_ACCOUNT] = RENDER_API_KEY
+for _part in RENDER_ACCOUNTS_SPEC.split(","):
+    _name, _sep, _key = _part.partition("=")
+    if _sep and _name.strip() and _key.strip():
+        RENDER_ACCOUNTS[_name.strip()] = _key.strip()
+if not RENDER_ACCOUNTS:
+    raise ValueError("RENDER_API_KEY (או RENDER_ACCOUNTS) חסר בקובץ .env")
+
 # המרת ADMIN_USER_ID - תמיכה במספר מנהלים מופרדים בפסיקים
 ADMIN_USER_IDS = []
 if ADMIN_USER_ID:
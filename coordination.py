@@ -0,0 +1,170 @@
+"""
+כמה רפליקות של הבוט במקביל: בחירת מנהיג ונעילות משותפות דרך MongoDB.
+
+רק הרפליקה שמחזיקה ב-lease "leader" (אוסף leases) מקבלת עדכונים ב-polling
+ומריצה את משימות הרקע (poller, לוחות זמנים). השאר ממתינות ומנסות לתפוס את
+ה-lease כל LEADER_RENEW_INTERVAL שניות: אם המנהיג נופל, אחת מהן תופסת את
+מקומו תוך LEADER_LEASE_TTL שניות לכל היותר, ובכיבוי מסודר (ה-lease משוחרר)
+כמעט מיד. מנהיג שלא הצליח לחדש את ה-lease (למשל מונגו לא זמין) מוותר עליו
+בעצמו לפני שהוא פג, כך שאין שני מנהיגים במקביל.
+"""
+import asyncio
+import contextlib
+import logging
+import secrets
+import time
+from typing import Optional
+
+import config
+import metrics
+from database import db
+from structured_logging import log_context
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE = "leader"
+
+# המתנה בין ניסיונות לתפוס נעילה משותפת (מוכפלת עד המקסימום)
+LOCK_POLL_INTERVAL = 0.2
+LOCK_MAX_POLL_INTERVAL = 2.0
+
+
+class LeaderLease:
+    def __init__(
+        self,
+        database=db,
+        name: str = LEADER_LEASE,
+        instance_id: str = None,
+        ttl: float = None,
+        renew_interval: float = None,
+        enabled: bool = None,
+    ):
+        self.db = database
+        self.name = name
+        self.instance_id = instance_id or config.INSTANCE_ID
+        self.ttl = ttl or config.LEADER_LEASE_TTL
+        self.renew_interval = renew_interval or config.LEADER_RENEW_INTERVAL
+        self.enabled = config.LEADER_ELECTION if enabled is None else enabled
+        self.is_leader = False
+        self.elections = 0
+        self._renewed_at: Optional[float] = None  # time.monotonic() של החידוש המוצלח האחרון
+        self._elected = asyncio.Event()
+        self._lost = asyncio.Event()
+        self._lost.set()
+        self._task: Optional[asyncio.Task] = None
+
+    def _set_leader(self, leader: bool):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        metrics.LEADER.set(value=1 if leader else 0)
+        if leader:
+            self.elections += 1
+            self._lost.clear()
+            self._elected.set()
+            logger.info("👑 הרפליקה %s היא המנהיגה", self.instance_id)
+        else:
+            self._elected.clear()
+            self._lost.set()
+            logger.warning("🪑 הרפליקה %s כבר לא המנהיגה", self.instance_id)
+
+    async def _tick(self):
+        """ניסיון אחד לתפוס/לחדש את ה-lease"""
+        started = time.monotonic()
+        try:
+            # בקשה תקועה לא תחזיק אותנו מנהיגים אחרי שה-lease פג
+            acquired = await asyncio.wait_for(
+                self.db.acquire_lease(self.name, self.instance_id, self.ttl),
+                timeout=self.renew_interval,
+            )
+        except Exception as e:
+            logger.warning("⚠️ חידוש ה-lease נכשל: %s", e)
+            # עד הבדיקה הבאה יכולים לעבור עוד שני מרווחים - מוותרים לפני שה-lease פג
+            if self.is_leader and time.monotonic() + 2 * self.renew_interval >= self._renewed_at + self.ttl:
+                self._set_leader(False)
+            return
+        if acquired:
+            self._renewed_at = started
+        self._set_leader(acquired)
+
+    async def _run(self):
+        with log_context(component="leader"):
+            while True:
+                await self._tick()
+                await asyncio.sleep(self.renew_interval)
+
+    def start(self):
+        if not self.enabled:
+            # רפליקה יחידה - תמיד מנהיגה
+            self._set_leader(True)
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """הפסקת החידוש ושחרור ה-lease, כדי שרפליקה אחרת תתפוס אותו מיד"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self.is_leader:
+                try:
+                    await self.db.release_lease(self.name, self.instance_id)
+                except Exception as e:
+                    logger.warning("⚠️ שחרור ה-lease נכשל (יפוג לבד): %s", e)
+        self._set_leader(False)
+
+    async def wait_elected(self):
+        await self._elected.wait()
+
+    async def wait_lost(self):
+        await self._lost.wait()
+
+
+class SharedLocks:
+    """
+    נעילות בין רפליקות: lease לכל key, שמשתחרר ביציאה או אחרי ttl שניות
+    (אם המחזיק נפל). פעולה שנמשכת יותר מה-ttl מאבדת את הנעילה.
+    """
+
+    def __init__(self, database=db, instance_id: str = None, ttl: float = None):
+        self.db = database
+        self.instance_id = instance_id or config.INSTANCE_ID
+        self.ttl = ttl or config.SHARED_LOCK_TTL
+        self.acquired = 0
+        self.contended = 0
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key: str):
+        name = f"lock:{key}"
+        # מחזיק ייחודי לכל כניסה - שתי משימות באותה רפליקה לא חולקות נעילה
+        holder = f"{self.instance_id}:{secrets.token_hex(4)}"
+        delay = LOCK_POLL_INTERVAL
+        locked = False
+        try:
+            while not await self.db.acquire_lease(name, holder, self.ttl):
+                if delay == LOCK_POLL_INTERVAL:
+                    self.contended += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, LOCK_MAX_POLL_INTERVAL)
+            locked = True
+            self.acquired += 1
+        except Exception as e:
+            # מונגו לא זמין - ממשיכים עם הנעילה המקומית בלבד במקום לחסום את הפעולה
+            logger.warning("⚠️ נעילה משותפת %s נכשלה: %s", key, e)
+        try:
+            yield
+        finally:
+            if locked:
+                try:
+                    await self.db.release_lease(name, holder)
+                except Exception as e:
+                    logger.warning("⚠️ שחרור נעילה משותפת %s נכשל (תפוג לבד): %s", key, e)
+
+
+# אובייקט גלובלי
+leader_lease = LeaderLease()
+shared_locks = SharedLocks()
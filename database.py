@@ -1,97 +1,420 @@
 """
 ניהול חיבור למסד נתונים MongoDB עם Async API
 """
-from pymongo import AsyncMongoClient
-from pymongo.errors import ConnectionFailure
+import datetime
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, OperationFailure
 import config
+from metrics import MONGO_ERRORS, MONGO_IN_FLIGHT, MONGO_OPERATION_SECONDS, instrument
+from migrations import HANDLE_COUNTER, OWNERS_MIGRATION, applied_versions, run_migrations, sync_log_retention
+from timeutil import aware
+
+logger = logging.getLogger(__name__)
+
+# השדות שמסך /manage צריך - בלי לטעון את כל המסמך
+MENU_PROJECTION = {"_id": 0, "service_id": 1, "name": 1, "status": 1, "deploy_status": 1, "account": 1, "handle": 1}
+
+# סדר קבוע לדפדוף (keyset): לפי שם, ו-service_id לשוברי שוויון
+PAGE_SORT = [("name", ASCENDING), ("service_id", ASCENDING)]
+
+# זמן, שגיאות וקריאות בטיסה לכל פעולת מסד (label = שם המתודה)
+_timed = instrument(MONGO_OPERATION_SECONDS, MONGO_ERRORS, MONGO_IN_FLIGHT)
 
 class Database:
     def __init__(self):
         self.client = None
         self.db = None
+        # אחרי מיגרציית owners אפשר לשאול רק על owners (אינדקס אחד, בלי $or)
+        self.owners_migrated = False
         
-    async def connect(self):
-        """יצירת חיבור למונגו"""
+    async def connect(self, defer_setup: bool = False):
+        """
+        יצירת חיבור למונגו.
+        AsyncMongoClient מתחבר בעצלות, כך שעם defer_setup=True לא מחכים לשום
+        round trip - את ה-ping והמיגרציות מריצים אחר כך ב-setup() ברקע.
+        """
+        self.client = AsyncMongoClient(config.MONGO_URI)
+        self.db = self.client[config.DB_NAME]
+        if not defer_setup:
+            await self.setup()
+    
+    async def setup(self):
+        """בדיקת חיבור + אינדקסים ומיגרציות (רק מה שעוד לא הוחל)"""
         try:
-            self.client = AsyncMongoClient(config.MONGO_URI)
             # בדיקת חיבור
             await self.client.admin.command('ping')
-            self.db = self.client[config.DB_NAME]
-            print("✅ התחברות למונגו הצליחה")
+            logger.info("✅ התחברות למונגו הצליחה")
             
-            # יצירת אינדקסים
-            await self.db.services.create_index("service_id", unique=True)
-            await self.db.services.create_index("owner_id")
-            await self.db.services.create_index("owners")
-
-            # מיגרציה לאחור: אם יש owner_id אבל אין owners, ניצור owners=[owner_id]
-            # (כדי לאפשר לכמה אדמינים לראות את אותו השירות בלי "לדרוס" בעלות)
-            await self.db.services.update_many(
-                {"owner_id": {"$exists": True}, "owners": {"$exists": False}},
-                [{"$set": {"owners": ["$owner_id"]}}],
-            )
+            applied = await applied_versions(self.db)
+            self.owners_migrated = OWNERS_MIGRATION in applied
+            try:
+                await run_migrations(self.db, applied=applied)
+            finally:
+                # גם אם מיגרציה מאוחרת יותר נכשלה - מה שכבר הוחל נשאר בתוקף
+                self.owners_migrated = OWNERS_MIGRATION in applied
+            
+            try:
+                await sync_log_retention(self.db)
+            except OperationFailure as e:
+                logger.warning("⚠️ עדכון תוקף הלוגים נכשל: %s", e)
             
         except ConnectionFailure as e:
-            print(f"❌ שגיאה בהתחברות למונגו: {e}")
+            logger.error("❌ שגיאה בהתחברות למונגו: %s", e)
             raise
     
     async def close(self):
         """סגירת החיבור"""
         if self.client:
-            self.client.close()
-            print("🔌 החיבור למונגו נסגר")
+            await self.client.close()
+            logger.info("🔌 החיבור למונגו נסגר")
     
-    async def add_service(self, service_id: str, name: str, owner_id: int):
-        """הוספת שירות חדש"""
+    @_timed
+    async def add_service(self, service_id: str, name: str, owner_id: int, account: str = None):
+        """הוספת שירות חדש (account = חשבון ה-Render שהשירות שייך אליו)"""
         result = await self.db.services.update_one(
             {"service_id": service_id},
             {
                 # לא "לדרוס" בעלות קיימת; רק להוסיף אדמין לרשימת owners
-                "$set": {"service_id": service_id, "name": name},
+                "$set": {"service_id": service_id, "name": name, "account": account or config.DEFAULT_RENDER_ACCOUNT},
                 "$setOnInsert": {"status": "unknown"},
                 "$addToSet": {"owners": owner_id},
             },
             upsert=True
         )
+        if result.upserted_id is not None:
+            await self._assign_handle(service_id)
         return result
     
-    async def get_services(self, owner_id: int = None):
-        """קבלת רשימת שירותים"""
-        if owner_id:
-            # תמיכה גם ב-owner_id הישן וגם ב-owners החדש
-            query = {"$or": [{"owner_id": owner_id}, {"owners": owner_id}]}
-        else:
-            query = {}
-        cursor = self.db.services.find(query)
-        return await cursor.to_list(length=100)
+    async def _assign_handle(self, service_id: str):
+        """handle קבוע לשירות חדש (מהמונה המשותף; לא דורס handle קיים)"""
+        counter = await self.db.counters.find_one_and_update(
+            {"_id": HANDLE_COUNTER},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        await self.db.services.update_one(
+            {"service_id": service_id, "handle": {"$exists": False}},
+            {"$set": {"handle": counter["seq"] - 1}},
+        )
     
+    @_timed
+    async def get_service_by_handle(self, handle: int, projection: dict = MENU_PROJECTION):
+        """שירות לפי ה-handle הקבוע שלו (לכפתור שהאינדקס שבזיכרון לא מכיר)"""
+        return await self.db.services.find_one({"handle": handle}, projection)
+    
+    def _owner_query(self, owner_id: int = None) -> dict:
+        if not owner_id:
+            return {}
+        if self.owners_migrated:
+            return {"owners": owner_id}
+        # לפני המיגרציה: תמיכה גם ב-owner_id הישן וגם ב-owners החדש
+        return {"$or": [{"owner_id": owner_id}, {"owners": owner_id}]}
+    
+    async def explain_services_page(self, owner_id: int, limit: int = 20) -> dict:
+        """תוכנית הביצוע של שאילתת /manage (לבדיקה שהיא סריקת אינדקס אחת בלי מיון)"""
+        return await (
+            self.db.services.find(self._owner_query(owner_id), MENU_PROJECTION)
+            .sort(PAGE_SORT)
+            .limit(limit + 1)
+            .explain()
+        )
+    
+    async def iter_services(
+        self, owner_id: int = None, projection: dict = None, batch_size: int = 100
+    ) -> AsyncIterator[dict]:
+        """מעבר על כל השירותים כ-stream (בלי לטעון הכל לזיכרון ובלי תקרה)"""
+        cursor = self.db.services.find(self._owner_query(owner_id), projection, batch_size=batch_size)
+        async for service in cursor:
+            yield service
+    
+    @_timed
+    async def get_services(self, owner_id: int = None, projection: dict = None):
+        """קבלת רשימת שירותים (כולם)"""
+        return [service async for service in self.iter_services(owner_id, projection)]
+    
+    @_timed
+    async def get_services_page(
+        self,
+        owner_id: int = None,
+        after: str = None,
+        before: str = None,
+        limit: int = 20,
+        projection: dict = MENU_PROJECTION,
+    ) -> Tuple[List[dict], bool, bool]:
+        """
+        עמוד שירותים בדפדוף keyset לפי (name, service_id).
+        after/before הם service_id של השירות האחרון/הראשון בעמוד הקודם.
+        מחזיר (services, has_prev, has_next).
+        """
+        query = self._owner_query(owner_id)
+        anchor_id = after or before
+        anchor = None
+        if anchor_id:
+            anchor = await self.db.services.find_one({"service_id": anchor_id}, {"_id": 0, "name": 1, "service_id": 1})
+        
+        if anchor:
+            op = "$gt" if after else "$lt"
+            name = anchor.get("name")
+            query = {"$and": [query, {"$or": [
+                {"name": {op: name}},
+                {"name": name, "service_id": {op: anchor["service_id"]}},
+            ]}]}
+        
+        backwards = bool(anchor and before)
+        sort = [(field, DESCENDING) for field, _ in PAGE_SORT] if backwards else PAGE_SORT
+        
+        cursor = self.db.services.find(query, projection).sort(sort).limit(limit + 1)
+        services = await cursor.to_list(length=limit + 1)
+        has_more = len(services) > limit
+        services = services[:limit]
+        
+        if backwards:
+            services.reverse()
+            return services, has_more, True
+        return services, bool(anchor), has_more
+    
+    @_timed
+    async def get_services_by_ids(self, service_ids: List[str], projection: dict = None) -> List[dict]:
+        """השירותים מתוך רשימת מזהים (שאילתה אחת עם $in)"""
+        if not service_ids:
+            return []
+        cursor = self.db.services.find({"service_id": {"$in": list(service_ids)}}, projection)
+        return await cursor.to_list(length=len(service_ids))
+    
+    @_timed
     async def get_service(self, service_id: str):
         """קבלת שירות ספציפי"""
         return await self.db.services.find_one({"service_id": service_id})
     
+    @_timed
     async def update_service_status(self, service_id: str, status: str):
-        """עדכון סטטוס שירות"""
+        """עדכון סטטוס שירות (status_changed_at מתעדכן רק אם הסטטוס באמת השתנה)"""
         await self.db.services.update_one(
-            {"service_id": service_id},
-            {"$set": {"status": status}}
+            {"service_id": service_id, "status": {"$ne": status}},
+            {"$set": {"status": status, "status_changed_at": datetime.datetime.now(datetime.timezone.utc)}}
         )
     
+    @_timed
+    async def bulk_update_statuses(
+        self, statuses: Dict[str, str], previous: Dict[str, str] = None
+    ) -> Dict[str, Optional[str]]:
+        """
+        עדכון סטטוסים של כמה שירותים בבקשה אחת (bulk_write לא ממוין).
+        שירות שהסטטוס שלו לא השתנה (לפי previous) לא נשלח בכלל. כל עדכון
+        מותנה בסטטוס הקודם, כך שמעבר נרשם פעם אחת בלבד גם כשכמה כותבים
+        (poller, רענון של משתמש, רפליקה אחרת) רואים אותו במקביל.
+        מחזיר {service_id: הסטטוס הקודם} של מה שהשתנה בפועל (בשביל ההתראות).
+        """
+        previous = previous or {}
+        known = {
+            service_id: status for service_id, status in statuses.items()
+            if service_id in previous and previous[service_id] != status
+        }
+        # בלי סטטוס קודם ידוע (למשל שירות בודד ממסך השירות) - עדכון אטומי שמחזיר אותו
+        unknown = [service_id for service_id in statuses if service_id not in previous]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        changed: Dict[str, Optional[str]] = {}
+
+        if known:
+            write_id = ObjectId()
+            result = await self.db.services.bulk_write([
+                UpdateOne(
+                    {"service_id": service_id, "status": previous[service_id]},
+                    {"$set": {"status": status, "status_changed_at": now, "status_write_id": write_id}},
+                )
+                for service_id, status in known.items()
+            ], ordered=False)
+            if result.modified_count == len(known):
+                changed.update((service_id, previous[service_id]) for service_id in known)
+            else:
+                # חלק מהמסמכים כבר לא היו בסטטוס הקודם (כותב אחר הקדים) - מי נכתב כאן לפי write_id,
+                # והשאר עוברים לעדכון האטומי
+                if result.modified_count:
+                    async for doc in self.db.services.find(
+                        {"service_id": {"$in": list(known)}, "status_write_id": write_id}, {"service_id": 1}
+                    ):
+                        changed[doc["service_id"]] = previous[doc["service_id"]]
+                unknown.extend(service_id for service_id in known if service_id not in changed)
+
+        for service_id in unknown:
+            doc = await self.db.services.find_one_and_update(
+                {"service_id": service_id, "status": {"$ne": statuses[service_id]}},
+                {"$set": {"status": statuses[service_id], "status_changed_at": now}},
+                projection={"status": 1},
+            )
+            if doc is not None:
+                changed[service_id] = doc.get("status")
+        return changed
+    
+    @_timed
     async def delete_service(self, service_id: str):
         """מחיקת שירות"""
         result = await self.db.services.delete_one({"service_id": service_id})
         return result.deleted_count > 0
     
-    async def log_action(self, service_id: str, action: str, user_id: int, success: bool, message: str = None):
-        """שמירת לוג של פעולה"""
-        log = {
+    @_timed
+    async def save_deploys(self, deploys: List[dict]) -> int:
+        """upsert של פריסות לפי deploy_id (bulk אחד); פריסה קיימת מתעדכנת בסטטוס החדש"""
+        if not deploys:
+            return 0
+        ops = [UpdateOne({"deploy_id": d["deploy_id"]}, {"$set": d}, upsert=True) for d in deploys]
+        result = await self.db.deploys.bulk_write(ops, ordered=False)
+        return result.upserted_count + result.modified_count
+    
+    @_timed
+    async def save_events(self, events: List[dict]) -> int:
+        """אירועים לא משתנים - רק נוספים (upsert כדי שסנכרון חוזר לא ייצור כפילויות)"""
+        if not events:
+            return 0
+        ops = [UpdateOne({"event_id": e["event_id"]}, {"$setOnInsert": e}, upsert=True) for e in events]
+        result = await self.db.events.bulk_write(ops, ordered=False)
+        return result.upserted_count
+    
+    @_timed
+    async def get_deploys(self, service_id: str, limit: int = 10) -> List[dict]:
+        """הפריסות האחרונות של שירות (אינדקס service_id+created_at)"""
+        cursor = (
+            self.db.deploys.find({"service_id": service_id}, {"_id": 0})
+            .sort([("service_id", ASCENDING), ("created_at", DESCENDING)])
+            .limit(limit)
+        )
+        return await cursor.to_list(length=limit)
+    
+    @_timed
+    async def get_events(self, service_id: str, limit: int = 10) -> List[dict]:
+        """האירועים האחרונים של שירות (אינדקס service_id+timestamp)"""
+        cursor = (
+            self.db.events.find({"service_id": service_id}, {"_id": 0})
+            .sort([("service_id", ASCENDING), ("timestamp", DESCENDING)])
+            .limit(limit)
+        )
+        return await cursor.to_list(length=limit)
+    
+    @_timed
+    async def update_deploy_state(self, service_id: str, fields: dict) -> Optional[dict]:
+        """
+        שמירת מצב הסנכרון על מסמך השירות (deploy_status, high-water marks).
+        מחזיר את status/deploy_status שהיו לפני הכתיבה (None אם השירות לא קיים).
+        """
+        return await self.db.services.find_one_and_update(
+            {"service_id": service_id}, {"$set": fields},
+            projection={"_id": 0, "status": 1, "deploy_status": 1},
+        )
+    
+    @_timed
+    async def set_schedule(self, schedule: dict):
+        """שמירת לוח הזמנים של שירות (מחליף את הקודם, אם היה)"""
+        schedule = {**schedule, "updated_at": datetime.datetime.now(datetime.timezone.utc)}
+        await self.db.schedules.update_one(
+            {"service_id": schedule["service_id"]}, {"$set": schedule}, upsert=True
+        )
+    
+    @_timed
+    async def get_schedules(self, user_id: int = None) -> List[dict]:
+        """כל לוחות הזמנים (או רק אלה שמשתמש הגדיר)"""
+        query = {"user_id": user_id} if user_id is not None else {}
+        return await self.db.schedules.find(query, {"_id": 0}).to_list(length=None)
+    
+    @_timed
+    async def delete_schedule(self, service_id: str) -> bool:
+        result = await self.db.schedules.delete_one({"service_id": service_id})
+        return result.deleted_count > 0
+    
+    @_timed
+    async def set_idle_threshold(self, service_id: str, seconds: float = None, user_id: int = None) -> bool:
+        """
+        סף השעיה אוטומטית לשירות רדום (None = ביטול).
+        idle_since מתחיל את הספירה מעכשיו, כדי ששירות לא יושעה מיד עם ההגדרה.
+        """
+        if seconds is None:
+            update = {"$unset": {"idle_after": "", "idle_set_by": "", "idle_since": ""}}
+        else:
+            update = {"$set": {
+                "idle_after": seconds,
+                "idle_set_by": user_id,
+                "idle_since": datetime.datetime.now(datetime.timezone.utc),
+            }}
+        result = await self.db.services.update_one({"service_id": service_id}, update)
+        return result.matched_count > 0
+    
+    @_timed
+    async def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """
+        תפיסה או חידוש של lease (מנהיג / נעילה משותפת) ל-ttl שניות.
+        מצליח אם ה-lease פנוי, פג תוקפו או כבר שלנו; אחרת upsert נתקל ב-_id קיים.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            await self.db.leases.find_one_and_update(
+                {"_id": name, "$or": [{"holder": holder}, {"expires_at": {"$lt": now}}]},
+                {"$set": {
+                    "holder": holder,
+                    "expires_at": now + datetime.timedelta(seconds=ttl),
+                    "renewed_at": now,
+                }},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+    
+    @_timed
+    async def release_lease(self, name: str, holder: str):
+        """שחרור lease - רק אם הוא עדיין שלנו"""
+        await self.db.leases.delete_one({"_id": name, "holder": holder})
+    
+    @_timed
+    async def set_heartbeat(self, name: str):
+        """"עדיין חי" של משימת רקע, לרפליקות שלא מריצות אותה (למשל הסבב האחרון של ה-poller)"""
+        await self.db.heartbeats.update_one(
+            {"_id": name},
+            {"$set": {"at": datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True,
+        )
+    
+    @_timed
+    async def get_heartbeat(self, name: str) -> Optional[datetime.datetime]:
+        doc = await self.db.heartbeats.find_one({"_id": name})
+        if doc is None:
+            return None
+        return aware(doc["at"])
+    
+    @staticmethod
+    def _action_log(service_id: str, action: str, user_id: int, success: bool, message: str = None) -> dict:
+        return {
             "service_id": service_id,
             "action": action,
             "user_id": user_id,
             "success": success,
             "message": message,
-            "timestamp": None  # MongoDB יוסיף timestamp אוטומטי
+            # זמן הפעולה עצמה (לא זמן הכתיבה, שעלולה להתעכב בתור)
+            "timestamp": datetime.datetime.now(datetime.timezone.utc),
         }
-        await self.db.logs.insert_one(log)
+    
+    @_timed
+    async def log_action(self, service_id: str, action: str, user_id: int, success: bool, message: str = None):
+        """שמירת לוג של פעולה (ישירות; בבוט עצמו עדיף action_log.action_logger)"""
+        await self.db.logs.insert_one(self._action_log(service_id, action, user_id, success, message))
+    
+    @_timed
+    async def log_actions(self, logs: List[dict]):
+        """שמירת כמה לוגים בבקשה אחת (insert_many לא ממוין)"""
+        if logs:
+            await self.db.logs.insert_many(logs, ordered=False)
+    
+    @_timed
+    async def get_action_history(self, service_id: str, limit: int = 20) -> List[dict]:
+        """הפעולות האחרונות על שירות (אינדקס service_id+timestamp, בלי מיון בזיכרון)"""
+        cursor = (
+            self.db.logs.find({"service_id": service_id}, {"_id": 0})
+            .sort([("service_id", ASCENDING), ("timestamp", DESCENDING)])
+            .limit(limit)
+        )
+        return await cursor.to_list(length=limit)
 
 # אובייקט גלובלי
 db = Database()
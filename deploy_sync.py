@@ -0,0 +1,232 @@
+"""
+סנכרון אינקרמנטלי של פריסות ואירועים מ-Render.
+
+על מסמך השירות נשמר high-water mark: ה-updatedAt הגבוה ביותר של פריסה שכבר
+ראינו, וה-timestamp של האירוע האחרון. כל סנכרון מבקש מ-Render רק מה שנוצר או
+השתנה מאז (updatedAfter / startTime), כך שבמצב יציב זו בקשה אחת עם תשובה ריקה.
+המסכים עצמם קוראים רק מהמסד.
+"""
+import asyncio
+import datetime
+import logging
+from typing import Any, Dict, List, Optional
+
+import config
+from database import db
+from render_api import render_api
+from resilience import AccountLimiter
+from status_alerts import status_alerts
+from structured_logging import bind
+from timeutil import aware, parse_time
+
+logger = logging.getLogger(__name__)
+
+# סטטוסי פריסה של Render -> מצב למסך
+IN_PROGRESS = {"created", "build_in_progress", "update_in_progress", "pre_deploy_in_progress"}
+FAILED = {"build_failed", "update_failed", "pre_deploy_failed"}
+LIVE = {"live"}
+
+# אירועים שמעידים שמישהו עובד על השירות (לזיהוי שירות רדום)
+ACTIVITY_EVENTS = {"build_started", "build_ended", "deploy_started", "deploy_ended", "service_resumed"}
+
+
+def deploy_state(render_status: Optional[str]) -> Optional[str]:
+    """deploying / failed / live, או None לסטטוס שלא משנה את מצב השירות (canceled, deactivated)"""
+    if render_status in IN_PROGRESS:
+        return "deploying"
+    if render_status in FAILED:
+        return "failed"
+    if render_status in LIVE:
+        return "live"
+    return None
+
+
+def display_status(service: Dict[str, Any]) -> str:
+    """הסטטוס שמוצג: שירות פעיל עם פריסה בתהליך או שנכשלה מוצג כ-deploying/failed"""
+    status = service.get("status") or "unknown"
+    if status == "active" and service.get("deploy_status") in ("deploying", "failed"):
+        return service["deploy_status"]
+    return status
+
+
+def _deploy_doc(service_id: str, deploy: Dict[str, Any]) -> Dict[str, Any]:
+    commit = deploy.get("commit") or {}
+    return {
+        "deploy_id": deploy["id"],
+        "service_id": service_id,
+        "status": deploy.get("status"),
+        "trigger": deploy.get("trigger"),
+        "commit_id": commit.get("id"),
+        "commit_message": (commit.get("message") or "").split("\n", 1)[0][:200],
+        "created_at": parse_time(deploy.get("createdAt")),
+        "updated_at": parse_time(deploy.get("updatedAt")),
+        "finished_at": parse_time(deploy.get("finishedAt")),
+    }
+
+
+def _event_doc(service_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "event_id": event["id"],
+        "service_id": service_id,
+        "type": event.get("type"),
+        "timestamp": parse_time(event.get("timestamp")),
+        "details": event.get("details") or {},
+    }
+
+
+class DeploySync:
+    def __init__(
+        self,
+        api=render_api,
+        database=db,
+        interval: float = None,
+        max_per_cycle: int = None,
+        concurrency: int = None,
+        alerts=status_alerts,
+    ):
+        self.api = api
+        self.db = database
+        self.alerts = alerts
+        self.interval = config.DEPLOY_SYNC_INTERVAL if interval is None else interval
+        self.max_per_cycle = max_per_cycle or config.DEPLOY_SYNC_MAX_PER_CYCLE
+        self.concurrency = concurrency or config.DEPLOY_SYNC_CONCURRENCY
+
+    def due(self, services: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        השירותים שצריך לסנכרן בסבב הזה: קודם מה שבפריסה, אחר כך מה שלא סונכרן
+        מעולם, ואז הוותיקים ביותר - עד max_per_cycle. שירות מושעה לא נפרס.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        candidates = []
+        for service in services:
+            if service.get("status") == "suspended":
+                continue
+            synced_at = aware(service.get("deploys_synced_at"))
+            if service.get("deploy_status") == "deploying":
+                priority = 0
+            elif synced_at is None:
+                priority = 1
+            elif (now - synced_at).total_seconds() >= self.interval:
+                priority = 2
+            else:
+                continue
+            candidates.append((priority, synced_at or now, service))
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        return [service for _, _, service in candidates[:self.max_per_cycle]]
+
+    async def sync_deploys(self, service: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        משיכת הפריסות שנוצרו/השתנו מאז ה-high-water mark ושמירתן.
+        בסנכרון ראשון נמשך רק העמוד האחרון, לא כל ההיסטוריה.
+        מעדכן את service במקום. אם מצב הפריסה השתנה מחזיר את השינוי
+        ({"service": doc, "old": סטטוס מוצג, "new": סטטוס מוצג}) ומתריע על
+        פריסה שנכשלה, לא משנה מי קרא לסנכרון. זורק RenderAPIError.
+        """
+        service_id = service["service_id"]
+        hwm = service.get("deploys_hwm")
+        deploys = []
+        new_hwm = hwm
+        async for deploy in self.api.list_deploys(
+            service_id, account=service.get("account"), updated_after=hwm, max_pages=5 if hwm else 1
+        ):
+            deploys.append(_deploy_doc(service_id, deploy))
+            updated = deploy.get("updatedAt") or deploy.get("createdAt")
+            if updated and (new_hwm is None or parse_time(updated) > parse_time(new_hwm)):
+                new_hwm = updated
+
+        fields = {"deploys_synced_at": datetime.datetime.now(datetime.timezone.utc)}
+        if deploys:
+            await self.db.save_deploys(deploys)
+            fields["deploys_hwm"] = new_hwm
+            # המצב נקבע לפי הפריסה החדשה ביותר שמשנה מצב (גם אם היא לא חלק מהעדכון)
+            state = None
+            for deploy in await self.db.get_deploys(service_id, limit=5):
+                state = deploy_state(deploy.get("status"))
+                if state:
+                    break
+            if state:
+                fields["deploy_status"] = state
+
+        # ההשוואה מול מה שהיה במסד ברגע הכתיבה - סנכרון מקביל לא יתריע פעם שנייה
+        before = await self.db.update_deploy_state(service_id, fields)
+        service.update(fields)
+        if before is None or before.get("deploy_status") == service.get("deploy_status"):
+            return None
+        change = {"service": service, "old": display_status(before), "new": display_status(service)}
+        if service.get("deploy_status") == "failed":
+            self.alerts.notify([change])
+        return change
+
+    async def sync_events(self, service: Dict[str, Any]) -> int:
+        """
+        משיכת אירועים חדשים מאז האירוע האחרון ששמרנו. זורק RenderAPIError.
+        האירוע האחרון מתוך ACTIVITY_EVENTS נשמר כ-last_activity_event_at.
+        """
+        service_id = service["service_id"]
+        hwm = service.get("events_hwm")
+        events = []
+        new_hwm = hwm
+        activity = None
+        async for event in self.api.list_events(
+            service_id, account=service.get("account"), start_time=hwm, max_pages=5 if hwm else 1
+        ):
+            events.append(_event_doc(service_id, event))
+            timestamp = event.get("timestamp")
+            if timestamp and (new_hwm is None or parse_time(timestamp) > parse_time(new_hwm)):
+                new_hwm = timestamp
+            at = parse_time(timestamp)
+            if event.get("type") in ACTIVITY_EVENTS and at and (activity is None or at > activity):
+                activity = at
+        if not events:
+            return 0
+        saved = await self.db.save_events(events)
+        # startTime כולל את האירוע שבגבול, כך שהוא חוזר בכל סנכרון - אין מה לעדכן
+        if new_hwm != hwm:
+            fields = {"events_hwm": new_hwm}
+            if activity:
+                fields["last_activity_event_at"] = activity
+            await self.db.update_deploy_state(service_id, fields)
+            service.update(fields)
+        return saved
+
+    async def sync(self, services: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        סבב סנכרון (נקרא מה-poller). מחזיר את השינויים במצב הפריסה
+        (ראו sync_deploys).
+        המקביליות מוגבלת לכל חשבון בנפרד - לכל חשבון מכסת API משלו.
+        """
+        limiter = AccountLimiter(self.concurrency)
+        changes = []
+
+        async def sync_one(service):
+            bind(service_id=service["service_id"])
+            async with limiter(self.api.account_of(service)):
+                try:
+                    change = await self.sync_deploys(service)
+                except Exception as e:
+                    logger.warning("⚠️ סנכרון פריסות נכשל: %s", e)
+                    return
+            if change:
+                changes.append(change)
+
+        await asyncio.gather(*(sync_one(s) for s in self.due(services)))
+        return changes
+
+    async def sync_service(self, service_id: str) -> Optional[Dict[str, Any]]:
+        """
+        סנכרון אינקרמנטלי לשירות אחד לפני הצגת ההיסטוריה (פריסות + אירועים).
+        אם Render לא זמין מוצג מה שכבר שמור במסד.
+        """
+        service = await self.db.get_service(service_id)
+        if not service:
+            return None
+        try:
+            await self.sync_deploys(service)
+            await self.sync_events(service)
+        except Exception as e:
+            logger.warning("⚠️ סנכרון היסטוריית פריסות נכשל: %s", e)
+        return service
+
+
+# אובייקט גלובלי
+deploy_sync = DeploySync()
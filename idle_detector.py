@@ -0,0 +1,160 @@
+"""
+השעיה אוטומטית של שירותים רדומים.
+
+לשירות שהוגדר לו סף (/idle, השדה idle_after בשניות) נאספים שני סימני פעילות:
+אירועי build/deploy/resume (דרך deploy_sync.sync_events, מאז events_hwm)
+ובקשות HTTP מ-Render Metrics API (מאז requests_hwm). שני הסימנים נאספים
+אינקרמנטלית - כל בדיקה מושכת רק את מה שנוסף מאז הקודמת - ולא יותר מפעם
+ב-IDLE_CHECK_INTERVAL לכל שירות, כך שהעלות לא גדלה עם ההיסטוריה.
+שירות פעיל שלא היה בו שום סימן פעילות מעבר לסף מושעה, והבעלים מקבלים התראה
+(דרך ה-poller).
+"""
+import asyncio
+import datetime
+import logging
+from typing import Any, Dict, List, Optional
+
+import config
+from batch_actions import batch_executor
+from database import db
+from deploy_sync import deploy_sync
+from render_api import render_api
+from resilience import AccountLimiter
+from structured_logging import bind
+from timeutil import aware, parse_time
+
+logger = logging.getLogger(__name__)
+
+REQUESTS_METRIC = "http-requests"
+
+# השדות במסמך השירות שכל אחד מהם מסמן פעילות
+ACTIVITY_FIELDS = ("last_request_at", "last_activity_event_at", "status_changed_at", "idle_since")
+
+
+def last_activity(service: Dict[str, Any]) -> Optional[datetime.datetime]:
+    """סימן הפעילות האחרון שידוע על השירות"""
+    times = [aware(service.get(field)) for field in ACTIVITY_FIELDS]
+    times = [t for t in times if t is not None]
+    return max(times) if times else None
+
+
+class IdleDetector:
+    def __init__(
+        self,
+        api=render_api,
+        database=db,
+        executor=batch_executor,
+        deploys=deploy_sync,
+        interval: float = None,
+        max_per_cycle: int = None,
+        concurrency: int = None,
+    ):
+        self.api = api
+        self.db = database
+        self.executor = executor
+        self.deploys = deploys
+        self.interval = config.IDLE_CHECK_INTERVAL if interval is None else interval
+        self.max_per_cycle = max_per_cycle or config.IDLE_MAX_PER_CYCLE
+        self.concurrency = concurrency or config.IDLE_CHECK_CONCURRENCY
+        self.suspended = 0
+
+    def due(self, services: List[Dict[str, Any]], now: datetime.datetime) -> List[Dict[str, Any]]:
+        """שירותים פעילים עם סף שלא נבדקו ב-interval האחרון, הוותיקים ביותר קודם"""
+        candidates = []
+        for service in services:
+            if not service.get("idle_after") or service.get("status") != "active":
+                continue
+            if service.get("deploy_status") == "deploying":
+                continue
+            checked_at = aware(service.get("requests_hwm"))
+            if checked_at is not None and (now - checked_at).total_seconds() < self.interval:
+                continue
+            candidates.append((checked_at or datetime.datetime.min.replace(tzinfo=datetime.timezone.utc), service))
+        candidates.sort(key=lambda c: c[0])
+        return [service for _, service in candidates[:self.max_per_cycle]]
+
+    async def collect_requests(self, service: Dict[str, Any], now: datetime.datetime):
+        """
+        בקשות HTTP מאז requests_hwm (בבדיקה הראשונה - חלון באורך הסף).
+        שומר last_request_at (הנקודה האחרונה עם בקשות) ו-requests_hwm=now. זורק RenderAPIError.
+        """
+        service_id = service["service_id"]
+        hwm = aware(service.get("requests_hwm"))
+        start = hwm or now - datetime.timedelta(seconds=service["idle_after"])
+        span = max((now - start).total_seconds(), 60)
+        # מספיק לדעת מתי הייתה הבקשה האחרונה, לא את הצורה של הסדרה
+        resolution = int(min(3600, max(60, span // 20)))
+        if hwm is not None:
+            # הנקודה שבגבול החלון הקודם עוד לא הייתה שלמה כשנשלפה - מתחילים צעד אחד לפניה
+            start = hwm - datetime.timedelta(seconds=resolution)
+        series = await self.api.get_metrics(
+            REQUESTS_METRIC,
+            service_id,
+            account=service.get("account"),
+            start_time=start.isoformat(),
+            end_time=now.isoformat(),
+            resolution=resolution,
+        )
+        latest = None
+        for item in series:
+            for point in item.get("values") or ():
+                at = parse_time(point.get("timestamp"))
+                if at and point.get("value") and (latest is None or at > latest):
+                    latest = at
+
+        fields = {"requests_hwm": now}
+        if latest and (service.get("last_request_at") is None or latest > aware(service["last_request_at"])):
+            fields["last_request_at"] = latest
+        await self.db.update_deploy_state(service_id, fields)
+        service.update(fields)
+
+    async def _collect(self, service: Dict[str, Any], now: datetime.datetime) -> bool:
+        bind(service_id=service["service_id"])
+        try:
+            await self.deploys.sync_events(service)
+            await self.collect_requests(service, now)
+        except Exception as e:
+            # בלי נתונים עדכניים לא משעים
+            logger.warning("⚠️ איסוף סימני פעילות נכשל: %s", e)
+            return False
+        return True
+
+    async def check(self, services: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        סבב בדיקה (נקרא מה-poller). מחזיר את השירותים שהושעו בסבב הזה.
+        האיסוף מוגבל במקביליות לכל חשבון Render בנפרד.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        candidates = self.due(services, now)
+        if not candidates:
+            return []
+
+        limiter = AccountLimiter(self.concurrency)
+
+        async def collect_one(service):
+            async with limiter(self.api.account_of(service)):
+                return await self._collect(service, now)
+
+        collected = await asyncio.gather(*(collect_one(s) for s in candidates))
+        idle = [
+            service for service, ok in zip(candidates, collected)
+            if ok and (now - (last_activity(service) or now)).total_seconds() >= service["idle_after"]
+        ]
+        if not idle:
+            return []
+
+        # הלוג נרשם על שם מי שהגדיר את הסף
+        by_user: Dict[Any, List[Dict[str, Any]]] = {}
+        for service in idle:
+            by_user.setdefault(service.get("idle_set_by"), []).append(service)
+        suspended = []
+        for user_id, group in by_user.items():
+            result = await self.executor.run(group, "suspend", user_id)
+            suspended.extend(s for s in group if s.get("status") == "suspended")
+            self.suspended += result.succeeded
+        logger.info("💤 %s שירותים רדומים הושעו", len(suspended))
+        return suspended
+
+
+# אובייקט גלובלי
+idle_detector = IdleDetector()
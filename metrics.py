@@ -0,0 +1,209 @@
+"""
+מטריקות בפורמט הטקסט של Prometheus, בלי תלות חיצונית.
+השכבה עוטפת את הבקשות ל-Render, את פעולות המסד ואת ה-handlers של הבוט,
+ומוגשת ב-/metrics גם משרת ה-health וגם מאפליקציית ה-webhook.
+"""
+import bisect
+import functools
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+# שניות; מכסה גם פעולת מונגו מהירה וגם בקשה ל-Render עם ניסיונות חוזרים
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, object] = {}
+        # שרת ה-health במצב polling רץ ב-thread נפרד וקורא את הערכים
+        self._lock = threading.Lock()
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        # לכל סדרה: ספירה לכל bucket (לא מצטברת) + sum + count
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._values.get(labels)
+        return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        lines = []
+        bucket_names = self.labelnames + ("le",)
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(bucket_names, labels + (_format_value(bound),))} {cumulative}"
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def _add(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def instrument(
+    histogram: Histogram,
+    errors: Counter = None,
+    in_flight: Gauge = None,
+    label: Union[str, Callable[..., str], None] = None,
+):
+    """
+    decorator לפונקציה async: משך הקריאה, שגיאות לפי סוג וקריאות שבטיסה.
+    label: מחרוזת קבועה, פונקציה שמקבלת את הארגומנטים של הקריאה, או None לשם הפונקציה.
+    """
+    def decorator(func):
+        static_label = label or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            name = label(*args, **kwargs) if callable(label) else static_label
+            if in_flight is not None:
+                in_flight.inc(name)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if errors is not None:
+                    errors.inc(name, type(e).__name__)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, name)
+                if in_flight is not None:
+                    in_flight.dec(name)
+
+        return wrapper
+
+    return decorator
+
+
+# אובייקט גלובלי
+registry = MetricsRegistry()
+
+RENDER_REQUEST_SECONDS = registry.histogram(
+    "render_request_seconds", "Render API request latency including retries", ("endpoint",)
+)
+RENDER_ERRORS = registry.counter(
+    "render_request_errors_total", "Failed Render API requests by error type", ("endpoint", "error")
+)
+RENDER_IN_FLIGHT = registry.gauge(
+    "render_requests_in_flight", "Render API requests currently in flight", ("endpoint",)
+)
+
+MONGO_OPERATION_SECONDS = registry.histogram(
+    "mongo_operation_seconds", "MongoDB operation latency", ("operation",)
+)
+MONGO_ERRORS = registry.counter(
+    "mongo_operation_errors_total", "Failed MongoDB operations by error type", ("operation", "error")
+)
+MONGO_IN_FLIGHT = registry.gauge(
+    "mongo_operations_in_flight", "MongoDB operations currently in flight", ("operation",)
+)
+
+HANDLER_SECONDS = registry.histogram(
+    "bot_handler_seconds", "Telegram handler duration per command or callback", ("handler",)
+)
+HANDLER_ERRORS = registry.counter(
+    "bot_handler_errors_total", "Telegram handler failures by error type", ("handler", "error")
+)
+HANDLER_IN_FLIGHT = registry.gauge(
+    "bot_handlers_in_flight", "Telegram handlers currently running", ("handler",)
+)
+
+LEADER = registry.gauge(
+    "bot_is_leader", "1 if this replica holds the leader lease (polling and background jobs)"
+)
@@ -0,0 +1,210 @@
+"""
+מיגרציות סכמה עם גרסאות: כל מיגרציה רצה פעם אחת ונרשמת באוסף migrations
+"""
+import datetime
+import logging
+from typing import Awaitable, Callable, List, NamedTuple, Set
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[..., Awaitable[None]]
+
+
+async def _base_indexes(db):
+    await db.services.create_index("service_id", unique=True)
+    await db.services.create_index("owners")
+
+
+async def _backfill_owners(db):
+    # אם יש owner_id אבל אין owners, ניצור owners=[owner_id]
+    # (כדי לאפשר לכמה אדמינים לראות את אותו השירות בלי "לדרוס" בעלות)
+    await db.services.update_many(
+        {"owner_id": {"$exists": True}, "owners": {"$exists": False}},
+        [{"$set": {"owners": ["$owner_id"]}}],
+    )
+
+
+async def _owners_name_index(db):
+    # השאילתה החמה: owners=X ממוין לפי (name, service_id) - סריקת אינדקס אחת בלי מיון בזיכרון
+    await db.services.create_index(
+        [("owners", ASCENDING), ("name", ASCENDING), ("service_id", ASCENDING)],
+        name="owners_name_service_id",
+    )
+    # אחרי ה-backfill כבר לא שואלים על owner_id
+    try:
+        await db.services.drop_index("owner_id_1")
+    except OperationFailure:
+        pass
+
+
+def _log_retention_seconds() -> int:
+    return int(config.ACTION_LOG_RETENTION_DAYS * 86400)
+
+
+async def _logs_indexes(db):
+    # לוגים ישנים נשמרו עם timestamp=None - משחזרים את הזמן מה-ObjectId
+    await db.logs.update_many(
+        {"timestamp": None},
+        [{"$set": {"timestamp": {"$toDate": "$_id"}}}],
+    )
+    # /history: הפעולות האחרונות של שירות בלי מיון בזיכרון
+    await db.logs.create_index(
+        [("service_id", ASCENDING), ("timestamp", DESCENDING)],
+        name="service_id_timestamp",
+    )
+    # מחיקה אוטומטית של לוגים ישנים (שינוי של ההגדרה מוחל ב-sync_log_retention)
+    await db.logs.create_index(
+        "timestamp",
+        name=LOG_TTL_INDEX,
+        expireAfterSeconds=_log_retention_seconds(),
+    )
+
+
+async def _deploys_indexes(db):
+    await db.deploys.create_index("deploy_id", unique=True)
+    await db.deploys.create_index(
+        [("service_id", ASCENDING), ("created_at", DESCENDING)],
+        name="service_id_created_at",
+    )
+    await db.events.create_index("event_id", unique=True)
+    await db.events.create_index(
+        [("service_id", ASCENDING), ("timestamp", DESCENDING)],
+        name="service_id_timestamp",
+    )
+
+
+async def _schedules_indexes(db):
+    # לוח זמנים אחד לכל שירות
+    await db.schedules.create_index("service_id", unique=True)
+
+
+async def _leases_ttl(db):
+    # leases (מנהיג + נעילות משותפות) שפג תוקפם נמחקים; עד אז אפשר "לגנוב" אותם
+    await db.leases.create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+
+
+async def _service_handles(db):
+    # handle קבוע לכל שירות (בכפתורים), כך שכפתור ישן עובד גם אחרי הפעלה מחדש או מעבר לרפליקה אחרת
+    missing = [doc["_id"] async for doc in db.services.find({"handle": {"$exists": False}}, {"_id": 1})]
+    if missing:
+        counter = await db.counters.find_one_and_update(
+            {"_id": HANDLE_COUNTER},
+            {"$inc": {"seq": len(missing)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        first = counter["seq"] - len(missing)
+        await db.services.bulk_write(
+            [UpdateOne({"_id": _id}, {"$set": {"handle": first + i}}) for i, _id in enumerate(missing)],
+            ordered=False,
+        )
+    await db.services.create_index(
+        "handle", name="handle", unique=True, partialFilterExpression={"handle": {"$exists": True}}
+    )
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "base_indexes", _base_indexes),
+    Migration(2, "backfill_owners", _backfill_owners),
+    Migration(3, "owners_name_index", _owners_name_index),
+    Migration(4, "logs_indexes", _logs_indexes),
+    Migration(5, "deploys_indexes", _deploys_indexes),
+    Migration(6, "schedules_indexes", _schedules_indexes),
+    Migration(7, "leases_ttl", _leases_ttl),
+    Migration(8, "service_handles", _service_handles),
+]
+
+# המונה של handles הקבועים באוסף counters
+HANDLE_COUNTER = "service_handle"
+
+# אינדקס ה-TTL של הלוגים (נוצר במיגרציה 4)
+LOG_TTL_INDEX = "timestamp_ttl"
+
+# מהגרסה הזו כל השירותים מחזיקים owners ואפשר לוותר על $or עם owner_id
+OWNERS_MIGRATION = 2
+
+LATEST_VERSION = max(m.version for m in MIGRATIONS)
+
+# אחרי כמה שניות מיגרציה "תקועה" במצב running נחשבת נטושה
+LOCK_TIMEOUT = 600
+
+
+async def applied_versions(db) -> Set[int]:
+    cursor = db.migrations.find({"state": "applied"}, {"_id": 1})
+    return {doc["_id"] async for doc in cursor}
+
+
+async def run_migrations(db, migrations: List[Migration] = None, applied: Set[int] = None) -> Set[int]:
+    """
+    הרצת המיגרציות שטרם רצו, לפי הסדר. מחזיר את הגרסאות שהוחלו.
+    כל מיגרציה "נתפסת" ב-insert עם _id=version, כך שכמה מופעים לא יריצו אותה יחד.
+    applied (אם הועבר) מתעדכן תוך כדי, כך שגם אחרי כישלון באמצע ידוע מה כבר הוחל.
+    """
+    migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+    if applied is None:
+        applied = await applied_versions(db)
+
+    for migration in migrations:
+        if migration.version in applied:
+            continue
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            await db.migrations.insert_one({
+                "_id": migration.version,
+                "name": migration.name,
+                "state": "running",
+                "started_at": now,
+            })
+        except DuplicateKeyError:
+            # מופע אחר מריץ אותה כרגע. אם ה"תפיסה" ישנה (המופע נפל באמצע) - לוקחים אותה
+            stale = await db.migrations.update_one(
+                {
+                    "_id": migration.version,
+                    "state": "running",
+                    "started_at": {"$lt": now - datetime.timedelta(seconds=LOCK_TIMEOUT)},
+                },
+                {"$set": {"started_at": now}},
+            )
+            if not stale.modified_count:
+                # לא ממשיכים למיגרציות שאולי תלויות בה
+                logger.info("⏳ מיגרציה %s (%s) כבר בטיפול", migration.version, migration.name)
+                break
+
+        try:
+            await migration.apply(db)
+        except Exception:
+            # שחרור ה"תפיסה" כדי שהמיגרציה תנסה שוב בעלייה הבאה
+            await db.migrations.delete_one({"_id": migration.version})
+            raise
+
+        await db.migrations.update_one(
+            {"_id": migration.version},
+            {"$set": {"state": "applied", "applied_at": datetime.datetime.now(datetime.timezone.utc)}},
+        )
+        applied.add(migration.version)
+        logger.info("✅ מיגרציה %s (%s) הוחלה", migration.version, migration.name)
+
+    return applied
+
+
+async def sync_log_retention(db) -> bool:
+    """
+    התאמת אינדקס ה-TTL של הלוגים ל-ACTION_LOG_RETENTION_DAYS. התוקף נקבע
+    ביצירת האינדקס, כך ששינוי ההגדרה אחר כך מוחל ב-collMod. מחזיר True אם עודכן.
+    """
+    expire = _log_retention_seconds()
+    index = (await db.logs.index_information()).get(LOG_TTL_INDEX)
+    if index is None or index.get("expireAfterSeconds") == expire:
+        return False
+    await db.command("collMod", "logs", index={"name": LOG_TTL_INDEX, "expireAfterSeconds": expire})
+    logger.info("🧹 תוקף הלוגים עודכן ל-%s ימים", config.ACTION_LOG_RETENTION_DAYS)
+    return True
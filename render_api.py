@@ -1,50 +1,305 @@
 """
 אינטראקציה עם Render API
 """
+import asyncio
+import importlib.util
+import logging
+import re
 import httpx
 import config
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, Iterable, List, Tuple
+from caching import SingleFlight
+from resilience import CircuitBreaker, TokenBucket, backoff_delay, parse_retry_after
+from metrics import RENDER_ERRORS, RENDER_IN_FLIGHT, RENDER_REQUEST_SECONDS, instrument
+from structured_logging import track_render_time
+
+logger = logging.getLogger(__name__)
+
+# קודי תשובה שכדאי לנסות שוב (עומס / תקלה זמנית בצד של Render)
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# בקשות שאפשר לשלוח שוב בלי חשש. POST (suspend/resume/restart) נשלח שוב רק
+# כשברור שלא הגיע ל-Render: שגיאת התחברות, או 429 (נדחה לפני שבוצע)
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# מזהים של Render (srv-xxx, dep-xxx, evt-xxx...) - מוחלפים כדי לקבץ breaker לפי endpoint
+_RESOURCE_ID = re.compile(r"/[a-z]{3}-[A-Za-z0-9]+")
+
+_SERVICE_ID = re.compile(r"/services/([a-z]{3}-[A-Za-z0-9]+)")
+
+
+class RenderAPIError(Exception):
+    """בקשה ל-Render נכשלה (status_code=None לשגיאת רשת)"""
+    
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RenderUnavailable(RenderAPIError):
+    """Render עמוס או לא זמין (429/5xx/רשת אחרי ניסיונות חוזרים, או breaker פתוח)"""
+
+
+def _endpoint_key(method: str, endpoint: str) -> str:
+    return f"{method} {_RESOURCE_ID.sub('/{id}', endpoint)}"
+
+
+def _log_fields(method: str, endpoint: str, error: Exception, account: str = None) -> Dict[str, Any]:
+    """שדות מובנים לשורת לוג על בקשה שנכשלה"""
+    match = _SERVICE_ID.search(endpoint)
+    return {
+        "account": account,
+        "endpoint": _endpoint_key(method, endpoint),
+        "service_id": match.group(1) if match else None,
+        "status_code": getattr(error, "status_code", None),
+        "duration_ms": getattr(error, "duration_ms", None),
+        "error": type(error).__name__,
+    }
+
+
+def _http2_available() -> bool:
+    """HTTP/2 ב-httpx דורש את החבילה h2"""
+    return importlib.util.find_spec("h2") is not None
+
 
 class RenderAPI:
-    def __init__(self):
-        self.base_url = config.RENDER_API_BASE
+    """client לחשבון Render אחד (מפתח API אחד)"""
+
+    def __init__(self, base_url: str = None, api_key: str = None, name: str = None):
+        self.name = name or config.DEFAULT_RENDER_ACCOUNT
+        self.base_url = base_url or config.RENDER_API_BASE
         self.headers = {
-            "Authorization": f"Bearer {config.RENDER_API_KEY}",
+            "Authorization": f"Bearer {api_key or config.RENDER_API_KEY}",
             "Content-Type": "application/json"
         }
+        # client משותף עם keep-alive; נוצר ב-start() (או בעצלות בבקשה הראשונה)
+        self._client: Optional[httpx.AsyncClient] = None
+        # מגבלת קצב משותפת לכל הבקשות עם אותו מפתח API
+        self.rate_limiter = TokenBucket(
+            rate=config.RENDER_RATE_LIMIT_PER_MINUTE / 60,
+            capacity=config.RENDER_RATE_LIMIT_BURST,
+        )
+        # circuit breaker לכל endpoint (למשל "GET /services/{id}")
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # single-flight: בקשת GET אחת בטיסה לכל שירות, שכל הממתינים חולקים
+        self._flight = SingleFlight()
     
-    async def _request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict[str, Any]]:
-        """בקשה כללית ל-API"""
-        url = f"{self.base_url}{endpoint}"
+    def _build_client(self) -> httpx.AsyncClient:
+        """יצירת client עם pool חיבורים לפי ההגדרות"""
+        limits = httpx.Limits(
+            max_connections=config.RENDER_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.RENDER_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=config.RENDER_HTTP_KEEPALIVE_EXPIRY,
+        )
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=config.RENDER_HTTP_TIMEOUT,
+            limits=limits,
+            http2=config.RENDER_HTTP2 and _http2_available(),
+        )
+    
+    async def start(self):
+        """פתיחת ה-client המשותף (נקרא בעליית הבוט)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+    
+    async def close(self):
+        """סגירת ה-client וכל החיבורים הפתוחים (נקרא בכיבוי הבוט)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def breaker(self, method: str, endpoint: str) -> CircuitBreaker:
+        key = _endpoint_key(method, endpoint)
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker(
+                threshold=config.RENDER_BREAKER_THRESHOLD,
+                cooldown=config.RENDER_BREAKER_COOLDOWN,
+            )
+        return self._breakers[key]
+    
+    @instrument(
+        RENDER_REQUEST_SECONDS,
+        RENDER_ERRORS,
+        RENDER_IN_FLIGHT,
+        label=lambda self, method, endpoint, **kwargs: _endpoint_key(method, endpoint),
+    )
+    @track_render_time
+    async def _send(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
+        """
+        בקשה ל-API עם הגבלת קצב, ניסיונות חוזרים ו-circuit breaker.
+        זורק RenderUnavailable כש-Render עמוס/לא זמין ו-RenderAPIError לשאר השגיאות.
+        """
+        if self._client is None or self._client.is_closed:
+            await self.start()
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        breaker = self.breaker(method, endpoint)
+        if not breaker.allow():
+            raise RenderUnavailable(f"circuit open: {_endpoint_key(method, endpoint)}")
+        trial = breaker.state == breaker.HALF_OPEN
+        try:
+            return await self._attempt(method, endpoint, breaker, **kwargs)
+        finally:
+            if trial:
+                # 429 או ביטול (למשל deadline של רענון) לא מכריעים - בלי זה ה-breaker נתקע ב-half_open
+                breaker.release_trial()
+    
+    async def _attempt(self, method: str, endpoint: str, breaker, **kwargs) -> Dict[str, Any]:
+        """הבקשה עצמה עם ניסיונות חוזרים (אחרי שה-breaker אישר אותה)"""
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire()
+            retry_after = None
             try:
-                response = await client.request(
+                response = await self._client.request(
                     method=method,
-                    url=url,
-                    headers=self.headers,
+                    url=endpoint,
                     **kwargs
                 )
-                response.raise_for_status()
+            except httpx.RequestError as e:
+                error = RenderUnavailable(f"שגיאת בקשה: {e}")
+                retryable = idempotent or isinstance(e, NOT_SENT_ERRORS)
+            else:
+                self.rate_limiter.update_from_headers(response.headers)
+                if response.is_success:
+                    breaker.record_success()
+                    # Render API מחזיר JSON
+                    if response.content:
+                        return response.json()
+                    return {}
                 
-                # Render API מחזיר JSON
-                if response.content:
-                    return response.json()
-                return {}
+                message = f"שגיאת HTTP: {response.status_code} - {response.text}"
+                if response.status_code not in RETRYABLE_STATUSES:
+                    # שגיאת לקוח (404, 401...) - Render תקין, אין טעם לנסות שוב
+                    breaker.record_success()
+                    raise RenderAPIError(message, response.status_code)
                 
-            except httpx.HTTPStatusError as e:
-                print(f"❌ שגיאת HTTP: {e.response.status_code} - {e.response.text}")
-                return None
-            except httpx.RequestError as e:
-                print(f"❌ שגיאת בקשה: {e}")
-                return None
-            except Exception as e:
-                print(f"❌ שגיאה כללית: {e}")
-                return None
+                error = RenderUnavailable(message, response.status_code)
+                retryable = idempotent or response.status_code == 429
+                retry_after = parse_retry_after(response.headers.get("retry-after"))
+                if response.status_code == 429:
+                    # עצירה משותפת לכל הבקשות עד שהמכסה מתחדשת
+                    self.rate_limiter.pause_for(
+                        retry_after if retry_after is not None
+                        else backoff_delay(attempt, config.RENDER_RETRY_BASE_DELAY, config.RENDER_RETRY_MAX_DELAY)
+                    )
+            
+            if not retryable or attempt >= config.RENDER_MAX_RETRIES:
+                if error.status_code != 429:
+                    # 429 הוא מגבלת קצב, לא סימן ש-Render לא תקין
+                    breaker.record_failure()
+                raise error
+            
+            attempt += 1
+            if retry_after is None:
+                retry_after = backoff_delay(attempt, config.RENDER_RETRY_BASE_DELAY, config.RENDER_RETRY_MAX_DELAY)
+            await asyncio.sleep(retry_after)
+    
+    async def _request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict[str, Any]]:
+        """בקשה כללית ל-API (None בכל כישלון)"""
+        try:
+            return await self._send(method, endpoint, **kwargs)
+        except RenderAPIError as e:
+            logger.warning("❌ %s", e, extra=_log_fields(method, endpoint, e, self.name))
+            return None
+        except Exception as e:
+            logger.exception("❌ שגיאה כללית: %s", e, extra=_log_fields(method, endpoint, e, self.name))
+            return None
+    
+    async def _single_flight(self, key: str, factory) -> Any:
+        """קוראים מקבילים עם אותו key חולקים בקשה אחת ואת התוצאה (או השגיאה) שלה"""
+        return await self._flight.do(key, factory)
+    
+    def singleflight_stats(self) -> Dict[str, Any]:
+        return self._flight.stats()
+    
+    async def _fetch_service(self, service_id: str) -> Dict[str, Any]:
+        """GET /services/{id} משותף לקוראים מקבילים (זורק RenderAPIError)"""
+        endpoint = f"/services/{service_id}"
+        return await self._single_flight(endpoint, lambda: self._send("GET", endpoint))
     
     async def get_service(self, service_id: str) -> Optional[Dict[str, Any]]:
         """קבלת פרטי שירות"""
-        return await self._request("GET", f"/services/{service_id}")
+        try:
+            return await self._fetch_service(service_id)
+        except RenderAPIError as e:
+            logger.warning("❌ %s", e, extra=_log_fields("GET", f"/services/{service_id}", e, self.name))
+            return None
+        except Exception as e:
+            logger.exception("❌ שגיאה כללית: %s", e, extra=_log_fields("GET", f"/services/{service_id}", e, self.name))
+            return None
+    
+    async def list_services(self, page_size: int = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        מעבר על כל השירותים בחשבון דרך GET /services עם cursor pagination.
+        מחזיר (yield) כל שירות ברגע שהעמוד שלו הגיע.
+        """
+        page_size = page_size or config.RENDER_LIST_PAGE_SIZE
+        cursor = None
+        while True:
+            params = {"limit": page_size}
+            if cursor:
+                params["cursor"] = cursor
+            page = await self._request("GET", "/services", params=params)
+            if not page:
+                return
+
+            for item in page:
+                # כל פריט בתשובה הוא {"cursor": ..., "service": {...}}
+                yield item.get("service", item)
+
+            cursor = page[-1].get("cursor")
+            if len(page) < page_size or not cursor:
+                return
+    
+    async def _paginate(self, endpoint: str, params: Dict[str, Any], item_key: str, max_pages: int):
+        """
+        מעבר על endpoint עם cursor pagination (עד max_pages עמודים).
+        בניגוד ל-list_services, שגיאה נזרקת - כדי שסנכרון לא יקדם את ה-high-water mark.
+        """
+        limit = params["limit"]
+        for _ in range(max_pages):
+            page = await self._send("GET", endpoint, params=params)
+            if not page:
+                return
+            for item in page:
+                yield item.get(item_key, item)
+            cursor = page[-1].get("cursor")
+            if len(page) < limit or not cursor:
+                return
+            params = {**params, "cursor": cursor}
+    
+    def list_deploys(self, service_id: str, updated_after: str = None, limit: int = None, max_pages: int = 5):
+        """פריסות של שירות, מהחדשה לישנה; updated_after מחזיר רק מה שנוצר/השתנה מאז"""
+        params = {"limit": limit or config.DEPLOY_SYNC_PAGE_SIZE}
+        if updated_after:
+            params["updatedAfter"] = updated_after
+        return self._paginate(f"/services/{service_id}/deploys", params, "deploy", max_pages)
+    
+    def list_events(self, service_id: str, start_time: str = None, limit: int = None, max_pages: int = 5):
+        """אירועים של שירות (deploy_started, server_failed...), מהחדש לישן"""
+        params = {"limit": limit or config.DEPLOY_SYNC_PAGE_SIZE}
+        if start_time:
+            params["startTime"] = start_time
+        return self._paginate(f"/services/{service_id}/events", params, "event", max_pages)
+    
+    async def get_metrics(
+        self, metric: str, service_id: str, start_time: str, end_time: str, resolution: int
+    ) -> List[Dict[str, Any]]:
+        """
+        סדרת מטריקה (cpu / memory) של שירות: GET /metrics/{metric}.
+        מחזיר רשימת סדרות (אחת לכל instance). זורק RenderAPIError.
+        """
+        params = {
+            "resource": service_id,
+            "startTime": start_time,
+            "endTime": end_time,
+            "resolutionSeconds": resolution,
+        }
+        return await self._send("GET", f"/metrics/{metric}", params=params) or []
     
     async def suspend_service(self, service_id: str) -> bool:
         """השעיית שירות"""
@@ -62,8 +317,20 @@ class RenderAPI:
         return result is not None
     
     async def get_service_status(self, service_id: str) -> str:
-        """קבלת סטטוס שירות"""
-        service = await self.get_service(service_id)
+        """קבלת סטטוס שירות (זורק RenderUnavailable כש-Render לא זמין)"""
+        try:
+            service = await self._fetch_service(service_id)
+        except RenderUnavailable:
+            # Render עמוס/לא זמין - לא מדווחים "unknown"; הקורא ישאיר את הסטטוס השמור
+            raise
+        except RenderAPIError as e:
+            logger.warning("❌ %s", e, extra=_log_fields("GET", f"/services/{service_id}", e, self.name))
+            return "unknown"
+        return self.parse_status(service)
+    
+    @staticmethod
+    def parse_status(service: Optional[Dict[str, Any]]) -> str:
+        """חילוץ סטטוס מאובייקט שירות של Render"""
         if not service:
             return "unknown"
         
@@ -86,9 +353,130 @@ class RenderAPI:
             "active": "🟢",
             "suspended": "🔴",
             "unknown": "⚪",
-            "deploying": "🟡"
+            "deploying": "🟡",
+            "failed": "🟠",
         }
         return statuses.get(status, "⚪")
 
+
+class RenderAccounts:
+    """
+    כמה חשבונות Render (workspaces) בבוט אחד. לכל חשבון RenderAPI משלו -
+    pool חיבורים, מגבלת קצב ו-circuit breakers נפרדים - כך שחשבון עמוס לא
+    מאט את האחרים. פעולה על שירות מנותבת לחשבון שרשום במסמך השירות (account);
+    שירות בלי account שייך לחשבון הראשון.
+    """
+
+    def __init__(self, accounts: Dict[str, str] = None, base_url: str = None):
+        accounts = accounts or config.RENDER_ACCOUNTS
+        self.accounts: Dict[str, RenderAPI] = {
+            name: RenderAPI(base_url, api_key, name=name) for name, api_key in accounts.items()
+        }
+        self.default_account = next(iter(self.accounts))
+        # service_id -> account, מתוך מסמכי שירות שכבר נראו
+        self._service_accounts: Dict[str, str] = {}
+
+    def client(self, account: str = None) -> RenderAPI:
+        """ה-client של החשבון (חשבון שהוסר מההגדרות -> החשבון הראשון)"""
+        api = self.accounts.get(account or self.default_account)
+        if api is None:
+            logger.warning("⚠️ חשבון Render לא מוגדר: %s", account, extra={"account": account})
+            api = self.accounts[self.default_account]
+        return api
+
+    def remember(self, services: Iterable[Dict[str, Any]]):
+        """שמירת החשבון של כל שירות, לניתוב קריאות שמגיעות רק עם service_id"""
+        for service in services:
+            if service.get("account"):
+                self._service_accounts[service["service_id"]] = service["account"]
+
+    def account_of(self, service: Dict[str, Any]) -> str:
+        return (
+            service.get("account")
+            or self._service_accounts.get(service["service_id"])
+            or self.default_account
+        )
+
+    def group_by_account(self, services: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for service in services:
+            groups.setdefault(self.account_of(service), []).append(service)
+        return groups
+
+    def for_service(self, service_id: str, account: str = None) -> RenderAPI:
+        return self.client(account or self._service_accounts.get(service_id))
+
+    async def start(self):
+        await asyncio.gather(*(api.start() for api in self.accounts.values()))
+
+    async def close(self):
+        await asyncio.gather(*(api.close() for api in self.accounts.values()))
+
+    async def find_account(self, service_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        באיזה חשבון נמצא השירות: GET /services/{id} בכל החשבונות במקביל.
+        מחזיר (account, service) או None אם אף חשבון לא מכיר אותו.
+        """
+        async def lookup(api: RenderAPI) -> Optional[Dict[str, Any]]:
+            try:
+                return await api._fetch_service(service_id)
+            except RenderAPIError as e:
+                # 404 בחשבון שהשירות לא שייך אליו הוא התשובה הצפויה
+                if e.status_code != 404:
+                    logger.warning("❌ %s", e, extra=_log_fields("GET", f"/services/{service_id}", e, api.name))
+                return None
+
+        names = list(self.accounts)
+        results = await asyncio.gather(*(lookup(self.accounts[name]) for name in names))
+        for name, service in zip(names, results):
+            if service:
+                self._service_accounts[service_id] = name
+                return name, service
+        return None
+
+    # ---- פעולות על שירות, מנותבות לחשבון שלו ----
+
+    async def get_service(self, service_id: str, account: str = None) -> Optional[Dict[str, Any]]:
+        return await self.for_service(service_id, account).get_service(service_id)
+
+    async def get_service_status(self, service_id: str, account: str = None) -> str:
+        return await self.for_service(service_id, account).get_service_status(service_id)
+
+    async def suspend_service(self, service_id: str, account: str = None) -> bool:
+        return await self.for_service(service_id, account).suspend_service(service_id)
+
+    async def resume_service(self, service_id: str, account: str = None) -> bool:
+        return await self.for_service(service_id, account).resume_service(service_id)
+
+    async def restart_service(self, service_id: str, account: str = None) -> bool:
+        return await self.for_service(service_id, account).restart_service(service_id)
+
+    def list_deploys(self, service_id: str, account: str = None, **kwargs):
+        return self.for_service(service_id, account).list_deploys(service_id, **kwargs)
+
+    def list_events(self, service_id: str, account: str = None, **kwargs):
+        return self.for_service(service_id, account).list_events(service_id, **kwargs)
+
+    async def get_metrics(self, metric: str, service_id: str, account: str = None, **kwargs) -> List[Dict[str, Any]]:
+        return await self.for_service(service_id, account).get_metrics(metric, service_id, **kwargs)
+
+    def list_services(self, account: str = None, page_size: int = None) -> AsyncIterator[Dict[str, Any]]:
+        return self.client(account).list_services(page_size)
+
+    def singleflight_stats(self) -> Dict[str, Any]:
+        total = sum(api._flight.requests for api in self.accounts.values())
+        deduplicated = sum(api._flight.deduplicated for api in self.accounts.values())
+        return {
+            "requests": total,
+            "deduplicated": deduplicated,
+            "dedup_ratio": deduplicated / total if total else 0.0,
+        }
+
+    parse_status = staticmethod(RenderAPI.parse_status)
+
+    def status_emoji(self, status: str) -> str:
+        return self.client().status_emoji(status)
+
+
 # אובייקט גלובלי
-render_api = RenderAPI()
+render_api = RenderAccounts()
@@ -0,0 +1,160 @@
+"""
+כלים לעבודה יציבה מול Render API: token bucket, circuit breaker, back-off
+ומגבלת מקביליות לכל חשבון
+"""
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+
+class TokenBucket:
+    """
+    מגביל קצב: rate אסימונים לשנייה עד capacity.
+    מתעדכן גם מכותרות ה-rate limit ש-Render מחזיר, ונעצר לגמרי אחרי 429.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """המתנה עד שיש אסימון פנוי (הממתינים נכנסים לפי הסדר)"""
+        if self.rate <= 0 and time.monotonic() >= self._paused_until:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    # בלי הגבלת קצב - רק העצירה אחרי 429 חלה
+                    return
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause_for(self, seconds: float):
+        """עצירת כל הבקשות ל-seconds שניות (למשל לפי Retry-After)"""
+        until = time.monotonic() + max(0.0, seconds)
+        self._paused_until = max(self._paused_until, until)
+        self._tokens = 0.0
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """
+        סנכרון עם כותרות Ratelimit-Remaining / Ratelimit-Reset של Render,
+        כדי לא לשרוף את המכסה שנשארה בחלון הנוכחי.
+        """
+        remaining = _to_float(headers.get("ratelimit-remaining"))
+        if remaining is None:
+            return
+        self._refill(time.monotonic())
+        self._tokens = min(self._tokens, remaining)
+        if remaining < 1:
+            reset = _to_float(headers.get("ratelimit-reset"))
+            self.pause_for(reset if reset is not None else 1.0 / self.rate if self.rate else 1.0)
+
+
+class CircuitBreaker:
+    """
+    closed - בקשות עוברות; אחרי threshold כישלונות רצופים -> open.
+    open - נכשלים מיד עד שעובר cooldown; אז half_open.
+    half_open - בקשת ניסיון אחת: הצלחה סוגרת, כישלון פותח שוב, וניסיון
+    שהסתיים בלי הכרעה (429, ביטול) משחרר את המקום לבקשת הניסיון הבאה.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """הניסיון הסתיים בלי הכרעה - נשארים half_open והבקשה הבאה תהיה ניסיון"""
+        if self.state == self.HALF_OPEN:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class AccountLimiter:
+    """
+    מקביליות מוגבלת לכל חשבון Render בנפרד (לכל חשבון מכסת API משלו), כך
+    שחשבונות רצים במקביל. אובייקט אחד לכל סבב: async with limiter(account).
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def __call__(self, account: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(account)
+        if semaphore is None:
+            semaphore = self._semaphores[account] = asyncio.Semaphore(self.limit)
+        return semaphore
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """exponential back-off עם full jitter"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After יכול להיות מספר שניות או תאריך HTTP"""
+    if not value:
+        return None
+    seconds = _to_float(value)
+    if seconds is not None:
+        return max(0.0, seconds)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,190 @@
+"""
+מסך משאבים: סדרות CPU וזיכרון מ-Render Metrics API, מצומצמות בבוט.
+
+הסדרה הגולמית (נקודה לכל resolution, לכל instance) מצומצמת מיד ל-N דליים
+שווים בזמן עם min/max/avg לכל דלי, במערכים רציפים (array) - הנקודות
+הגולמיות לא נשמרות. התוצאה נשמרת במטמון לכל (שירות, חלון זמן), כך שצפייה
+חוזרת מוצגת מיד, וצפיות מקבילות חולקות משיכה אחת.
+"""
+import asyncio
+import datetime
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+from caching import SingleFlight, TTLCache
+from render_api import render_api
+from timeutil import parse_time
+
+# חלון -> אורך בשניות (שמות החלונות הם גם חלק משם הפעולה בכפתור: metrics_1h...)
+WINDOWS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400}
+METRICS = ("cpu", "memory")
+
+# Render לא מחזיר נקודות בצפיפות של פחות מ-30 שניות
+MIN_RESOLUTION = 30
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def _timestamp(value: str) -> Optional[float]:
+    at = parse_time(value)
+    return at.timestamp() if at else None
+
+
+class Downsampled:
+    """סדרה מצומצמת ל-buckets דליים שווים בזמן: min/max/סכום/ספירה לכל דלי"""
+    __slots__ = ("start", "step", "unit", "mins", "maxs", "sums", "counts")
+
+    def __init__(self, start: float, end: float, buckets: int, unit: str = None):
+        self.start = start
+        self.step = max(end - start, 1) / buckets
+        self.unit = unit
+        self.mins = array("d", [float("inf")]) * buckets
+        self.maxs = array("d", [float("-inf")]) * buckets
+        self.sums = array("d", [0.0]) * buckets
+        self.counts = array("I", [0]) * buckets
+
+    def add(self, timestamp: float, value: float):
+        index = int((timestamp - self.start) / self.step)
+        if not 0 <= index < len(self.counts):
+            return
+        if value < self.mins[index]:
+            self.mins[index] = value
+        if value > self.maxs[index]:
+            self.maxs[index] = value
+        self.sums[index] += value
+        self.counts[index] += 1
+
+    @classmethod
+    def from_series(cls, series: Iterable[Dict[str, Any]], start: float, end: float, buckets: int) -> "Downsampled":
+        """
+        צמצום התשובה של Render ([{"labels": ..., "unit": ..., "values": [{"timestamp", "value"}]}]).
+        כמה instances של אותו שירות נכנסים לאותם דליים.
+        """
+        result = None
+        for item in series:
+            if result is None:
+                result = cls(start, end, buckets, item.get("unit"))
+            for point in item.get("values") or ():
+                timestamp, value = _timestamp(point.get("timestamp")), point.get("value")
+                if timestamp is not None and value is not None:
+                    result.add(timestamp, float(value))
+        return result or cls(start, end, buckets)
+
+    def averages(self) -> List[Optional[float]]:
+        return [total / count if count else None for total, count in zip(self.sums, self.counts)]
+
+    @property
+    def empty(self) -> bool:
+        return not any(self.counts)
+
+    def summary(self) -> Tuple[float, float, float]:
+        """(min, avg, max) על כל החלון"""
+        total, count = sum(self.sums), sum(self.counts)
+        return (
+            min(v for v, c in zip(self.mins, self.counts) if c),
+            total / count,
+            max(v for v, c in zip(self.maxs, self.counts) if c),
+        )
+
+    def last(self) -> Optional[float]:
+        for value in reversed(self.averages()):
+            if value is not None:
+                return value
+        return None
+
+
+def sparkline(values: List[Optional[float]]) -> str:
+    """ממוצעי הדליים כשורת תווים ▁..█ (דלי בלי נקודות - רווח)"""
+    known = [v for v in values if v is not None]
+    if not known:
+        return ""
+    low, high = min(known), max(known)
+    span = high - low
+    chars = []
+    for value in values:
+        if value is None:
+            chars.append(" ")
+        elif not span:
+            chars.append(SPARK_CHARS[0] if high == 0 else SPARK_CHARS[len(SPARK_CHARS) // 2])
+        else:
+            chars.append(SPARK_CHARS[min(len(SPARK_CHARS) - 1, int((value - low) / span * len(SPARK_CHARS)))])
+    return "".join(chars)
+
+
+def format_value(metric: str, value: float) -> str:
+    if metric == "memory":
+        return f"{value / (1024 * 1024):.0f}MB"
+    return f"{value * 1000:.0f}m"  # millicores
+
+
+@dataclass
+class ServiceMetrics:
+    service_id: str
+    window: str
+    series: Dict[str, Downsampled]
+    fetched_at: float
+
+
+class ResourceMetrics:
+    def __init__(self, api=render_api, ttl: float = None, max_size: int = None, buckets: int = None):
+        self.api = api
+        self.buckets = buckets or config.METRICS_BUCKETS
+        # (service_id, window) -> ServiceMetrics
+        self._entries = TTLCache(
+            config.METRICS_CACHE_TTL if ttl is None else ttl,
+            max_size or config.METRICS_CACHE_MAX_SIZE,
+        )
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def _resolution(self, window: str) -> int:
+        # בערך 4 נקודות גולמיות לכל דלי - מספיק ל-min/max בלי למשוך סדרה ענקית
+        return max(MIN_RESOLUTION, WINDOWS[window] // (self.buckets * 4))
+
+    async def _load(self, service_id: str, window: str, account: str = None) -> ServiceMetrics:
+        end = time.time()
+        start = end - WINDOWS[window]
+        params = {
+            "start_time": datetime.datetime.fromtimestamp(start, datetime.timezone.utc).isoformat(),
+            "end_time": datetime.datetime.fromtimestamp(end, datetime.timezone.utc).isoformat(),
+            "resolution": self._resolution(window),
+        }
+        results = await asyncio.gather(*(
+            self.api.get_metrics(metric, service_id, account=account, **params) for metric in METRICS
+        ))
+        series = {
+            metric: Downsampled.from_series(result, start, end, self.buckets)
+            for metric, result in zip(METRICS, results)
+        }
+        return ServiceMetrics(service_id, window, series, time.monotonic())
+
+    async def get(self, service_id: str, window: str, account: str = None) -> ServiceMetrics:
+        """מטריקות לחלון (מהמטמון אם טרי). זורק RenderAPIError אם Render לא החזיר"""
+        key = (service_id, window)
+        entry, fresh = self._entries.get(key)
+        if fresh:
+            self.hits += 1
+            return entry
+        self.misses += 1
+
+        def store(f):
+            # כישלון לא נשמר במטמון
+            if not f.cancelled() and f.exception() is None:
+                self._entries.set(key, f.result())
+
+        return await self._flight.do(key, lambda: self._load(service_id, window, account), on_done=store)
+
+    def invalidate(self, service_id: str):
+        for key in [k for k in self._entries.keys() if k[0] == service_id]:
+            self._entries.invalidate(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# אובייקט גלובלי
+resource_metrics = ResourceMetrics()
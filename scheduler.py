@@ -0,0 +1,299 @@
+"""
+חלונות השעיה/המשך מתוזמנים (למשל "השעה 23:00, המשך 07:00, א'-ה', Asia/Jerusalem").
+
+לוחות הזמנים נשמרים במונגו (אוסף schedules, אחד לכל שירות). בזיכרון מוחזק
+min-heap של הפעולה הבאה לכל שירות, והמשימה ישנה עד הזמן של הראשונה - בלי
+סריקה תקופתית. פעולות שהגיע זמנן מקובצות ורצות דרך batch_executor (במקביל,
+עם הנעילה לכל שירות ומגבלת המקביליות של כל חשבון), ונרשמות בלוג הפעולות.
+פעולות שהוחמצו בזמן שהבוט היה כבוי לא מבוצעות בדיעבד.
+רץ רק ברפליקה המובילה; כדי לקלוט /schedule שהתקבל ברפליקה אחרת (webhook)
+הלוחות נטענים מחדש מהמסד כל SCHEDULE_RELOAD_INTERVAL שניות.
+"""
+import asyncio
+import datetime
+import heapq
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import config
+from batch_actions import batch_executor
+from database import MENU_PROJECTION, db
+from status_refresh import status_refresher
+from structured_logging import log_context
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "scheduler"
+
+# action -> השדה במסמך עם השעה
+ACTION_FIELDS = {"suspend": "suspend_at", "resume": "resume_at"}
+
+# השדות שקובעים את התזמון (שינוי בשדות אחרים, למשל updated_at, לא מתזמן מחדש)
+SCHEDULE_FIELDS = ("suspend_at", "resume_at", "days", "timezone", "user_id")
+
+DAY_NAMES = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+ALL_DAYS = list(range(7))
+
+# גם כשאין פעולה קרובה מתעוררים לפחות פעם בשעה (הגנה מקפיצות של שעון המערכת)
+MAX_SLEEP = 3600
+
+# המתנה בין ניסיונות לטעון את לוחות הזמנים מהמסד
+LOAD_RETRY_DELAY = 30
+
+
+class ScheduleError(ValueError):
+    """לוח זמנים לא תקין (שעה, ימים או אזור זמן)"""
+
+
+def parse_time(value: str) -> Tuple[int, int]:
+    """"23:00" -> (23, 0)"""
+    hour, sep, minute = value.partition(":")
+    try:
+        hour, minute = int(hour), int(minute or 0)
+    except ValueError:
+        raise ScheduleError(f"שעה לא תקינה: {value}")
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ScheduleError(f"שעה לא תקינה: {value}")
+    return hour, minute
+
+
+def parse_days(spec: str) -> List[int]:
+    """
+    "sun-thu" / "mon,wed,fri" / "all" -> ימים לפי datetime.weekday() (שני=0).
+    טווח שעובר את סוף השבוע ("fri-mon") נתמך.
+    """
+    spec = (spec or "all").lower()
+    if spec in ("all", "daily", "*"):
+        return ALL_DAYS
+    days = set()
+    for part in spec.split(","):
+        start, sep, end = part.strip().partition("-")
+        try:
+            first = DAY_NAMES[start[:3]]
+            last = DAY_NAMES[end[:3]] if sep else first
+        except KeyError:
+            raise ScheduleError(f"ימים לא תקינים: {spec}")
+        day = first
+        days.add(day)
+        while day != last:
+            day = (day + 1) % 7
+            days.add(day)
+    return sorted(days)
+
+
+def parse_timezone(name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ScheduleError(f"אזור זמן לא מוכר: {name}")
+
+
+def format_days(days: List[int]) -> str:
+    if sorted(days) == ALL_DAYS:
+        return "all"
+    names = {number: name for name, number in DAY_NAMES.items()}
+    return ",".join(names[day] for day in days)
+
+
+def make_schedule(
+    service_id: str,
+    suspend_at: str,
+    resume_at: str,
+    days: str = None,
+    timezone: str = None,
+    user_id: int = None,
+) -> Dict[str, Any]:
+    """בדיקת הקלט ובניית מסמך לוח זמנים (זורק ScheduleError)"""
+    timezone = timezone or config.SCHEDULE_TIMEZONE
+    parse_timezone(timezone)
+    if parse_time(suspend_at) == parse_time(resume_at):
+        raise ScheduleError("שעת ההשעיה ושעת ההמשך זהות")
+    return {
+        "service_id": service_id,
+        "suspend_at": "%02d:%02d" % parse_time(suspend_at),
+        "resume_at": "%02d:%02d" % parse_time(resume_at),
+        "days": parse_days(days),
+        "timezone": timezone,
+        "user_id": user_id,
+    }
+
+
+def next_occurrence(at: str, days: List[int], tz: ZoneInfo, after: datetime.datetime) -> Optional[datetime.datetime]:
+    """הפעם הבאה (אחרי after) שבה השעה at חלה באחד הימים, לפי השעון המקומי של tz"""
+    hour, minute = parse_time(at)
+    local = after.astimezone(tz)
+    for offset in range(8):
+        day = local.date() + datetime.timedelta(days=offset)
+        if day.weekday() not in days:
+            continue
+        candidate = datetime.datetime.combine(day, datetime.time(hour, minute), tzinfo=tz)
+        if candidate > after:
+            return candidate
+    return None
+
+
+class Scheduler:
+    def __init__(self, database=db, executor=batch_executor, refresher=status_refresher, reload_interval: float = None):
+        self.db = database
+        self.executor = executor
+        self.refresher = refresher
+        self.reload_interval = config.SCHEDULE_RELOAD_INTERVAL if reload_interval is None else reload_interval
+        # (timestamp, seq, service_id, action, version)
+        self._heap: List[Tuple[float, int, str, str, int]] = []
+        self._seq = 0
+        # service_id -> (גרסה, מסמך). כל עדכון מקבל גרסה חדשה; רשומות ישנות ב-heap מדולגות
+        self._schedules: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.executed = 0
+
+    # ---- ניהול לוחות זמנים ----
+
+    def _push(self, schedule: Dict[str, Any], action: str, version: int, after: datetime.datetime):
+        when = next_occurrence(
+            schedule[ACTION_FIELDS[action]], schedule["days"], parse_timezone(schedule["timezone"]), after
+        )
+        if when is None:
+            return
+        self._seq += 1
+        heapq.heappush(self._heap, (when.timestamp(), self._seq, schedule["service_id"], action, version))
+
+    def update(self, schedule: Dict[str, Any]):
+        """הוספה/החלפה של לוח הזמנים של שירות (אחרי שנשמר במסד)"""
+        service_id = schedule["service_id"]
+        self._seq += 1
+        version = self._seq
+        self._schedules[service_id] = (version, schedule)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for action in ACTION_FIELDS:
+            self._push(schedule, action, version, now)
+        self._wake.set()
+
+    def remove(self, service_id: str):
+        if self._schedules.pop(service_id, None) is not None:
+            # הרשומות שלו ב-heap יידלגו (אין להן גרסה תקפה)
+            self._wake.set()
+
+    def next_run(self, service_id: str) -> Optional[Tuple[str, datetime.datetime]]:
+        """(action, זמן) של הפעולה המתוזמנת הבאה לשירות"""
+        entry = self._schedules.get(service_id)
+        if entry is None:
+            return None
+        version = entry[0]
+        due = [item for item in self._heap if item[2] == service_id and item[4] == version]
+        if not due:
+            return None
+        timestamp, _, _, action, _ = min(due)
+        return action, datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+    async def load(self):
+        """סנכרון מול המסד: לוחות שנמחקו יוצאים, ורק לוחות חדשים/ששונו מתוזמנים מחדש"""
+        schedules = await self.db.get_schedules()
+        current = {schedule["service_id"] for schedule in schedules}
+        for service_id in [sid for sid in self._schedules if sid not in current]:
+            self.remove(service_id)
+        for schedule in schedules:
+            entry = self._schedules.get(schedule["service_id"])
+            if entry is not None and all(entry[1].get(f) == schedule.get(f) for f in SCHEDULE_FIELDS):
+                continue
+            try:
+                self.update(schedule)
+            except ScheduleError as e:
+                logger.warning("⚠️ לוח זמנים לא תקין ל-%s: %s", schedule.get("service_id"), e)
+        logger.info("⏰ נטענו %s לוחות זמנים", len(self._schedules))
+
+    # ---- ריצה ----
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # ב-start הבא הכל נטען מחדש מהזמן הנוכחי, כדי שפעולות שהוחמצו בינתיים
+        # (למשל כשהרפליקה לא הייתה המנהיגה) לא ירוצו בבת אחת
+        self._heap.clear()
+        self._schedules.clear()
+
+    def _pop_due(self, now: float) -> Dict[Tuple[str, int], List[str]]:
+        """
+        הוצאת כל מה שהגיע זמנו ודחיפת המופע הבא של כל אחד.
+        מחזיר (action, user_id) -> [service_id], כדי שהלוג ירשום את מי שהגדיר את הלוח.
+        """
+        due: Dict[Tuple[str, int], List[str]] = {}
+        after = datetime.datetime.fromtimestamp(now, datetime.timezone.utc)
+        while self._heap and self._heap[0][0] <= now:
+            _, _, service_id, action, version = heapq.heappop(self._heap)
+            entry = self._schedules.get(service_id)
+            if entry is None or entry[0] != version:
+                continue
+            schedule = entry[1]
+            due.setdefault((action, schedule.get("user_id")), []).append(service_id)
+            self._push(schedule, action, version, after)
+        return due
+
+    async def _execute(self, action: str, user_id: int, service_ids: List[str]):
+        services = await self.db.get_services_by_ids(service_ids, projection=MENU_PROJECTION)
+        if not services:
+            return
+        # סטטוס עדכני, כדי לדלג על מה שכבר במצב הרצוי
+        await self.refresher.refresh(services)
+        result = await self.executor.run(services, action, user_id)
+        self.executed += result.succeeded
+        logger.info(
+            "⏰ %s מתוזמן: %s הצליחו, %s נכשלו, %s דולגו",
+            action, result.succeeded, result.failed, result.skipped,
+        )
+
+    async def _run(self):
+        with log_context(component=JOB_NAME):
+            while True:
+                try:
+                    await self.load()
+                    break
+                except Exception as e:
+                    # המסד עוד לא זמין (למשל בעלייה) - ננסה שוב
+                    logger.error("❌ טעינת לוחות הזמנים נכשלה: %s", e)
+                    await asyncio.sleep(LOAD_RETRY_DELAY)
+            loaded_at = time.monotonic()
+            while True:
+                if self.reload_interval and time.monotonic() - loaded_at >= self.reload_interval:
+                    loaded_at = time.monotonic()
+                    try:
+                        await self.load()
+                    except Exception as e:
+                        logger.error("❌ טעינת לוחות הזמנים נכשלה: %s", e)
+                # מנקים לפני החישוב, כדי שעדכון שמגיע באמצע לא יפוספס
+                self._wake.clear()
+                delay = MAX_SLEEP
+                if self._heap:
+                    delay = min(MAX_SLEEP, self._heap[0][0] - time.time())
+                if self.reload_interval:
+                    delay = min(delay, loaded_at + self.reload_interval - time.monotonic())
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                due = self._pop_due(time.time())
+                results = await asyncio.gather(
+                    *(self._execute(action, user_id, ids) for (action, user_id), ids in due.items()),
+                    return_exceptions=True,
+                )
+                for error in results:
+                    if isinstance(error, Exception):
+                        logger.error("❌ פעולה מתוזמנת נכשלה: %s", error)
+
+
+# אובייקט גלובלי
+scheduler = Scheduler()
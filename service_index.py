@@ -0,0 +1,146 @@
+"""
+אינדקס שירותים בזיכרון + קידוד callback_data קומפקטי לכפתורים.
+
+כל שירות שמוצג בתפריט מקבל handle מספרי קטן. הכפתורים נושאים רק קוד פעולה
+ו-handle (למשל "v:1k"), כך שגם עם מזהים ארוכים נשארים הרבה מתחת למגבלת
+64 הבתים של טלגרם, והלחיצה מתורגמת לשירות בלי לפנות למונגו.
+
+ה-handle נשמר במסמך השירות במונגו (השדה handle), כך שכפתור עובד גם אחרי
+הפעלה מחדש או כשהלחיצה מגיעה לרפליקה אחרת (אז השירות נשלף לפי ה-handle).
+שירות בלי handle שמור (לפני המיגרציה) מקבל handle מקומי מ-LOCAL_HANDLE_BASE.
+"""
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import config
+
+# פעולה -> קוד בן תו אחד ב-callback_data
+ACTION_CODES = {
+    "view": "v",
+    "suspend": "s",
+    "resume": "r",
+    "restart": "x",
+    "page_next": "n",
+    "page_prev": "p",
+    "deploys": "d",
+    "metrics_1h": "m",
+    "metrics_24h": "g",
+    "metrics_7d": "w",
+}
+_CODE_ACTIONS = {code: action for action, code in ACTION_CODES.items()}
+
+# הפורמט הישן ("view_srv-xxx") - להודעות שנשלחו לפני המעבר
+LEGACY_PREFIXES = ("view_", "suspend_", "resume_", "restart_")
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+# handles מקומיים (לא שמורים במונגו) מתחילים כאן, כדי לא להתנגש בקבועים
+LOCAL_HANDLE_BASE = 36 ** 5
+
+
+def _to_base36(number: int) -> str:
+    if number == 0:
+        return "0"
+    digits = []
+    while number:
+        number, rem = divmod(number, 36)
+        digits.append(_DIGITS[rem])
+    return "".join(reversed(digits))
+
+
+class ServiceRecord:
+    __slots__ = ("handle", "service_id", "name", "deploy_status", "account")
+
+    def __init__(self, handle: int, service_id: str, name: str, deploy_status: str = None, account: str = None):
+        self.handle = handle
+        self.service_id = service_id
+        self.name = name
+        self.deploy_status = deploy_status
+        self.account = account
+
+
+class ServiceIndex:
+    """
+    service_id <-> handle. ה-handles לא ממוחזרים, כך שכפתור ישן לעולם לא
+    יצביע על שירות אחר; רשומות ישנות מפונות לפי LRU.
+    """
+
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size or config.SERVICE_INDEX_MAX_SIZE
+        self._by_handle: "OrderedDict[int, ServiceRecord]" = OrderedDict()
+        self._by_id: Dict[str, ServiceRecord] = {}
+        self._next_handle = LOCAL_HANDLE_BASE
+
+    def register(self, service: dict) -> ServiceRecord:
+        """הוספה/עדכון של שירות (מסמך עם service_id ו-name, ואם יש - handle)"""
+        record = self._by_id.get(service["service_id"])
+        persistent = service.get("handle")
+        if record is not None and persistent is not None and record.handle != persistent:
+            # נרשם קודם עם handle מקומי (מסמך בלי השדה) - עוברים ל-handle הקבוע
+            self._by_handle.pop(record.handle, None)
+            record.handle = persistent
+            self._by_handle[persistent] = record
+        if record is None:
+            if persistent is None:
+                persistent = self._next_handle
+                self._next_handle += 1
+            record = ServiceRecord(
+                persistent,
+                service["service_id"],
+                service.get("name", ""),
+                service.get("deploy_status"),
+                service.get("account"),
+            )
+            self._by_id[record.service_id] = record
+            self._by_handle[record.handle] = record
+            while len(self._by_handle) > self.max_size:
+                _, evicted = self._by_handle.popitem(last=False)
+                self._by_id.pop(evicted.service_id, None)
+        else:
+            record.name = service.get("name", record.name)
+            record.deploy_status = service.get("deploy_status", record.deploy_status)
+            record.account = service.get("account") or record.account
+            self._by_handle.move_to_end(record.handle)
+        return record
+
+    def get(self, handle: int) -> Optional[ServiceRecord]:
+        record = self._by_handle.get(handle)
+        if record is not None:
+            self._by_handle.move_to_end(handle)
+        return record
+
+    @staticmethod
+    def is_persistent(handle: int) -> bool:
+        """האם ה-handle שמור במונגו (ואפשר לשלוף לפיו את השירות)"""
+        return handle < LOCAL_HANDLE_BASE
+
+    def by_service_id(self, service_id: str) -> Optional[ServiceRecord]:
+        return self._by_id.get(service_id)
+
+    def forget(self, service_id: str):
+        record = self._by_id.pop(service_id, None)
+        if record is not None:
+            self._by_handle.pop(record.handle, None)
+
+    def __len__(self):
+        return len(self._by_handle)
+
+    def callback(self, action: str, service: dict) -> str:
+        """callback_data קומפקטי לפעולה על שירות (רושם אותו באינדקס)"""
+        record = self.register(service)
+        return f"{ACTION_CODES[action]}:{_to_base36(record.handle)}"
+
+    @staticmethod
+    def decode(data: str) -> Optional[Tuple[str, int]]:
+        """(action, handle) מ-callback_data קומפקטי, או None אם זה לא הפורמט"""
+        code, sep, handle = data.partition(":")
+        if not sep or code not in _CODE_ACTIONS:
+            return None
+        try:
+            return _CODE_ACTIONS[code], int(handle, 36)
+        except ValueError:
+            return None
+
+
+# אובייקט גלובלי
+service_index = ServiceIndex()
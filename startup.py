@@ -0,0 +1,33 @@
+"""
+מדידת זמני עלייה: כמה זמן לקח כל שלב, ועד העדכון הראשון מטלגרם
+"""
+import logging
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.monotonic()
+        self._last = self.started
+        self.phases: Dict[str, float] = {}
+        self.time_to_first_update = None
+
+    def mark(self, phase: str):
+        """סיום שלב: נרשם משך השלב עצמו והזמן המצטבר מתחילת התהליך"""
+        now = time.monotonic()
+        self.phases[phase] = now - self._last
+        self._last = now
+        logger.info("⏱ startup: %s %.0fms (סה\"כ %.0fms)", phase, self.phases[phase] * 1000, (now - self.started) * 1000)
+
+    def first_update(self):
+        if self.time_to_first_update is not None:
+            return
+        self.time_to_first_update = time.monotonic() - self.started
+        logger.info("⏱ startup: עדכון ראשון אחרי %.0fms", self.time_to_first_update * 1000)
+
+
+# אובייקט גלובלי
+startup_timer = StartupTimer()
@@ -0,0 +1,109 @@
+"""
+התראות לבעלים על שינויי סטטוס.
+
+שינוי מזוהה במקום שבו הוא נכתב למסד (למשל StatusRefresher._store), ולא
+בהשוואה של ה-poller מול המסד - אחרת שינוי שמשתמש ראה קודם (מסך שירות,
+/refresh, רענון ברקע) כבר שמור כשה-poller מגיע, ואף אחד לא מקבל התראה.
+הכתיבה למסד מותנית בסטטוס הקודם, כך שכל מעבר מתריע פעם אחת. השליחה
+לטלגרם רצה ברקע ולא מעכבת את מי שכתב.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List
+
+from database import db
+from render_api import render_api
+
+logger = logging.getLogger(__name__)
+
+STATUS_HEBREW = {
+    "active": "פעיל",
+    "suspended": "מושעה",
+    "deploying": "בפריסה",
+    "failed": "פריסה נכשלה",
+    "unknown": "לא ידוע",
+}
+
+# מה שצריך מהמסמך כדי לשלוח התראה
+ALERT_PROJECTION = {"_id": 0, "service_id": 1, "name": 1, "owners": 1, "owner_id": 1, "idle_after": 1}
+
+
+def should_alert(change: Dict[str, Any]) -> bool:
+    # unknown הוא בדרך כלל תקלה זמנית או שירות חדש - לא מתריעים עליו
+    old, new = change["old"], change["new"]
+    return old is not None and old != new and "unknown" not in (old, new)
+
+
+def format_alert(change: Dict[str, Any]) -> str:
+    service = change["service"]
+    old, new = change["old"], change["new"]
+    text = (
+        f"🔔 שינוי סטטוס: {service.get('name', service['service_id'])}\n"
+        f"{render_api.status_emoji(old)} {STATUS_HEBREW.get(old, old)}"
+        f" ← "
+        f"{render_api.status_emoji(new)} {STATUS_HEBREW.get(new, new)}"
+    )
+    if change.get("reason") == "idle":
+        text += f"\n💤 הושעה אוטומטית אחרי {service['idle_after'] / 3600:g} שעות ללא פעילות"
+    return text
+
+
+class StatusAlerts:
+    def __init__(self, database=db):
+        self.db = database
+        self.bot = None
+        self._background = set()
+        self.sent = 0
+
+    def attach(self, bot):
+        """הבוט ששולח את ההתראות (עד אז שינויים נרשמים בלי התראה)"""
+        self.bot = bot
+
+    def notify(self, changes: List[Dict[str, Any]]):
+        """
+        התראה על שינויים ({"service": doc, "old": status, "new": status, "reason"?}).
+        לא ממתין לטלגרם.
+        """
+        changes = [change for change in changes if should_alert(change)]
+        if not changes or self.bot is None:
+            return
+        task = asyncio.create_task(self._send(changes))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _send(self, changes: List[Dict[str, Any]]):
+        # מסמך חלקי (למשל מרענון של שירות בודד) - הבעלים והשם נשלפים מהמסד
+        partial = [c["service"]["service_id"] for c in changes if "owners" not in c["service"]]
+        if partial:
+            try:
+                docs = await self.db.get_services_by_ids(partial, projection=ALERT_PROJECTION)
+            except Exception as e:
+                logger.warning("⚠️ שליפת בעלים להתראה נכשלה: %s", e)
+                docs = []
+            by_id = {doc["service_id"]: doc for doc in docs}
+            changes = [
+                {**c, "service": {**by_id.get(c["service"]["service_id"], {}), **c["service"]}}
+                if "owners" not in c["service"] else c
+                for c in changes
+            ]
+        for change in changes:
+            service = change["service"]
+            owners = set(service.get("owners") or [])
+            if service.get("owner_id"):
+                owners.add(service["owner_id"])
+            text = format_alert(change)
+            for owner_id in owners:
+                try:
+                    await self.bot.send_message(chat_id=owner_id, text=text)
+                    self.sent += 1
+                except Exception as e:
+                    logger.warning("⚠️ לא ניתן לשלוח התראה ל-%s: %s", owner_id, e)
+
+    async def stop(self):
+        """המתנה להתראות שעוד נשלחות (לפני שהבוט נסגר)"""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+
+# אובייקט גלובלי
+status_alerts = StatusAlerts()
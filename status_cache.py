@@ -0,0 +1,74 @@
+"""
+מטמון סטטוסים בזיכרון: TTL + LRU חסום, עם מונים לכוונון ה-TTL
+"""
+from typing import Optional, Tuple
+
+import config
+from caching import TTLCache
+
+
+class StatusCache:
+    def __init__(self, ttl: float = None, max_size: int = None):
+        # service_id -> status
+        self._entries = TTLCache(
+            config.STATUS_CACHE_TTL if ttl is None else ttl,
+            max_size or config.STATUS_CACHE_MAX_SIZE,
+        )
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get(self, service_id: str) -> Tuple[Optional[str], bool]:
+        """
+        מחזיר (status, fresh).
+        status=None אם אין רשומה; fresh=False אם הרשומה ישנה מה-TTL
+        (מותר להציג אותה, אבל צריך לרענן ברקע).
+        """
+        status, fresh = self._entries.get(service_id)
+        if status is None:
+            self.misses += 1
+            return None, False
+
+        if fresh:
+            self.hits += 1
+            return status, True
+
+        self.stale_hits += 1
+        return status, False
+
+    def set(self, service_id: str, status: str):
+        """שמירת סטטוס (ופינוי הרשומה הישנה ביותר אם עברנו את הגודל)"""
+        self._entries.set(service_id, status)
+
+    def invalidate(self, service_id: str):
+        """מחיקת רשומה - אחרי פעולה שמשנה את מצב השירות"""
+        self._entries.invalidate(service_id)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        """חלק הבקשות שנענו מהמטמון (כולל רשומות ישנות שהוצגו מיד)"""
+        total = self.hits + self.stale_hits + self.misses
+        if not total:
+            return 0.0
+        return (self.hits + self.stale_hits) / total
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self._entries.max_size,
+            "ttl": self._entries.ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+# אובייקט גלובלי
+status_cache = StatusCache()
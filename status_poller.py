@@ -0,0 +1,171 @@
+"""
+רענון סטטוסים תקופתי ברקע (JobQueue). ההתראות על שינויי סטטוס יוצאות מהרענון
+עצמו (status_alerts), כך שגם שינוי שמשתמש ראה לפני ה-poller מתריע.
+רץ רק ברפליקה המובילה; השאר יודעות שהמצב במסד עדכני לפי ה-heartbeat שהיא שומרת.
+"""
+import datetime
+import logging
+import random
+import time
+from typing import Any, Dict, List
+
+from telegram.ext import ContextTypes, JobQueue
+
+import config
+from database import db
+from deploy_sync import deploy_sync
+from idle_detector import idle_detector
+from status_alerts import status_alerts
+from status_refresh import status_refresher
+from structured_logging import log_context
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "status_poller"
+
+# כל כמה שניות רפליקה שלא מריצה את ה-poller קוראת את ה-heartbeat שלו מהמסד
+HEARTBEAT_CHECK_INTERVAL = 5.0
+
+
+class StatusPoller:
+    def __init__(
+        self,
+        refresher=status_refresher,
+        database=db,
+        deploys=deploy_sync,
+        idle=idle_detector,
+        alerts=status_alerts,
+        interval: float = None,
+        jitter: float = None,
+        max_backoff: float = None,
+    ):
+        self.refresher = refresher
+        self.db = database
+        self.deploys = deploys
+        self.idle = idle
+        self.alerts = alerts
+        self.interval = config.STATUS_POLL_INTERVAL if interval is None else interval
+        self.jitter = config.STATUS_POLL_JITTER if jitter is None else jitter
+        self.max_backoff = config.STATUS_POLL_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.failures = 0
+        self.last_success = None  # time.monotonic() של הסבב המוצלח האחרון
+        self.running = False
+        # כל start מתחיל "דור" חדש; סבב מדור קודם לא מתזמן את הבא, כדי שלא יהיו שתי שרשראות
+        self.generation = 0
+        self._heartbeat_checked = None  # time.monotonic() של הקריאה האחרונה של ה-heartbeat
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def is_fresh(self) -> bool:
+        """האם המצב השמור במסד עדכני מספיק כדי להציג אותו בלי לפנות ל-Render"""
+        if self.last_success is None:
+            return False
+        return time.monotonic() - self.last_success <= self.interval * 2
+
+    async def check_fresh(self) -> bool:
+        """
+        כמו is_fresh, גם ברפליקה שלא מריצה את ה-poller: שם הסבב המוצלח האחרון
+        נקרא מה-heartbeat במסד (לכל היותר פעם ב-HEARTBEAT_CHECK_INTERVAL).
+        """
+        if self.running or not self.enabled:
+            return self.is_fresh()
+        now = time.monotonic()
+        if self._heartbeat_checked is None or now - self._heartbeat_checked >= HEARTBEAT_CHECK_INTERVAL:
+            self._heartbeat_checked = now
+            try:
+                at = await self.db.get_heartbeat(JOB_NAME)
+            except Exception as e:
+                logger.warning("⚠️ קריאת ה-heartbeat של ה-poller נכשלה: %s", e)
+                at = None
+            if at is not None:
+                age = (datetime.datetime.now(datetime.timezone.utc) - at).total_seconds()
+                self.last_success = now - max(age, 0.0)
+        return self.is_fresh()
+
+    def next_delay(self) -> float:
+        """מרווח לסבב הבא: back-off מעריכי אחרי כישלונות, עם jitter"""
+        delay = min(self.interval * (2 ** self.failures), max(self.max_backoff, self.interval))
+        spread = delay * self.jitter
+        return max(1.0, delay + random.uniform(-spread, spread))
+
+    def start(self, job_queue: JobQueue):
+        if not self.enabled:
+            logger.info("⏸ poller סטטוסים כבוי (STATUS_POLL_INTERVAL=0)")
+            return
+        # סבב ראשון קצר אחרי העלייה, עם jitter כדי שכמה מופעים לא יתנגשו
+        first = random.uniform(1.0, max(1.0, self.interval * self.jitter))
+        self.running = True
+        self.generation += 1
+        job_queue.run_once(self._run, when=first, name=JOB_NAME, data=self.generation)
+        logger.info("🔁 poller סטטוסים פעיל (כל %s שניות)", self.interval)
+
+    def stop(self, job_queue: JobQueue):
+        """הפסקת הסבבים (הרפליקה כבר לא המנהיגה); סבב שכבר רץ מסתיים בלי לתזמן הבא"""
+        self.running = False
+        for job in job_queue.get_jobs_by_name(JOB_NAME):
+            job.schedule_removal()
+
+    async def _run(self, context: ContextTypes.DEFAULT_TYPE):
+        # כל הלוגים של הסבב (כולל שגיאות Render לכל שירות) נדגמים לפי "status_poller"
+        with log_context(component=JOB_NAME):
+            try:
+                await self.poll()
+            except Exception as e:
+                self.failures += 1
+                logger.warning("⚠️ סבב poller נכשל (%s ברצף): %s", self.failures, e)
+            finally:
+                # stop() ואז start() בזמן שהסבב רץ - ה-start כבר תזמן שרשרת חדשה
+                if self.running and context.job.data == self.generation:
+                    context.job_queue.run_once(
+                        self._run, when=self.next_delay(), name=JOB_NAME, data=self.generation
+                    )
+
+    async def poll(self) -> List[Dict[str, Any]]:
+        """
+        סבב אחד: רענון כל השירותים הרשומים.
+        מחזיר רשימת שינויים: {"service": doc, "old": status, "new": status}
+        (על שינויי הסטטוס ועל פריסה שנכשלה כבר התריעו במקום שבו נכתבו).
+        """
+        started = time.monotonic()
+        services = await self.db.get_services()
+
+        result = await self.refresher.refresh(services)
+
+        unknown = sum(1 for s in result.services if s.get("status") == "unknown")
+        if result.partial or result.failed or (services and unknown == len(services)):
+            # Render איטי או לא זמין - מאריכים את המרווח, והמצב במסד לא נחשב עדכני
+            self.failures += 1
+        else:
+            self.failures = 0
+            self.last_success = time.monotonic()
+            try:
+                await self.db.set_heartbeat(JOB_NAME)
+            except Exception as e:
+                logger.warning("⚠️ שמירת ה-heartbeat של ה-poller נכשלה: %s", e)
+
+        changes = list(result.changes)
+        alerts = []
+
+        # פריסות: רק מה שהשתנה מאז הסנכרון הקודם, ורק לחלק מהשירותים בכל סבב
+        # (על פריסה שנכשלה הסנכרון מתריע בעצמו)
+        changes.extend(await self.deploys.sync(result.services))
+
+        # שירותים רדומים מעבר לסף שלהם מושעים (רק מי שהוגדר לו סף)
+        for service in await self.idle.check(result.services):
+            alerts.append({"service": service, "old": "active", "new": "suspended", "reason": "idle"})
+
+        self.alerts.notify(alerts)
+        changes.extend(alerts)
+
+        logger.info(
+            "🔁 סבב poller: %s שירותים, %s שינויים, %s לא הספיקו, %s נכשלו",
+            len(services), len(changes), len(result.timed_out), len(result.failed),
+            extra={"duration_ms": round((time.monotonic() - started) * 1000, 1)},
+        )
+        return changes
+
+
+# אובייקט גלובלי
+status_poller = StatusPoller()
@@ -0,0 +1,232 @@
+"""
+רענון סטטוסים מקבילי מול Render, עם הגבלת מקביליות ו-deadline
+(הגבלת הקצב עצמה נעשית ב-RenderAPI). כשיש כמה חשבונות, כל חשבון
+מרוענן במקביל לאחרים עם מגבלת מקביליות משלו.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+import config
+from database import db
+from render_api import render_api
+from resilience import AccountLimiter
+from status_alerts import status_alerts
+from status_cache import status_cache
+from structured_logging import bind
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RefreshResult:
+    """תוצאת רענון: השירותים (עם status מעודכן היכן שהצליח) וסטטיסטיקה"""
+    services: List[Dict[str, Any]]
+    updated: int = 0
+    timed_out: List[str] = field(default_factory=list)
+    # שירותים שהשליפה שלהם נכשלה (למשל Render לא זמין) ונשארו עם הסטטוס השמור
+    failed: List[str] = field(default_factory=list)
+    # מעברים שנכתבו למסד ברענון הזה: {"service": doc, "old": status, "new": status}
+    changes: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.timed_out)
+
+
+class StatusRefresher:
+    def __init__(
+        self,
+        api=render_api,
+        database=db,
+        concurrency: int = None,
+        deadline: float = None,
+        use_listing: bool = None,
+        cache=status_cache,
+        alerts=status_alerts,
+    ):
+        self.api = api
+        self.db = database
+        self.cache = cache
+        self.alerts = alerts
+        self.concurrency = concurrency or config.STATUS_REFRESH_CONCURRENCY
+        self.deadline = deadline or config.STATUS_REFRESH_DEADLINE
+        self.use_listing = config.STATUS_REFRESH_USE_LISTING if use_listing is None else use_listing
+        # רענונים ברקע (stale-while-revalidate) - שמירת רפרנס כדי שלא ייאספו
+        self._background = set()
+        self._revalidating = set()
+
+    async def _collect_from_listing(self, api, wanted: set, statuses: Dict[str, str]):
+        """מעבר על GET /services של חשבון ואיסוף סטטוסים של השירותים הרשומים בלבד"""
+        found = 0
+        async for service in api.list_services():
+            service_id = service.get("id")
+            if service_id in wanted:
+                statuses[service_id] = api.parse_status(service)
+                found += 1
+                if found == len(wanted):
+                    # מצאנו הכל - אין צורך בעמודים נוספים
+                    return
+
+    async def _fetch_individually(
+        self, api, service_ids: List[str], statuses: Dict[str, str], timeout: float, limiter
+    ) -> Tuple[List[str], List[str]]:
+        """
+        שליפת סטטוס לכל שירות בנפרד (GET /services/{id}) במקביל.
+        מחזיר (שירותים שלא הספיקו להתעדכן עד ה-timeout, שירותים שהשליפה שלהם נכשלה).
+        """
+        if not service_ids:
+            return [], []
+        if timeout <= 0:
+            return list(service_ids), []
+
+        async def fetch_one(service_id):
+            bind(service_id=service_id)
+            async with limiter(api.name):
+                statuses[service_id] = await api.get_service_status(service_id)
+
+        tasks = {asyncio.create_task(fetch_one(sid)): sid for sid in service_ids}
+        done, pending = await asyncio.wait(list(tasks), timeout=timeout)
+
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        # שירות שנכשל (למשל Render לא זמין) נשאר עם הסטטוס השמור
+        failed = [task for task in done if task.exception() is not None]
+        if failed:
+            logger.warning(
+                "❌ %s שירותים לא רועננו: %s", len(failed), failed[0].exception(), extra={"account": api.name}
+            )
+
+        return [tasks[task] for task in pending], [tasks[task] for task in failed]
+
+    async def _store(
+        self, services: List[Dict[str, Any]], statuses: Dict[str, str]
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        כתיבת הסטטוסים למסד (bulk אחד, רק מה שהשתנה) ועדכון המסמכים שבזיכרון.
+        זה המקום היחיד שבו רענון כותב סטטוס, ולכן גם המקום שממנו יוצאות ההתראות.
+        מחזיר (כמה עודכנו, המעברים שנכתבו).
+        """
+        services = [s for s in services if s["service_id"] in statuses]
+        # מסמך בלי status (למשל מ-get_status) - הסטטוס הקודם ייקרא מהמסד בעדכון עצמו
+        previous = {s["service_id"]: s.get("status") for s in services if "status" in s}
+        try:
+            changed = await self.db.bulk_update_statuses(
+                {s["service_id"]: statuses[s["service_id"]] for s in services},
+                previous=previous,
+            )
+        except Exception as e:
+            logger.error("❌ שגיאה בשמירת סטטוסים: %s", e)
+            changed = {}
+        changes = []
+        for service in services:
+            service_id = service["service_id"]
+            if service_id in changed:
+                changes.append({"service": service, "old": changed[service_id], "new": statuses[service_id]})
+            service["status"] = statuses[service_id]
+            self.cache.set(service_id, service["status"])
+        self.alerts.notify(changes)
+        return len(services), changes
+
+    async def refresh(self, services: List[Dict[str, Any]]) -> RefreshResult:
+        """
+        רענון סטטוס לכל השירותים, כל חשבון Render במקביל.
+        בכל חשבון: קודם סריקה של GET /services (בקשה אחת לכל עמוד), ולשירותים
+        שלא הופיעו בה - בקשה נפרדת לכל שירות במקביל.
+        שירות שלא הספיק להתעדכן עד ה-deadline נשאר עם הסטטוס השמור במסד.
+        """
+        result = RefreshResult(services=services)
+        if not services:
+            return result
+
+        deadline = asyncio.get_running_loop().time() + self.deadline
+        statuses: Dict[str, str] = {}
+        limiter = AccountLimiter(self.concurrency)
+        self.api.remember(services)
+        groups = self.api.group_by_account(services)
+        outcomes = await asyncio.gather(*(
+            self._refresh_account(self.api.client(account), group, statuses, deadline, limiter)
+            for account, group in groups.items()
+        ))
+        for timed_out, failed in outcomes:
+            result.timed_out.extend(timed_out)
+            result.failed.extend(failed)
+        result.updated, result.changes = await self._store(services, statuses)
+        return result
+
+    async def _refresh_account(
+        self, api, services: List[Dict[str, Any]], statuses: Dict[str, str], deadline: float, limiter
+    ) -> Tuple[List[str], List[str]]:
+        """רענון השירותים של חשבון אחד; מחזיר (מי שלא הספיק להתעדכן, מי שנכשל)"""
+        loop = asyncio.get_running_loop()
+        # לשירות בודד בקשה ישירה זולה יותר מסריקת כל החשבון
+        if self.use_listing and len(services) > 1:
+            wanted = {s["service_id"] for s in services}
+            try:
+                await asyncio.wait_for(
+                    self._collect_from_listing(api, wanted, statuses), timeout=deadline - loop.time()
+                )
+            except asyncio.TimeoutError:
+                pass
+            except Exception as e:
+                logger.warning("❌ שגיאה בסריקת רשימת השירותים: %s", e, extra={"account": api.name})
+
+        missing = [s["service_id"] for s in services if s["service_id"] not in statuses]
+        return await self._fetch_individually(api, missing, statuses, deadline - loop.time(), limiter)
+
+    def _revalidate_in_background(self, services: List[Dict[str, Any]]):
+        """רענון ברקע לשירותים שהוצגו מתוך רשומה ישנה במטמון"""
+        services = [s for s in services if s["service_id"] not in self._revalidating]
+        if not services:
+            return
+        service_ids = {s["service_id"] for s in services}
+        self._revalidating |= service_ids
+
+        async def run():
+            try:
+                await self.refresh(services)
+            except Exception as e:
+                logger.exception("❌ שגיאה ברענון ברקע: %s", e)
+            finally:
+                self._revalidating -= service_ids
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def refresh_cached(self, services: List[Dict[str, Any]]) -> RefreshResult:
+        """
+        רענון דרך המטמון (stale-while-revalidate):
+        רשומה טרייה - מוצגת כמו שהיא; רשומה ישנה - מוצגת מיד ומתרעננת ברקע;
+        שירות שאין עליו רשומה - נשלף מ-Render עכשיו.
+        """
+        missing, stale = [], []
+        for service in services:
+            status, fresh = self.cache.get(service["service_id"])
+            if status is None:
+                missing.append(service)
+                continue
+            if not fresh:
+                # עותק עם הסטטוס שבמסד, כדי שהרענון ברקע ישווה מולו
+                # ולא ישנה את המסמכים שהמסך כבר משתמש בהם
+                stale.append(dict(service))
+            service["status"] = status
+
+        result = await self.refresh(missing)
+        result.services = services
+        if stale:
+            self._revalidate_in_background(stale)
+        return result
+
+    async def get_status(self, service_id: str, account: str = None) -> str:
+        """סטטוס של שירות בודד דרך המטמון"""
+        result = await self.refresh_cached([{"service_id": service_id, "account": account}])
+        return result.services[0].get("status", "unknown")
+
+
+# אובייקט גלובלי
+status_refresher = StatusRefresher()
@@ -0,0 +1,253 @@
+"""
+לוגים מובנים (JSON) שלא חוסמים את ה-event loop.
+
+כל הלוגים עוברים דרך QueueHandler לתור בזיכרון, ו-QueueListener ב-thread נפרד
+כותב אותם ל-stdout. לכל רשומה מצורפים שדות הקשר (update_id, user_id,
+service_id, זמן Render מצטבר בעדכון) מתוך contextvars, כך שאפשר לקשר שורות
+לוג לעדכון טלגרם אחד גם כשכמה עדכונים רצים במקביל.
+"""
+import atexit
+import contextlib
+import copy
+import datetime
+import functools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import config
+
+# שדות ההקשר שמצורפים לכל רשומה (אם הוגדרו)
+CONTEXT_FIELDS = ("update_id", "user_id", "service_id", "component")
+
+# שדות extra=... שמועתקים לפלט ה-JSON
+EXTRA_FIELDS = ("account", "endpoint", "status_code", "duration_ms", "error")
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_context: ContextVar[dict] = ContextVar("log_context", default={})
+
+
+class _Timings:
+    """זמן Render מצטבר לעדכון; משותף גם למשימות שנוצרו מתוכו (העתק רדוד של ה-context)"""
+    __slots__ = ("render_ms",)
+
+    def __init__(self):
+        self.render_ms = 0.0
+
+
+# ---- הקשר ----
+
+def bind(**fields):
+    """הוספת שדות הקשר לכל הלוגים מכאן והלאה (במשימה הנוכחית). מחזיר token ל-reset"""
+    return _context.set({**_context.get(), **fields})
+
+
+def reset(token):
+    _context.reset(token)
+
+
+@contextlib.contextmanager
+def log_context(**fields):
+    token = bind(**fields)
+    try:
+        yield
+    finally:
+        reset(token)
+
+
+def bind_update(update_id: Optional[int], user_id: Optional[int]):
+    """הקשר חדש לעדכון טלגרם (כולל מונה זמן Render)"""
+    return _context.set({"update_id": update_id, "user_id": user_id, "_timings": _Timings()})
+
+
+def add_render_time(seconds: float):
+    timings = _context.get().get("_timings")
+    if timings is not None:
+        timings.render_ms += seconds * 1000
+
+
+def track_render_time(func):
+    """
+    decorator לבקשה ל-Render: מוסיף את משך הבקשה לזמן המצטבר של העדכון,
+    ובכישלון שומר אותו על החריגה (duration_ms) כדי שיופיע בשורת הלוג.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            e.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            raise
+        finally:
+            add_render_time(time.perf_counter() - start)
+
+    return wrapper
+
+
+# ---- sampling ----
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """"status_poller=0.1,render_api=0.5" -> {"status_poller": 0.1, "render_api": 0.5}"""
+    rates = {}
+    for part in (spec or "").split(","):
+        name, sep, rate = part.partition("=")
+        if not sep:
+            continue
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    דגימה לפי מודול: מתוך כל 1/rate רשומות עוברת אחת (דטרמיניסטי, בלי random).
+    המפתח הוא ה-component שבהקשר (למשל כל מה שקורה בסבב של ה-poller) או שם ה-logger.
+    רשומות ברמת ERROR ומעלה תמיד עוברות.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._counters: Dict[str, int] = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rates or record.levelno >= logging.ERROR:
+            return True
+        key = _context.get().get("component")
+        if key not in self.rates:
+            key = record.name
+        rate = self.rates.get(key)
+        if rate is None or rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            self.dropped += 1
+            return False
+        count = self._counters.get(key, 0)
+        self._counters[key] = count + 1
+        if count % round(1 / rate):
+            self.dropped += 1
+            return False
+        record.sample_rate = rate
+        return True
+
+
+# ---- handler / formatters ----
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler שמצמיד את שדות ההקשר בזמן הקריאה (ב-thread של ה-event loop)
+    ושלא חוסם כשהתור מלא - עדיף לאבד שורת לוג מאשר לעכב עדכון.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+
+        context = _context.get()
+        for field in CONTEXT_FIELDS:
+            value = context.get(field)
+            # ערך שהועבר ב-extra=... גובר על ההקשר
+            if value is not None and getattr(record, field, None) is None:
+                setattr(record, field, value)
+        timings = context.get("_timings")
+        if timings is not None and timings.render_ms:
+            record.render_ms = round(timings.render_ms, 1)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + ("render_ms",) + EXTRA_FIELDS + ("sample_rate",):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """הפורמט הקלאסי + שדות ההקשר בסוף השורה (לפיתוח מקומי)"""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = [
+            f"{field}={getattr(record, field)}"
+            for field in CONTEXT_FIELDS + ("render_ms",) + EXTRA_FIELDS
+            if getattr(record, field, None) is not None
+        ]
+        return f"{text} [{' '.join(fields)}]" if fields else text
+
+
+# ---- התקנה ----
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(
+    level: str = None,
+    fmt: str = None,
+    sampling: str = None,
+    queue_size: int = None,
+) -> logging.handlers.QueueListener:
+    """
+    התקנת הצנרת על ה-root logger (פעם אחת). הכתיבה ל-stdout קורית ב-thread
+    של ה-QueueListener, והתור מתרוקן ביציאה מהתהליך.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size or config.LOG_QUEUE_SIZE)
+    handler = _ContextQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(parse_sampling(config.LOG_SAMPLING if sampling is None else sampling)))
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if (fmt or config.LOG_FORMAT) == "json" else TextFormatter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel((level or config.LOG_LEVEL).upper())
+    # httpx כותב שורת INFO לכל בקשה; משך הבקשות כבר נמדד ב-/metrics
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
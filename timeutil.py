@@ -0,0 +1,22 @@
+"""
+עזרי זמן משותפים: תאריכים מ-Render (ISO 8601) ומ-MongoDB
+"""
+import datetime
+from typing import Optional
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime.datetime]:
+    """"2024-01-01T10:00:00Z" -> datetime עם tzinfo, או None אם חסר/לא תקין"""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+
+
+def aware(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    """pymongo מחזיר datetime בלי tzinfo (UTC) - משלימים אותו כדי שאפשר יהיה להשוות"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
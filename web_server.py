@@ -0,0 +1,56 @@
+"""
+שרת aiohttp על ה-event loop של הבוט: webhook של טלגרם + health checks + מטריקות
+"""
+import hmac
+import logging
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from metrics import CONTENT_TYPE, registry
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PATHS = ("/", "/health", "/healthz", "/_health")
+
+METRICS_PATH = "/metrics"
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+async def _health(request: web.Request) -> web.Response:
+    # aiohttp עונה גם ל-HEAD על נתיבי GET (UptimeRobot ודומיו)
+    return web.Response(text="ok")
+
+
+async def _metrics(request: web.Request) -> web.Response:
+    return web.Response(body=registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+
+def _webhook_handler(application: Application, secret: str):
+    async def handle(request: web.Request) -> web.Response:
+        # טלגרם שולח את ה-secret שהוגדר ב-set_webhook בכל בקשה
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=403, text="forbidden")
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400, text="bad request")
+
+        update = Update.de_json(data, application.bot)
+        # ה-Application מעבד את העדכון ברקע; עונים מיד כדי שטלגרם לא ישלח שוב
+        await application.update_queue.put(update)
+        return web.Response(text="ok")
+
+    return handle
+
+
+def build_web_app(application: Application, webhook_path: str, secret: str = None) -> web.Application:
+    """בניית אפליקציית aiohttp עם נתיב ה-webhook, נתיבי ה-health ו-/metrics"""
+    app = web.Application()
+    for path in HEALTH_PATHS:
+        app.router.add_get(path, _health)
+    app.router.add_get(METRICS_PATH, _metrics)
+    app.router.add_post(webhook_path, _webhook_handler(application, secret))
+    return app